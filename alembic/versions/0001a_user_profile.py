@@ -0,0 +1,56 @@
+"""add user profile columns
+
+Revision ID: 0001a_user_profile
+Revises: 0001_initial
+Create Date: 2026-10-17 18:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001a_user_profile"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+# Колонки анкети раніше створював лише create_all; 0002 вже читає city і search_global.
+# Порожня таблиця (свіжа БД), тож NOT NULL без server_default.
+PROFILE_COLUMNS = (
+    sa.Column("name", sa.String(length=64), nullable=False),
+    sa.Column("age", sa.Integer(), nullable=False),
+    sa.Column("age_filter_enabled", sa.Boolean(), nullable=False),
+    sa.Column("gender", sa.String(length=1), nullable=False),
+    sa.Column("looking_for", sa.String(length=1), nullable=False),
+    sa.Column("city", sa.String(length=128), nullable=False),
+    sa.Column("about", sa.Text(), nullable=True),
+    sa.Column("search_global", sa.Boolean(), nullable=False),
+    sa.Column("active", sa.Boolean(), nullable=False),
+)
+
+
+def upgrade() -> None:
+    # БД, створена через create_all і позначена stamp-ом, уже має ці колонки.
+    existing = {col["name"] for col in sa.inspect(op.get_bind()).get_columns("users")}
+    missing = [col for col in PROFILE_COLUMNS if col.name not in existing]
+    if not missing:
+        return
+    with op.batch_alter_table("users") as batch:
+        for col in missing:
+            batch.add_column(col.copy())
+        batch.alter_column("tg_id", existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=False)
+        batch.create_check_constraint("ck_users_age", "age BETWEEN 16 AND 99")
+        batch.create_check_constraint("ck_users_gender", "gender IN ('M','F')")
+        batch.create_check_constraint("ck_users_looking_for", "looking_for IN ('M','F','A')")
+    op.create_index("ix_users_city", "users", ["city"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_city", table_name="users")
+    with op.batch_alter_table("users") as batch:
+        batch.drop_constraint("ck_users_looking_for", type_="check")
+        batch.drop_constraint("ck_users_gender", type_="check")
+        batch.drop_constraint("ck_users_age", type_="check")
+        batch.alter_column("tg_id", existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=False)
+        for col in reversed(PROFILE_COLUMNS):
+            batch.drop_column(col.name)
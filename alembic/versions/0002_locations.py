@@ -1,7 +1,7 @@
 """add location fields
 
 Revision ID: 0002_locations
-Revises: 0001_initial
+Revises: 0001a_user_profile
 Create Date: 2025-12-31 17:00:00.000000
 """
 
@@ -10,7 +10,7 @@ import sqlalchemy as sa
 
 
 revision = "0002_locations"
-down_revision = "0001_initial"
+down_revision = "0001a_user_profile"
 branch_labels = None
 depends_on = None
 
@@ -18,7 +18,8 @@ depends_on = None
 def upgrade() -> None:
     bind = op.get_bind()
     if bind.dialect.name == "postgresql":
-        op.drop_constraint("ck_users_search_scope", "users", type_="check")
+        # На свіжій БД обмеження ще немає (раніше його створював лише create_all).
+        op.execute("ALTER TABLE users DROP CONSTRAINT IF EXISTS ck_users_search_scope")
         op.create_check_constraint(
             "ck_users_search_scope",
             "users",
@@ -0,0 +1,33 @@
+"""add fsm_states table
+
+Revision ID: 0007_fsm_states
+Revises: 0006_app_meta
+Create Date: 2026-10-17 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_fsm_states"
+down_revision = "0006_app_meta"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "fsm_states",
+        sa.Column("key", sa.String(length=255), nullable=False),
+        sa.Column("state", sa.String(length=255), nullable=True),
+        sa.Column("data", sa.Text(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index("ix_fsm_states_expires_at", "fsm_states", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_fsm_states_expires_at", table_name="fsm_states")
+    op.drop_table("fsm_states")
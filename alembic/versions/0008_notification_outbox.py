@@ -0,0 +1,46 @@
+"""add notification_outbox table
+
+Revision ID: 0008_notification_outbox
+Revises: 0007_fsm_states
+Create Date: 2026-10-17 15:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008_notification_outbox"
+down_revision = "0007_fsm_states"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "notification_outbox",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("kind", sa.String(length=16), nullable=False),
+        sa.Column("recipient_user_id", sa.Integer(), nullable=False),
+        sa.Column("subject_user_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP")),
+        sa.ForeignKeyConstraint(["recipient_user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["subject_user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_notification_outbox_status_next", "notification_outbox", ["status", "next_attempt_at"]
+    )
+    op.create_index(
+        "ix_notification_outbox_recipient", "notification_outbox", ["recipient_user_id", "status", "id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notification_outbox_recipient", table_name="notification_outbox")
+    op.drop_index("ix_notification_outbox_status_next", table_name="notification_outbox")
+    op.drop_table("notification_outbox")
@@ -0,0 +1,143 @@
+"""add photos, likes, matches, action_logs and complaints tables
+
+Also makes server-default timestamps NOT NULL, as in the models.
+
+Revision ID: 0009_core_tables
+Revises: 0008_notification_outbox
+Create Date: 2026-10-17 18:30:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_core_tables"
+down_revision = "0008_notification_outbox"
+branch_labels = None
+depends_on = None
+
+# Колонки з server_default, які в моделях NOT NULL, а попередні ревізії створили nullable.
+NOT_NULL_TIMESTAMPS = {
+    "users": ("created_at",),
+    "messages": ("created_at",),
+    "admin_actions": ("created_at",),
+    "app_meta": ("updated_at",),
+    "fsm_states": ("updated_at",),
+    "notification_outbox": ("next_attempt_at", "created_at"),
+}
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # Ці таблиці раніше створював лише create_all: на такій БД пропускаємо наявні.
+    existing = set(inspector.get_table_names())
+
+    for table, columns in NOT_NULL_TIMESTAMPS.items():
+        nullable = [c["name"] for c in inspector.get_columns(table) if c["name"] in columns and c["nullable"]]
+        if not nullable:
+            continue
+        with op.batch_alter_table(table) as batch:
+            for name in nullable:
+                batch.alter_column(name, existing_type=sa.DateTime(timezone=True), nullable=False)
+
+    if "photos" not in existing:
+        op.create_table(
+            "photos",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("file_id", sa.String(length=256), nullable=False),
+            sa.Column("is_main", sa.Boolean(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_photos_user_id"), "photos", ["user_id"], unique=False)
+        op.create_index("ix_photos_user_main", "photos", ["user_id", "is_main"], unique=False)
+
+    if "likes" not in existing:
+        op.create_table(
+            "likes",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("from_user_id", sa.Integer(), nullable=False),
+            sa.Column("to_user_id", sa.Integer(), nullable=False),
+            sa.Column("is_like", sa.Boolean(), nullable=False),
+            sa.Column(
+                "created_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False
+            ),
+            sa.ForeignKeyConstraint(["from_user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["to_user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("from_user_id", "to_user_id", name="uq_likes_from_to"),
+        )
+        op.create_index(op.f("ix_likes_from_user_id"), "likes", ["from_user_id"], unique=False)
+        op.create_index(op.f("ix_likes_to_user_id"), "likes", ["to_user_id"], unique=False)
+        op.create_index("ix_likes_pair", "likes", ["from_user_id", "to_user_id"], unique=False)
+
+    if "matches" not in existing:
+        op.create_table(
+            "matches",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("user1_id", sa.Integer(), nullable=False),
+            sa.Column("user2_id", sa.Integer(), nullable=False),
+            sa.Column(
+                "created_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False
+            ),
+            sa.ForeignKeyConstraint(["user1_id"], ["users.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["user2_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("user1_id", "user2_id", name="uq_matches_pair"),
+        )
+        op.create_index(op.f("ix_matches_user1_id"), "matches", ["user1_id"], unique=False)
+        op.create_index(op.f("ix_matches_user2_id"), "matches", ["user2_id"], unique=False)
+        op.create_index("ix_matches_user1", "matches", ["user1_id"], unique=False)
+        op.create_index("ix_matches_user2", "matches", ["user2_id"], unique=False)
+
+    if "action_logs" not in existing:
+        op.create_table(
+            "action_logs",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("action", sa.String(length=32), nullable=False),
+            sa.Column(
+                "created_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False
+            ),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_action_logs_user_id"), "action_logs", ["user_id"], unique=False)
+        op.create_index(op.f("ix_action_logs_action"), "action_logs", ["action"], unique=False)
+        op.create_index(
+            "ix_action_logs_user_action_time", "action_logs", ["user_id", "action", "created_at"], unique=False
+        )
+
+    if "complaints" not in existing:
+        op.create_table(
+            "complaints",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("reporter_user_id", sa.Integer(), nullable=False),
+            sa.Column("target_user_id", sa.Integer(), nullable=False),
+            sa.Column("reason", sa.Text(), nullable=False),
+            sa.Column(
+                "created_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False
+            ),
+            sa.ForeignKeyConstraint(["reporter_user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["target_user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("reporter_user_id", "target_user_id", name="uq_complaints_reporter_target"),
+        )
+        op.create_index(op.f("ix_complaints_reporter_user_id"), "complaints", ["reporter_user_id"], unique=False)
+        op.create_index(op.f("ix_complaints_target_user_id"), "complaints", ["target_user_id"], unique=False)
+        op.create_index(
+            "ix_complaints_target_created", "complaints", ["target_user_id", "created_at"], unique=False
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("complaints")
+    op.drop_table("action_logs")
+    op.drop_table("matches")
+    op.drop_table("likes")
+    op.drop_table("photos")
+    for table, columns in NOT_NULL_TIMESTAMPS.items():
+        with op.batch_alter_table(table) as batch:
+            for name in columns:
+                batch.alter_column(name, existing_type=sa.DateTime(timezone=True), nullable=True)
@@ -18,12 +18,35 @@ depends_on = None
 
 
 def upgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    # Раніше таблицю створював create_all: на такій БД нічого не робимо.
+    if sa.inspect(op.get_bind()).has_table("feedback"):
+        return
+    op.create_table(
+        "feedback",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tg_id", sa.BigInteger(), nullable=False),
+        sa.Column("username", sa.String(length=64), nullable=True),
+        sa.Column("category", sa.String(length=24), nullable=False),
+        sa.Column("status", sa.String(length=24), nullable=False),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), server_default=sa.text("CURRENT_TIMESTAMP"), nullable=False
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_feedback_user_id"), "feedback", ["user_id"], unique=False)
+    op.create_index(op.f("ix_feedback_tg_id"), "feedback", ["tg_id"], unique=False)
+    op.create_index(op.f("ix_feedback_username"), "feedback", ["username"], unique=False)
+    op.create_index("ix_feedback_user_status", "feedback", ["user_id", "status", "created_at"], unique=False)
+    op.create_index("ix_feedback_status_created", "feedback", ["status", "created_at"], unique=False)
 
 
 def downgrade():
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    op.drop_index("ix_feedback_status_created", table_name="feedback")
+    op.drop_index("ix_feedback_user_status", table_name="feedback")
+    op.drop_index(op.f("ix_feedback_username"), table_name="feedback")
+    op.drop_index(op.f("ix_feedback_tg_id"), table_name="feedback")
+    op.drop_index(op.f("ix_feedback_user_id"), table_name="feedback")
+    op.drop_table("feedback")
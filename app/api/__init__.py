@@ -1,23 +1,27 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from pathlib import Path
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.api import admin
-from app.config import Settings, STATIC_DIR
-from app.db import create_engine, create_sessionmaker
-from db import init_db
+from app.config import DATA_DIR, Settings, STATIC_DIR
+from app.db import acquire_db, release_db
+from app.photo_cache import PhotoCache
+from app.telegram import TelegramClient
+from app.thumbnails import Thumbnailer
+from app.webhook import install_webhook_route
+from services import metrics, send_scheduler
+from services.location_repo import preload_location_tree
 
 
 def create_api(settings: Settings) -> FastAPI:
-    engine = create_engine(settings.database_url)
-    sessionmaker = create_sessionmaker(engine)
-
     app = FastAPI(title="Адмін панель")
     app.state.settings = settings
-    app.state.engine = engine
-    app.state.sessionmaker = sessionmaker
+    # Сповіщення адмінки йдуть через той самий ліміт відправок, що й у бота.
+    send_scheduler.configure(rate=settings.tg_send_rate, chat_interval=settings.tg_send_chat_interval)
 
     STATIC_DIR.mkdir(parents=True, exist_ok=True)
     app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
@@ -27,12 +31,37 @@ def create_api(settings: Settings) -> FastAPI:
     async def health() -> JSONResponse:
         return JSONResponse({"status": "ok"})
 
+    @app.get("/metrics", include_in_schema=False, dependencies=[Depends(admin.require_metrics_access)])
+    async def prometheus_metrics() -> PlainTextResponse:
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    if settings.bot_mode == "webhook":
+        install_webhook_route(app, settings)
+
     @app.on_event("startup")
     async def _init_db() -> None:
-        await init_db(engine)
+        # Під run.py той самий engine, що й у бота (див. app.db.acquire_db).
+        engine, sessionmaker = await acquire_db("admin", settings)
+        app.state.engine = engine
+        app.state.sessionmaker = sessionmaker
+        app.state.telegram = TelegramClient(
+            settings.bot_token,
+            drain_timeout=settings.admin_notify_drain_seconds,
+            max_drain_timeout=settings.admin_notify_drain_max_seconds,
+        )
+        app.state.photo_cache = PhotoCache(
+            Path(settings.photo_cache_dir) if settings.photo_cache_dir else DATA_DIR / "photo_cache",
+            max_bytes=settings.photo_cache_max_mb * 1024 * 1024,
+        )
+        await app.state.photo_cache.load()
+        app.state.thumbnailer = Thumbnailer(settings.thumb_workers)
+        await preload_location_tree(sessionmaker)
 
     @app.on_event("shutdown")
     async def _shutdown_db() -> None:
-        await engine.dispose()
+        # Спершу дочікуємо фонові сповіщення, потім закриваємо HTTP-сесію і БД.
+        await app.state.telegram.close()
+        await app.state.thumbnailer.close()
+        await release_db(app.state.engine)
 
     return app
@@ -1,16 +1,13 @@
 from __future__ import annotations
 
-import asyncio
+import hmac
 import logging
 from datetime import datetime
 from pathlib import Path
 from typing import AsyncIterator, Optional
 
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
 from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import and_, func, or_, select, update
@@ -20,8 +17,19 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from app.auth import create_session_token, read_session_token, verify_credentials
 from app.config import Settings, TEMPLATES_DIR
 from app.db import session_scope
-from app.models import AdminAction, Complaint, Feedback, Message, Photo, UaLocation, User
-from services.location_repo import DISTRICT_CATEGORIES, HROMADA_CATEGORIES, SETTLEMENT_CATEGORIES
+from app.photo_cache import (
+    CACHE_CONTROL as PHOTO_CACHE_CONTROL,
+    CachedFileResponse,
+    PhotoCache,
+    etag_matches,
+    photo_etag,
+)
+from app.telegram import TelegramClient
+from app.thumbnails import THUMB_SIZES, Thumbnailer, pick_format
+from app.models import AdminAction, Complaint, Feedback, Message, Photo, User
+from services import ban_cache
+from services.location_repo import SETTLEMENT_CATEGORIES, get_location_tree
+from services.location_search import search_index
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
@@ -30,33 +38,22 @@ logger = logging.getLogger(__name__)
 FEEDBACK_STATUSES = ("new", "in_progress", "done")
 FEEDBACK_CATEGORIES = ("general", "issue", "idea", "other")
 
+BAN_TEXT = "Ваш акаунт заблоковано адміністратором. Доступ до бота закрито."
+UNBAN_TEXT = "Ваш акаунт розблоковано. Доступ до бота відновлено."
+
 
 async def _get_region_code(session: AsyncSession, name: str | None) -> str | None:
     if not name:
         return None
-    region_name = name.strip().lower()
-    res = await session.execute(
-        select(UaLocation.level1)
-        .where(UaLocation.category == "O", func.lower(func.trim(UaLocation.name)) == region_name)
-        .limit(1)
-    )
-    return res.scalar_one_or_none()
+    tree = await get_location_tree(session)
+    return tree.find_region_code(name) or _folded_code(tree, ("regions",), name)
 
 
 async def _get_district_code(session: AsyncSession, region_code: str | None, name: str | None) -> str | None:
     if not region_code or not name:
         return None
-    district_name = name.strip().lower()
-    res = await session.execute(
-        select(UaLocation.level2)
-        .where(
-            UaLocation.level1 == region_code,
-            UaLocation.category.in_(DISTRICT_CATEGORIES),
-            func.lower(func.trim(UaLocation.name)) == district_name,
-        )
-        .limit(1)
-    )
-    return res.scalar_one_or_none()
+    tree = await get_location_tree(session)
+    return tree.find_district_code(region_code, name) or _folded_code(tree, ("districts", region_code), name)
 
 
 async def _get_hromada_code(
@@ -64,28 +61,33 @@ async def _get_hromada_code(
 ) -> str | None:
     if not region_code or not district_code or not name:
         return None
-    hromada_name = name.strip().lower()
-    res = await session.execute(
-        select(UaLocation.level3)
-        .where(
-            UaLocation.level1 == region_code,
-            UaLocation.level2 == district_code,
-            UaLocation.category.in_(HROMADA_CATEGORIES),
-            func.lower(func.trim(UaLocation.name)) == hromada_name,
-        )
-        .limit(1)
+    tree = await get_location_tree(session)
+    return tree.find_hromada_code(region_code, district_code, name) or _folded_code(
+        tree, ("hromadas", region_code, district_code), name
     )
-    return res.scalar_one_or_none()
 
 
-async def notify_user(bot_token: str, tg_id: int, text: str) -> None:
-    bot = Bot(token=bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    try:
-        await bot.send_message(tg_id, text)
-    except Exception:
-        logger.exception("Failed to notify user tg_id=%s", tg_id)
-    finally:
-        await bot.session.close()
+def _folded_code(tree, scope: tuple, name: str) -> str | None:
+    """Другий шанс для назв з URL/фільтрів: Одесская / Odeska -> Одеська."""
+    item = search_index(tree, scope).exact(name)
+    return item.code if item else None
+
+
+def _matching(tree, scope: tuple, items, q: str | None, limit: int = 10):
+    """Для автодоповнення: з q — top-k за назвою, без q — увесь список."""
+    if not q:
+        return items
+    return search_index(tree, scope).search(q, limit=limit)
+
+
+def _distinct_names(items) -> list[str]:
+    names: list[str] = []
+    seen: set[str] = set()
+    for item in items:
+        if item.name and item.name not in seen:
+            seen.add(item.name)
+            names.append(item.name)
+    return names
 
 
 def get_sessionmaker(request: Request) -> async_sessionmaker[AsyncSession]:
@@ -96,15 +98,16 @@ def get_settings_dep(request: Request) -> Settings:
     return request.app.state.settings
 
 
-def _guess_media_type(file_path: str) -> str:
-    ext = Path(file_path).suffix.lower()
-    if ext in {".png"}:
-        return "image/png"
-    if ext in {".webp"}:
-        return "image/webp"
-    if ext in {".gif"}:
-        return "image/gif"
-    return "image/jpeg"
+def get_telegram(request: Request) -> TelegramClient:
+    return request.app.state.telegram
+
+
+def get_photo_cache(request: Request) -> PhotoCache:
+    return request.app.state.photo_cache
+
+
+def get_thumbnailer(request: Request) -> Thumbnailer:
+    return request.app.state.thumbnailer
 
 
 async def get_session(request: Request) -> AsyncIterator[AsyncSession]:
@@ -125,6 +128,21 @@ async def require_admin(
     return session.username
 
 
+async def require_metrics_access(
+    request: Request, settings: Settings = Depends(get_settings_dep)
+) -> None:
+    """/metrics: Bearer METRICS_TOKEN (для Prometheus) або сесія адміна."""
+    auth = request.headers.get("authorization", "")
+    if settings.metrics_token and auth.startswith("Bearer "):
+        given = auth[len("Bearer "):].strip().encode("utf-8")
+        if hmac.compare_digest(given, settings.metrics_token.encode("utf-8")):
+            return
+    token = request.cookies.get("admin_session")
+    if token and read_session_token(token, settings):
+        return
+    raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+
+
 @router.get("/admin/login", response_class=HTMLResponse)
 async def login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request, "error": None})
@@ -281,24 +299,18 @@ async def users_list(
 @router.get("/admin/filters/regions")
 async def filter_regions(
     admin_username: str = Depends(require_admin),
+    q: Optional[str] = Query(default=None),
     session: AsyncSession = Depends(get_session),
 ) -> JSONResponse:
-    region_expr = func.trim(UaLocation.name)
-    rows = (
-        await session.execute(
-            select(region_expr)
-            .where(UaLocation.category == "O")
-            .distinct()
-            .order_by(region_expr)
-        )
-    ).scalars()
-    return JSONResponse({"items": [r for r in rows if r]})
+    tree = await get_location_tree(session)
+    return JSONResponse({"items": _distinct_names(_matching(tree, ("regions",), tree.regions(), q))})
 
 
 @router.get("/admin/filters/districts")
 async def filter_districts(
     admin_username: str = Depends(require_admin),
     region: Optional[str] = Query(default=None),
+    q: Optional[str] = Query(default=None),
     session: AsyncSession = Depends(get_session),
 ) -> JSONResponse:
     if not region:
@@ -306,19 +318,9 @@ async def filter_districts(
     region_code = await _get_region_code(session, region)
     if not region_code:
         return JSONResponse({"items": []})
-    district_expr = func.trim(UaLocation.name)
-    rows = (
-        await session.execute(
-            select(district_expr)
-            .where(
-                UaLocation.level1 == region_code,
-                UaLocation.category.in_(DISTRICT_CATEGORIES),
-            )
-            .distinct()
-            .order_by(district_expr)
-        )
-    ).scalars()
-    return JSONResponse({"items": [r for r in rows if r]})
+    tree = await get_location_tree(session)
+    items = _matching(tree, ("districts", region_code), tree.districts(region_code), q)
+    return JSONResponse({"items": _distinct_names(items)})
 
 
 @router.get("/admin/filters/settlements")
@@ -327,6 +329,7 @@ async def filter_settlements(
     region: Optional[str] = Query(default=None),
     district: Optional[str] = Query(default=None),
     hromada: Optional[str] = Query(default=None),
+    q: Optional[str] = Query(default=None),
     session: AsyncSession = Depends(get_session),
 ) -> JSONResponse:
     if not region or not district:
@@ -336,21 +339,10 @@ async def filter_settlements(
     hromada_code = await _get_hromada_code(session, region_code, district_code, hromada) if hromada else None
     if not region_code or not district_code:
         return JSONResponse({"items": []})
-    settlement_expr = func.trim(UaLocation.name)
-    rows = (
-        await session.execute(
-            select(settlement_expr)
-            .where(
-                UaLocation.level1 == region_code,
-                UaLocation.level2 == district_code,
-                (UaLocation.level3 == hromada_code if hromada_code else True),
-                UaLocation.category.in_(SETTLEMENT_CATEGORIES),
-            )
-            .distinct()
-            .order_by(settlement_expr)
-        )
-    ).scalars()
-    return JSONResponse({"items": [r for r in rows if r]})
+    tree = await get_location_tree(session)
+    items = tree.settlements(region_code, district_code, hromada_code, categories=SETTLEMENT_CATEGORIES)
+    items = _matching(tree, ("settlements", region_code, district_code, hromada_code), items, q)
+    return JSONResponse({"items": _distinct_names(items)})
 
 
 @router.get("/admin/filters/hromadas")
@@ -358,6 +350,7 @@ async def filter_hromadas(
     admin_username: str = Depends(require_admin),
     region: Optional[str] = Query(default=None),
     district: Optional[str] = Query(default=None),
+    q: Optional[str] = Query(default=None),
     session: AsyncSession = Depends(get_session),
 ) -> JSONResponse:
     if not region or not district:
@@ -366,22 +359,9 @@ async def filter_hromadas(
     district_code = await _get_district_code(session, region_code, district)
     if not region_code or not district_code:
         return JSONResponse({"items": []})
-    hromada_expr = func.trim(UaLocation.name)
-    rows = (
-        await session.execute(
-            select(hromada_expr)
-            .where(
-                UaLocation.level1 == region_code,
-                UaLocation.level2 == district_code,
-                UaLocation.category.in_(HROMADA_CATEGORIES),
-                UaLocation.name.isnot(None),
-                UaLocation.name != "",
-            )
-            .distinct()
-            .order_by(hromada_expr)
-        )
-    ).scalars()
-    return JSONResponse({"items": [r for r in rows if r]})
+    tree = await get_location_tree(session)
+    items = _matching(tree, ("hromadas", region_code, district_code), tree.hromadas(region_code, district_code), q)
+    return JSONResponse({"items": _distinct_names(items)})
 
 
 @router.get("/admin/profiles", response_class=HTMLResponse)
@@ -473,10 +453,17 @@ async def profiles_list(
 @router.get("/admin/photos/{photo_id}")
 async def profile_photo(
     photo_id: int,
+    request: Request,
     admin_username: str = Depends(require_admin),
-    settings: Settings = Depends(get_settings_dep),
+    telegram: TelegramClient = Depends(get_telegram),
+    cache: PhotoCache = Depends(get_photo_cache),
+    thumbnailer: Thumbnailer = Depends(get_thumbnailer),
+    size: Optional[int] = Query(default=None),
     session: AsyncSession = Depends(get_session),
 ):
+    """Фото анкети; ?size=N — прев'ю N px (WebP, якщо браузер приймає, інакше JPEG)."""
+    if size is not None and size not in THUMB_SIZES:
+        raise HTTPException(status_code=400, detail=f"size: one of {', '.join(map(str, THUMB_SIZES))}")
     photo = await session.get(Photo, photo_id)
     if not photo:
         raise HTTPException(status_code=404, detail="Фото не знайдено")
@@ -485,27 +472,46 @@ async def profile_photo(
     if file_id.startswith(("http://", "https://")):
         return RedirectResponse(url=file_id)
 
-    bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    async def fetch(destination: Path) -> str:
+        telegram_file = await telegram.bot.get_file(file_id)
+        await telegram.bot.download_file(telegram_file.file_path, destination=destination)
+        return Path(telegram_file.file_path or "").suffix
+
+    cache_id, fetcher = file_id, fetch
+    headers = {"Cache-Control": PHOTO_CACHE_CONTROL}
+    if size is not None:
+        fmt = pick_format(request.headers.get("accept"))
+
+        async def fetch_thumb(destination: Path) -> str:
+            # Оригінал закріплений на час рендеру, щоб паралельне витіснення його не видалило.
+            original = await cache.acquire(file_id, fetch)
+            try:
+                return await thumbnailer.render(original.path, destination, size, fmt)
+            finally:
+                cache.release(original)
+
+        cache_id, fetcher = f"{file_id}#thumb{size}.{fmt}", fetch_thumb
+        headers["Vary"] = "Accept"
+
+    # ETag залежить лише від file_id (і розміру): повторний перегляд — 304 без диска і Telegram.
+    headers["ETag"] = photo_etag(cache_id)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
     try:
-        telegram_file = await bot.get_file(file_id)
-        buffer = await bot.download_file(telegram_file.file_path)
-        if buffer is None:
-            raise HTTPException(status_code=500, detail="Не вдалося завантажити фото")
-        buffer.seek(0)
-        media_type = _guess_media_type(telegram_file.file_path)
-        return StreamingResponse(buffer, media_type=media_type)
+        cached = await cache.acquire(cache_id, fetcher)
     except Exception:
         logger.exception("Failed to fetch photo id=%s", photo_id)
         raise HTTPException(status_code=500, detail="Не вдалося завантажити фото")
-    finally:
-        await bot.session.close()
+    # Файл закріплений, доки відповідь не віддана.
+    return CachedFileResponse(cache, cached, headers=headers)
 
 
 @router.post("/admin/users/{user_id}/ban")
 async def ban_user(
     user_id: int,
     admin_username: str = Depends(require_admin),
-    settings: Settings = Depends(get_settings_dep),
+    telegram: TelegramClient = Depends(get_telegram),
     page: int = Query(default=1, ge=1),
     q: Optional[str] = Query(default=None),
     sort: Optional[str] = Query(default=None),
@@ -518,6 +524,7 @@ async def ban_user(
 ):
     tg_id = (await session.execute(select(User.tg_id).where(User.id == user_id))).scalar_one_or_none()
     await session.execute(update(User).where(User.id == user_id).values(is_banned=True))
+    await ban_cache.bump_version(session)
     session.add(
         AdminAction(
             admin_username=admin_username,
@@ -528,19 +535,14 @@ async def ban_user(
         )
     )
     await session.commit()
+    await ban_cache.publish(tg_id, True)
     redirect_url = (
         f"/admin/users?page={page}&q={q or ''}&sort={sort or ''}&order={order or ''}"
         f"&region={region or ''}&district={district or ''}&settlement={settlement or ''}"
         f"&search_scope={search_scope or ''}"
     )
     if tg_id:
-        asyncio.create_task(
-            notify_user(
-                settings.bot_token,
-                tg_id,
-                "Ваш акаунт заблоковано адміністратором. Доступ до бота закрито.",
-            )
-        )
+        telegram.notify_later(tg_id, BAN_TEXT)
     return RedirectResponse(url=redirect_url, status_code=303)
 
 
@@ -548,7 +550,7 @@ async def ban_user(
 async def unban_user(
     user_id: int,
     admin_username: str = Depends(require_admin),
-    settings: Settings = Depends(get_settings_dep),
+    telegram: TelegramClient = Depends(get_telegram),
     page: int = Query(default=1, ge=1),
     q: Optional[str] = Query(default=None),
     sort: Optional[str] = Query(default=None),
@@ -561,6 +563,7 @@ async def unban_user(
 ):
     tg_id = (await session.execute(select(User.tg_id).where(User.id == user_id))).scalar_one_or_none()
     await session.execute(update(User).where(User.id == user_id).values(is_banned=False))
+    await ban_cache.bump_version(session)
     session.add(
         AdminAction(
             admin_username=admin_username,
@@ -571,19 +574,71 @@ async def unban_user(
         )
     )
     await session.commit()
+    await ban_cache.publish(tg_id, False)
     redirect_url = (
         f"/admin/users?page={page}&q={q or ''}&sort={sort or ''}&order={order or ''}"
         f"&region={region or ''}&district={district or ''}&settlement={settlement or ''}"
         f"&search_scope={search_scope or ''}"
     )
     if tg_id:
-        asyncio.create_task(
-            notify_user(
-                settings.bot_token,
-                tg_id,
-                "Ваш акаунт розблоковано. Доступ до бота відновлено.",
-            )
+        telegram.notify_later(tg_id, UNBAN_TEXT)
+    return RedirectResponse(url=redirect_url, status_code=303)
+
+
+@router.post("/admin/users/bulk")
+async def bulk_ban_users(
+    admin_username: str = Depends(require_admin),
+    telegram: TelegramClient = Depends(get_telegram),
+    action: str = Form(...),
+    user_ids: list[int] = Form(default=[]),
+    page: int = Query(default=1, ge=1),
+    q: Optional[str] = Query(default=None),
+    sort: Optional[str] = Query(default=None),
+    order: Optional[str] = Query(default=None),
+    region: Optional[str] = Query(default=None),
+    district: Optional[str] = Query(default=None),
+    settlement: Optional[str] = Query(default=None),
+    search_scope: Optional[str] = Query(default=None),
+    session: AsyncSession = Depends(get_session),
+):
+    """Масовий бан/розбан відмічених користувачів; сповіщення — однією фоновою розсилкою."""
+    if action not in ("ban", "unban"):
+        raise HTTPException(status_code=400, detail="Невідома дія")
+    banned = action == "ban"
+    redirect_url = (
+        f"/admin/users?page={page}&q={q or ''}&sort={sort or ''}&order={order or ''}"
+        f"&region={region or ''}&district={district or ''}&settlement={settlement or ''}"
+        f"&search_scope={search_scope or ''}"
+    )
+    ids = list(dict.fromkeys(user_ids))
+    if not ids:
+        return RedirectResponse(url=redirect_url, status_code=303)
+
+    res = await session.execute(
+        update(User)
+        .where(User.id.in_(ids), User.is_banned == (not banned))
+        .values(is_banned=banned)
+        .returning(User.id, User.tg_id)
+    )
+    changed = res.all()
+    if changed:
+        await ban_cache.bump_version(session)
+    session.add_all(
+        AdminAction(
+            admin_username=admin_username,
+            action=action,
+            target_type="user",
+            target_id=user_id,
+            payload_json=None,
         )
+        for user_id, _ in changed
+    )
+    await session.commit()
+    tg_ids = [tg_id for _, tg_id in changed if tg_id]
+    for tg_id in tg_ids:
+        await ban_cache.publish(tg_id, banned)
+    if tg_ids:
+        telegram.notify_many_later(tg_ids, BAN_TEXT if banned else UNBAN_TEXT)
     return RedirectResponse(url=redirect_url, status_code=303)
 
 
@@ -6,10 +6,11 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
+from app import webhook
 from app.config import Settings
-from db import BanCheckMiddleware, DbSessionMiddleware, create_engine, create_sessionmaker, init_db
+from app.db import acquire_db, release_db
+from db import ActivityMiddleware, DbSessionMiddleware
 from handlers.admin import router as admin_router
 from handlers.browse import router as browse_router
 from handlers.common import router as common_router
@@ -19,19 +20,38 @@ from handlers.onboarding import router as onboarding_router
 from handlers.profile import router as profile_router
 from handlers.feedback import router as feedback_router
 from handlers.settings import router as settings_router
+from services import antiflood, ban_cache, moderation, notification_outbox, send_scheduler
+from services.activity import ActivityTracker
+from services.candidate_queue import CandidateQueue
 from services.daily_reset import daily_reset_loop
+from services.fsm_storage import CoalescingStorage, FsmFlushMiddleware, build_storage, fsm_expiry_loop
+from services.log_retention import action_log_retention_loop
+from services.location_repo import preload_location_tree
+from services.metrics import UpdateMetricsMiddleware
 
 logger = logging.getLogger(__name__)
 
 
-def _build_dispatcher(sessionmaker):
-    dp = Dispatcher(storage=MemoryStorage())
+def _new_dispatcher(sessionmaker, storage: CoalescingStorage, activity: ActivityTracker) -> Dispatcher:
+    """Dispatcher з усіма middleware бота, але без роутерів."""
+    # FSM-middleware aiogram реєструє в __init__ раніше за наші outer-middleware,
+    # і воно читає стан на кожен апдейт. Вимикаємо його і ставимо своє після бан-фільтра.
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    dp.fsm = FsmFlushMiddleware(storage)
+    # Метрики зовні, щоб у запити апдейта потрапили і читання, і flush FSM.
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(ban_cache.BannedUserDropMiddleware())
+    dp.update.outer_middleware(dp.fsm)
     dp.update.middleware(DbSessionMiddleware(sessionmaker))
-    ban_mw = BanCheckMiddleware(sessionmaker)
-    dp.update.middleware(ban_mw)
-    dp.message.middleware(ban_mw)
-    dp.callback_query.middleware(ban_mw)
+    # Лише на message/callback_query: тут є from_user.
+    activity_mw = ActivityMiddleware(activity)
+    dp.message.middleware(activity_mw)
+    dp.callback_query.middleware(activity_mw)
+    return dp
+
 
+def _build_dispatcher(sessionmaker, storage: CoalescingStorage, activity: ActivityTracker) -> Dispatcher:
+    dp = _new_dispatcher(sessionmaker, storage, activity)
     dp.include_router(common_router)
     dp.include_router(onboarding_router)
     dp.include_router(profile_router)
@@ -44,16 +64,69 @@ def _build_dispatcher(sessionmaker):
     return dp
 
 
+async def _run_webhook(bot: Bot, dp: Dispatcher, settings: Settings, **kwargs) -> None:
+    """Апдейти приходять у маршрут app.webhook (FastAPI з run.py) і обробляються пулом."""
+    if not settings.webhook_url:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL")
+    webhook.require_webhook_secret(settings)
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data, **kwargs}
+    pool = webhook.UpdateWorkerPool(
+        dp,
+        bot,
+        workers=settings.webhook_workers,
+        queue_size=settings.webhook_queue_size,
+        **workflow_data,
+    )
+    await dp.emit_startup(bot=bot, **workflow_data)
+    pool.start()
+    webhook.set_pool(pool)
+    try:
+        await bot.set_webhook(
+            settings.webhook_url.rstrip("/") + settings.webhook_path,
+            secret_token=settings.webhook_secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=max(1, min(100, settings.webhook_workers * 5)),
+        )
+        logger.info("Webhook set: %s%s", settings.webhook_url.rstrip("/"), settings.webhook_path)
+        await asyncio.Event().wait()
+    finally:
+        webhook.set_pool(None)
+        await pool.close()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+
+
 async def start_bot(settings: Settings) -> None:
-    engine = create_engine(settings.database_url)
-    sessionmaker = create_sessionmaker(engine)
-    await init_db(engine)
+    engine, sessionmaker = await acquire_db("bot", settings)
+    await preload_location_tree(sessionmaker)
+    await ban_cache.load(sessionmaker)
 
     bot = Bot(
         token=settings.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    dp = _build_dispatcher(sessionmaker)
+    fsm_storage = CoalescingStorage(
+        build_storage(
+            settings.fsm_storage,
+            sessionmaker=sessionmaker,
+            redis_url=settings.redis_url,
+            ttl_seconds=settings.fsm_ttl_hours * 3600,
+        )
+    )
+    activity = ActivityTracker(
+        sessionmaker,
+        interval_seconds=settings.activity_flush_seconds,
+        batch_size=settings.activity_batch_size,
+    )
+    dp = _build_dispatcher(sessionmaker, fsm_storage, activity)
+    antiflood.configure(
+        antiflood.build_backend(settings.rate_limit_backend, settings.redis_url),
+        audit_sessionmaker=sessionmaker if settings.action_log_audit else None,
+    )
+    candidate_queue = CandidateQueue(
+        sessionmaker,
+        batch_size=settings.candidate_batch_size,
+        low_watermark=settings.candidate_refill_at,
+    )
 
     reset_task = None
     if settings.reset_enabled:
@@ -67,12 +140,60 @@ async def start_bot(settings: Settings) -> None:
             )
         )
 
-    logger.info("bot started")
+    purge_task = None
+    if settings.action_log_purge_enabled:
+        purge_task = asyncio.create_task(
+            action_log_retention_loop(
+                sessionmaker,
+                interval_seconds=settings.action_log_purge_interval_min * 60,
+                retention_days=settings.action_log_retention_days,
+                chunk_size=settings.action_log_purge_chunk,
+            )
+        )
+
+    send_scheduler.configure(rate=settings.tg_send_rate, chat_interval=settings.tg_send_chat_interval)
+    outbox = notification_outbox.OutboxDispatcher(
+        sessionmaker,
+        bot,
+        concurrency=settings.outbox_concurrency,
+        batch_size=settings.outbox_batch_size,
+        poll_seconds=settings.outbox_poll_seconds,
+        max_attempts=settings.outbox_max_attempts,
+    )
+    notification_outbox.set_dispatcher(outbox)
+    moderation.configure(
+        workers=settings.nsfw_workers,
+        intra_op_threads=settings.nsfw_intra_op_threads,
+        max_batch=settings.nsfw_batch_size,
+        max_wait_ms=settings.nsfw_batch_wait_ms,
+        queue_size=settings.nsfw_queue_size,
+    )
+
+    ban_task = asyncio.create_task(
+        ban_cache.refresh_loop(sessionmaker, interval_seconds=settings.ban_refresh_seconds)
+    )
+    fsm_task = asyncio.create_task(fsm_expiry_loop(fsm_storage))
+    activity_task = asyncio.create_task(activity.run())
+    outbox_task = asyncio.create_task(outbox.run())
+
+    logger.info("bot started (%s)", settings.bot_mode)
     try:
-        await dp.start_polling(bot, cfg=settings)
+        if settings.bot_mode == "webhook":
+            await _run_webhook(bot, dp, settings, cfg=settings, candidate_queue=candidate_queue)
+        else:
+            await dp.start_polling(bot, cfg=settings, candidate_queue=candidate_queue)
     finally:
-        if reset_task:
-            reset_task.cancel()
-            await asyncio.gather(reset_task, return_exceptions=True)
+        background = [t for t in (reset_task, purge_task, ban_task, fsm_task, activity_task, outbox_task) if t]
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        notification_outbox.set_dispatcher(None)
+        await send_scheduler.shutdown()
+        await moderation.shutdown()
+        await activity.close()
+        await candidate_queue.close()
+        await antiflood.shutdown()
+        await ban_cache.shutdown()
+        await fsm_storage.close()
         await bot.session.close()
-        await engine.dispose()
+        await release_db(engine)
@@ -42,7 +42,55 @@ def ensure_runtime_paths() -> None:
             "ACTION_LIMIT_PER_MIN=60\n"
             "DAILY_RESET_ENABLED=1\n"
             "DAILY_RESET_HOUR=8\n"
-            "DAILY_RESET_TZ=Europe/Kyiv\n",
+            "DAILY_RESET_TZ=Europe/Kyiv\n"
+            "CANDIDATE_BATCH_SIZE=20\n"
+            "CANDIDATE_REFILL_AT=5\n"
+            "RATE_LIMIT_BACKEND=db\n"
+            "REDIS_URL=\n"
+            "ACTION_LOG_AUDIT=1\n"
+            "ACTION_LOG_PURGE_ENABLED=1\n"
+            "ACTION_LOG_RETENTION_DAYS=3\n"
+            "ACTION_LOG_PURGE_INTERVAL_MIN=60\n"
+            "ACTION_LOG_PURGE_CHUNK=5000\n"
+            "FSM_STORAGE=db\n"
+            "FSM_TTL_HOURS=48\n"
+            "BOT_MODE=polling\n"
+            "WEBHOOK_URL=\n"
+            "WEBHOOK_PATH=/telegram/webhook\n"
+            "WEBHOOK_SECRET=\n"
+            "WEBHOOK_WORKERS=8\n"
+            "WEBHOOK_QUEUE_SIZE=100\n"
+            "ACTIVITY_FLUSH_SECONDS=30\n"
+            "ACTIVITY_BATCH_SIZE=500\n"
+            "DB_POOL_SIZE=10\n"
+            "DB_MAX_OVERFLOW=20\n"
+            "DB_POOL_TIMEOUT=30\n"
+            "DB_POOL_RECYCLE=1800\n"
+            "DB_POOL_PRE_PING=true\n"
+            "DB_STATEMENT_CACHE_SIZE=256\n"
+            "SQLITE_BUSY_TIMEOUT_MS=5000\n"
+            "SQLITE_MMAP_MB=256\n"
+            "SQLITE_CACHE_MB=64\n"
+            "DB_ADMIN_POOL_SIZE=0\n"
+            "DB_SCHEMA_MODE=check\n"
+            "OUTBOX_CONCURRENCY=8\n"
+            "OUTBOX_BATCH_SIZE=50\n"
+            "OUTBOX_POLL_SECONDS=2\n"
+            "OUTBOX_MAX_ATTEMPTS=8\n"
+            "TG_SEND_RATE=30\n"
+            "TG_SEND_CHAT_INTERVAL=1.0\n"
+            "PHOTO_CACHE_DIR=\n"
+            "PHOTO_CACHE_MAX_MB=512\n"
+            "THUMB_WORKERS=2\n"
+            "NSFW_WORKERS=1\n"
+            "NSFW_INTRA_OP_THREADS=1\n"
+            "NSFW_BATCH_SIZE=8\n"
+            "NSFW_BATCH_WAIT_MS=5\n"
+            "NSFW_QUEUE_SIZE=64\n"
+            "ADMIN_NOTIFY_DRAIN_SECONDS=10.0\n"
+            "ADMIN_NOTIFY_DRAIN_MAX_SECONDS=600.0\n"
+            "METRICS_TOKEN=\n"
+            "BAN_REFRESH_SECONDS=10\n",
             encoding="utf-8",
         )
 
@@ -100,6 +148,54 @@ class Settings:
     reset_enabled: bool = True
     reset_hour: int = 8
     reset_timezone: str = "Europe/Kyiv"
+    candidate_batch_size: int = 20
+    candidate_refill_at: int = 5
+    rate_limit_backend: str = "db"  # db/memory/redis
+    redis_url: str = ""
+    action_log_audit: bool = True
+    action_log_purge_enabled: bool = True
+    action_log_retention_days: int = 3
+    action_log_purge_interval_min: int = 60
+    action_log_purge_chunk: int = 5000
+    fsm_storage: str = "db"  # memory/db/redis
+    fsm_ttl_hours: int = 48
+    bot_mode: str = "polling"  # polling/webhook
+    webhook_url: str = ""
+    webhook_path: str = "/telegram/webhook"
+    webhook_secret: str = ""
+    webhook_workers: int = 8
+    webhook_queue_size: int = 100
+    activity_flush_seconds: int = 30
+    activity_batch_size: int = 500
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 256  # asyncpg prepared statements per connection; 0 for pgbouncer
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_mb: int = 256
+    sqlite_cache_mb: int = 64
+    db_admin_pool_size: int = 0  # 0 = admin API shares the bot pool
+    db_schema_mode: str = "check"  # check/create/off; create = create_all (dev only)
+    outbox_concurrency: int = 8  # like/match notifications delivered in parallel
+    outbox_batch_size: int = 50
+    outbox_poll_seconds: float = 2.0
+    outbox_max_attempts: int = 8
+    tg_send_rate: float = 30.0  # bot-originated messages per second, all chats
+    tg_send_chat_interval: float = 1.0  # min seconds between two such messages to one chat
+    photo_cache_dir: str = ""  # empty = data/photo_cache
+    photo_cache_max_mb: int = 512
+    thumb_workers: int = 2  # process pool for admin photo thumbnails
+    nsfw_workers: int = 1  # NSFW moderation worker processes
+    nsfw_intra_op_threads: int = 1  # ONNX threads per moderation process (0 = onnxruntime default)
+    nsfw_batch_size: int = 8  # Max photos per NSFW inference batch
+    nsfw_batch_wait_ms: float = 5.0  # Max wait to fill an NSFW batch
+    nsfw_queue_size: int = 64  # Photos waiting for moderation before uploads block
+    admin_notify_drain_seconds: float = 10.0  # min wait for queued admin notifications on shutdown
+    admin_notify_drain_max_seconds: float = 600.0  # cap on that wait; it grows with the queue at TG_SEND_RATE
+    metrics_token: str = ""  # Bearer token for /metrics; empty = admin session only
+    ban_refresh_seconds: int = 10  # Poll app_meta bans_version (bans from an API in another process); 0 = off
 
 
 @lru_cache(maxsize=1)
@@ -134,6 +230,54 @@ def get_settings() -> Settings:
         reset_enabled=_parse_bool(os.getenv("DAILY_RESET_ENABLED"), True),
         reset_hour=int(os.getenv("DAILY_RESET_HOUR", "8")),
         reset_timezone=os.getenv("DAILY_RESET_TZ", "Europe/Kyiv").strip() or "Europe/Kyiv",
+        candidate_batch_size=int(os.getenv("CANDIDATE_BATCH_SIZE", "20")),
+        candidate_refill_at=int(os.getenv("CANDIDATE_REFILL_AT", "5")),
+        rate_limit_backend=os.getenv("RATE_LIMIT_BACKEND", "db").strip().lower() or "db",
+        redis_url=os.getenv("REDIS_URL", "").strip(),
+        action_log_audit=_parse_bool(os.getenv("ACTION_LOG_AUDIT"), True),
+        action_log_purge_enabled=_parse_bool(os.getenv("ACTION_LOG_PURGE_ENABLED"), True),
+        action_log_retention_days=int(os.getenv("ACTION_LOG_RETENTION_DAYS", "3")),
+        action_log_purge_interval_min=int(os.getenv("ACTION_LOG_PURGE_INTERVAL_MIN", "60")),
+        action_log_purge_chunk=int(os.getenv("ACTION_LOG_PURGE_CHUNK", "5000")),
+        fsm_storage=os.getenv("FSM_STORAGE", "db").strip().lower() or "db",
+        fsm_ttl_hours=int(os.getenv("FSM_TTL_HOURS", "48")),
+        bot_mode=os.getenv("BOT_MODE", "polling").strip().lower() or "polling",
+        webhook_url=os.getenv("WEBHOOK_URL", "").strip(),
+        webhook_path=os.getenv("WEBHOOK_PATH", "/telegram/webhook").strip(),
+        webhook_secret=os.getenv("WEBHOOK_SECRET", "").strip(),
+        webhook_workers=int(os.getenv("WEBHOOK_WORKERS", "8")),
+        webhook_queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "100")),
+        activity_flush_seconds=int(os.getenv("ACTIVITY_FLUSH_SECONDS", "30")),
+        activity_batch_size=int(os.getenv("ACTIVITY_BATCH_SIZE", "500")),
+        db_pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        db_pool_pre_ping=_parse_bool(os.getenv("DB_POOL_PRE_PING"), True),
+        db_statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256")),
+        sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        sqlite_mmap_mb=int(os.getenv("SQLITE_MMAP_MB", "256")),
+        sqlite_cache_mb=int(os.getenv("SQLITE_CACHE_MB", "64")),
+        db_admin_pool_size=int(os.getenv("DB_ADMIN_POOL_SIZE", "0")),
+        db_schema_mode=os.getenv("DB_SCHEMA_MODE", "check").strip().lower() or "check",
+        outbox_concurrency=int(os.getenv("OUTBOX_CONCURRENCY", "8")),
+        outbox_batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "50")),
+        outbox_poll_seconds=float(os.getenv("OUTBOX_POLL_SECONDS", "2")),
+        outbox_max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8")),
+        tg_send_rate=float(os.getenv("TG_SEND_RATE", "30")),
+        tg_send_chat_interval=float(os.getenv("TG_SEND_CHAT_INTERVAL", "1.0")),
+        photo_cache_dir=os.getenv("PHOTO_CACHE_DIR", "").strip(),
+        photo_cache_max_mb=int(os.getenv("PHOTO_CACHE_MAX_MB", "512")),
+        thumb_workers=int(os.getenv("THUMB_WORKERS", "2")),
+        nsfw_workers=int(os.getenv("NSFW_WORKERS", "1")),
+        nsfw_intra_op_threads=int(os.getenv("NSFW_INTRA_OP_THREADS", "1")),
+        nsfw_batch_size=int(os.getenv("NSFW_BATCH_SIZE", "8")),
+        nsfw_batch_wait_ms=float(os.getenv("NSFW_BATCH_WAIT_MS", "5.0")),
+        nsfw_queue_size=int(os.getenv("NSFW_QUEUE_SIZE", "64")),
+        admin_notify_drain_seconds=float(os.getenv("ADMIN_NOTIFY_DRAIN_SECONDS", "10.0")),
+        admin_notify_drain_max_seconds=float(os.getenv("ADMIN_NOTIFY_DRAIN_MAX_SECONDS", "600.0")),
+        metrics_token=os.getenv("METRICS_TOKEN", "").strip(),
+        ban_refresh_seconds=int(os.getenv("BAN_REFRESH_SECONDS", "10")),
     )
 
 
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 from contextlib import asynccontextmanager
-
+from dataclasses import dataclass, replace
 from typing import Optional
 
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.config import Settings, get_settings
+from db import EngineProfile, create_engine as _create_engine, init_db
+from services import metrics
 
-from app.config import get_settings
+logger = logging.getLogger(__name__)
 
 
 def create_engine(database_url: Optional[str] = None) -> AsyncEngine:
     settings = get_settings()
-    return create_async_engine(database_url or settings.database_url, echo=False, future=True)
+    return _create_engine(database_url or settings.database_url, EngineProfile.from_settings(settings))
 
 
 def create_sessionmaker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
@@ -22,3 +28,67 @@ def create_sessionmaker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]
 async def session_scope(sessionmaker: async_sessionmaker[AsyncSession]):
     async with sessionmaker() as session:
         yield session
+
+
+@dataclass
+class _Pool:
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker[AsyncSession]
+    refs: int = 0
+
+
+# Один engine на пул у процесі: run.py піднімає і бота, і адмінку в одному event loop.
+_pools: dict[str, _Pool] = {}
+_schema_ready: set[str] = set()
+_registry_lock = asyncio.Lock()
+
+
+def _pool_name(workload: str, settings: Settings) -> str:
+    """bot — гарячий шлях; admin отримує окремий пул лише з DB_ADMIN_POOL_SIZE > 0."""
+    if workload == "admin" and settings.db_admin_pool_size > 0:
+        return "admin"
+    return "main"
+
+
+def _profile(name: str, settings: Settings) -> EngineProfile:
+    profile = EngineProfile.from_settings(settings)
+    if name == "admin":
+        profile = replace(profile, pool_size=settings.db_admin_pool_size, max_overflow=0)
+    return profile
+
+
+async def acquire_db(
+    workload: str = "bot", settings: Optional[Settings] = None
+) -> tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+    """Спільні engine/sessionmaker для навантаження; схема створюється один раз на процес.
+
+    Кожен acquire_db має парний release_db: пул закривається з останнім користувачем.
+    """
+    settings = settings or get_settings()
+    name = _pool_name(workload, settings)
+    async with _registry_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            engine = _create_engine(settings.database_url, _profile(name, settings))
+            metrics.instrument_engine(engine, name=name)
+            pool = _pools[name] = _Pool(engine, create_sessionmaker(engine))
+            logger.info("DB pool %r created", name)
+        if settings.database_url not in _schema_ready:
+            await init_db(pool.engine, settings.db_schema_mode)
+            _schema_ready.add(settings.database_url)
+        pool.refs += 1
+    return pool.engine, pool.sessionmaker
+
+
+async def release_db(engine: AsyncEngine) -> None:
+    async with _registry_lock:
+        for name, pool in list(_pools.items()):
+            if pool.engine is not engine:
+                continue
+            pool.refs -= 1
+            if pool.refs <= 0:
+                del _pools[name]
+                await engine.dispose()
+                logger.info("DB pool %r disposed", name)
+            return
+    await engine.dispose()
@@ -4,8 +4,10 @@ from __future__ import annotations
 from models import (  # noqa: F401
     ActionLog,
     AdminAction,
+    AppMeta,
     Base,
     Feedback,
+    FsmState,
     UaLocation,
     Like,
     Match,
@@ -18,9 +20,11 @@ from models import (  # noqa: F401
 __all__ = [
     "ActionLog",
     "AdminAction",
+    "AppMeta",
     "Base",
     "Complaint",
     "Feedback",
+    "FsmState",
     "UaLocation",
     "Like",
     "Match",
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Вміст за file_id у Telegram не змінюється, але сторінки адмінки — лише для адміна.
+CACHE_CONTROL = "private, max-age=604800, immutable"
+
+_TMP_PREFIX = ".tmp-"
+
+# fetch(destination) качає файл у destination і повертає його розширення (".jpg").
+Fetcher = Callable[[Path], Awaitable[str]]
+
+
+def cache_key(file_id: str) -> str:
+    return hashlib.sha256(file_id.encode("utf-8")).hexdigest()
+
+
+def photo_etag(file_id: str) -> str:
+    return f'"{cache_key(file_id)[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def media_type_for(path: Path) -> str:
+    ext = path.suffix.lower()
+    if ext in {".png"}:
+        return "image/png"
+    if ext in {".webp"}:
+        return "image/webp"
+    if ext in {".gif"}:
+        return "image/gif"
+    return "image/jpeg"
+
+
+@dataclass(frozen=True)
+class CachedPhoto:
+    key: str
+    path: Path
+    size: int
+    media_type: str
+
+
+class PhotoCache:
+    """Дисковий кеш фото для /admin/photos: файл <dir>/<ab>/<sha256(file_id)>.<ext>.
+
+    LRU у пам'яті (порядок після рестарту — за mtime), сумарний розмір не більше
+    max_bytes. Паралельні запити одного file_id чекають одне завантаження.
+    Файл, який зараз віддається або з якого рендериться прев'ю, закріплений
+    (acquire/release) і не витісняється, доки його не відпустять.
+    """
+
+    def __init__(self, directory: Path, *, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max(1, int(max_bytes))
+        self._entries: OrderedDict[str, tuple[Path, int]] = OrderedDict()
+        self._total = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._pins: Counter[str] = Counter()
+
+    async def load(self) -> None:
+        entries = await asyncio.to_thread(self._scan)
+        self._entries = OrderedDict((p.stem, (p, size)) for p, size in entries)
+        self._total = sum(size for _, size in entries)
+        await self._evict()
+        logger.info("Photo cache: %s files, %.1f MB", len(self._entries), self._total / 1024 / 1024)
+
+    def _scan(self) -> list[tuple[Path, int]]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found: list[tuple[float, Path, int]] = []
+        for path in self.directory.glob("*/*"):
+            try:
+                if path.name.startswith(_TMP_PREFIX):
+                    path.unlink()
+                    continue
+                st = path.stat()
+            except OSError:
+                continue
+            found.append((st.st_mtime, path, st.st_size))
+        for path in self.directory.glob(f"{_TMP_PREFIX}*"):
+            path.unlink(missing_ok=True)
+        found.sort(key=lambda item: item[0])
+        # Той самий file_id з різними розширеннями: лишаємо свіжіший файл.
+        newest = {path.stem: path for _, path, _ in found}
+        for _, path, _ in found:
+            if newest[path.stem] != path:
+                path.unlink(missing_ok=True)
+        return [(path, size) for _, path, size in found if newest[path.stem] == path]
+
+    def _lookup(self, key: str) -> CachedPhoto | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        path, size = entry
+        if not path.is_file():
+            # Файл прибрали ззовні: забуваємо і качаємо знову.
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return CachedPhoto(key=key, path=path, size=size, media_type=media_type_for(path))
+
+    def _drop(self, key: str) -> tuple[Path, int] | None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total -= entry[1]
+        return entry
+
+    async def get(self, file_id: str, fetch: Fetcher) -> CachedPhoto:
+        key = cache_key(file_id)
+        cached = self._lookup(key)
+        if cached is not None:
+            metrics.inc("photo_cache_requests_total", result="hit")
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            metrics.inc("photo_cache_requests_total", result="miss")
+            task = asyncio.create_task(self._fill(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metrics.inc("photo_cache_requests_total", result="coalesced")
+        # shield: відміна одного запиту не скасовує завантаження для інших.
+        return await asyncio.shield(task)
+
+    async def acquire(self, file_id: str, fetch: Fetcher) -> CachedPhoto:
+        """Як get(), але файл закріплений до release(): _evict його не видалить."""
+        while True:
+            cached = await self.get(file_id, fetch)
+            entry = self._entries.get(cached.key)
+            if entry is not None and entry[0] == cached.path:
+                self._pins[cached.key] += 1
+                return cached
+            # Витіснили між заповненням і поверненням у цей запит: беремо ще раз.
+
+    def release(self, cached: CachedPhoto) -> None:
+        self._pins[cached.key] -= 1
+        if self._pins[cached.key] <= 0:
+            del self._pins[cached.key]
+
+    async def _fill(self, key: str, fetch: Fetcher) -> CachedPhoto:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f"{_TMP_PREFIX}{key}-{uuid.uuid4().hex}"
+        try:
+            suffix = (await fetch(tmp)).lower() or ".jpg"
+            path, size = await asyncio.to_thread(self._commit, tmp, key, suffix)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        replaced = self._drop(key)
+        self._entries[key] = (path, size)
+        self._total += size
+        if replaced is not None and replaced[0] != path:
+            # Той самий file_id з іншим розширенням: старий файл поза бюджетом не лишаємо.
+            await asyncio.to_thread(self._unlink, [replaced[0]])
+        await self._evict()
+        return CachedPhoto(key=key, path=path, size=size, media_type=media_type_for(path))
+
+    def _commit(self, tmp: Path, key: str, suffix: str) -> tuple[Path, int]:
+        path = self.directory / key[:2] / f"{key}{suffix}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, path)
+        return path, path.stat().st_size
+
+    async def _evict(self) -> None:
+        victims: list[Path] = []
+        if self._total > self.max_bytes:
+            # Від найстаріших; найсвіжіший файл і закріплені (ще віддаються) лишаємо.
+            for key in list(self._entries)[:-1]:
+                if self._total <= self.max_bytes:
+                    break
+                if self._pins.get(key):
+                    continue
+                path, _ = self._drop(key)
+                victims.append(path)
+        metrics.set_gauge("photo_cache_bytes", self._total)
+        if victims:
+            metrics.inc("photo_cache_evictions_total", len(victims))
+            await asyncio.to_thread(self._unlink, victims)
+
+    @staticmethod
+    def _unlink(paths: list[Path]) -> None:
+        for path in paths:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                # Windows: файл ще віддається клієнту; залишок прибере наступний load().
+                logger.warning("Photo cache: failed to remove %s", path)
+
+
+class CachedFileResponse(FileResponse):
+    """FileResponse для закріпленого файлу: відпускає його, коли відповідь віддана (або обірвалась)."""
+
+    def __init__(self, cache: PhotoCache, cached: CachedPhoto, **kwargs):
+        super().__init__(cached.path, media_type=cached.media_type, **kwargs)
+        self._release = lambda: cache.release(cached)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+metrics.describe("photo_cache_requests_total", "Admin photo requests by cache result (hit/miss/coalesced)")
+metrics.describe("photo_cache_bytes", "Bytes stored in the admin photo cache")
+metrics.describe("photo_cache_evictions_total", "Files evicted from the admin photo cache")
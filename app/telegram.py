@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Coroutine, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from services import metrics, send_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class NotifyResult:
+    sent: int
+    failed: int
+
+
+class TelegramClient:
+    """Telegram-клієнт адмінки: один Bot (і одна HTTP-сесія) на весь процес.
+
+    Фонові відправки йдуть через spawn(): задачі відстежуються разом з адресатами,
+    і close() дочікує їх, перш ніж закрити сесію. Час очікування рахується від
+    черги: drain_timeout + повідомлення в черзі / ліміт send_scheduler, не більше
+    max_drain_timeout; кому так і не надіслали — пишемо в лог.
+    """
+
+    def __init__(
+        self,
+        bot_token: str,
+        *,
+        concurrency: int = 8,
+        max_attempts: int = 3,
+        drain_timeout: float = 10.0,
+        max_drain_timeout: float = 600.0,
+    ):
+        self.bot_token = bot_token
+        self.concurrency = max(1, int(concurrency))
+        self.max_attempts = max(1, int(max_attempts))
+        self.drain_timeout = max(0.0, float(drain_timeout))
+        self.max_drain_timeout = max(self.drain_timeout, float(max_drain_timeout))
+        self._bot: Optional[Bot] = None
+        self._tasks: dict[asyncio.Task, tuple[int, ...]] = {}
+        self._closing = False
+
+    @property
+    def bot(self) -> Bot:
+        # Лениво: адмінка без BOT_TOKEN стартує, падають лише запити до Telegram.
+        if self._bot is None:
+            self._bot = Bot(token=self.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        return self._bot
+
+    def spawn(self, coro: Coroutine, tg_ids: Iterable[int] = ()) -> Optional[asyncio.Task]:
+        """tg_ids — адресати задачі: з них рахується час дренажу і лог недоставлених."""
+        tg_ids = tuple(tg_ids)
+        if self._closing:
+            coro.close()
+            logger.warning("Telegram client is closing, background send dropped: tg_ids=%s", list(tg_ids))
+            return None
+        task = asyncio.create_task(coro)
+        self._tasks[task] = tg_ids
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.pop(task, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Background Telegram task failed", exc_info=task.exception())
+
+    async def notify(self, tg_id: int, text: str) -> bool:
+        for _ in range(self.max_attempts):
+            await send_scheduler.acquire(tg_id, send_scheduler.PRIORITY_ADMIN)
+            try:
+                await self.bot.send_message(tg_id, text)
+            except TelegramRetryAfter as e:
+                send_scheduler.pause(e.retry_after)
+                continue
+            except TelegramForbiddenError:
+                # Користувач заблокував бота: повторювати нема чого.
+                metrics.inc("admin_notifications_total", result="blocked")
+                return False
+            except Exception:
+                logger.exception("Failed to notify user tg_id=%s", tg_id)
+                break
+            metrics.inc("admin_notifications_total", result="sent")
+            return True
+        metrics.inc("admin_notifications_total", result="failed")
+        return False
+
+    async def notify_many(self, tg_ids: Iterable[int], text: str) -> NotifyResult:
+        """Масова розсилка (напр. після масового бану); темп задає send_scheduler."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(tg_id: int) -> bool:
+            async with semaphore:
+                return await self.notify(tg_id, text)
+
+        results = await asyncio.gather(*(one(tg_id) for tg_id in dict.fromkeys(tg_ids)))
+        sent = sum(1 for ok in results if ok)
+        return NotifyResult(sent=sent, failed=len(results) - sent)
+
+    def notify_later(self, tg_id: int, text: str) -> None:
+        self.spawn(self.notify(tg_id, text), (tg_id,))
+
+    def notify_many_later(self, tg_ids: Iterable[int], text: str) -> None:
+        tg_ids = list(dict.fromkeys(tg_ids))
+        self.spawn(self._notify_many_logged(tg_ids, text), tg_ids)
+
+    async def _notify_many_logged(self, tg_ids: list[int], text: str) -> None:
+        result = await self.notify_many(tg_ids, text)
+        logger.info("Bulk notification done: sent=%s failed=%s", result.sent, result.failed)
+
+    def drain_budget(self) -> float:
+        """Скільки чекати фонові відправки: усе, що в черзі, має пройти крізь ліміт send_scheduler."""
+        scheduler = send_scheduler.get_scheduler()
+        queued = sum(len(tg_ids) for tg_ids in self._tasks.values()) + scheduler.pending()
+        return min(self.max_drain_timeout, self.drain_timeout + queued / scheduler.rate)
+
+    async def close(self, drain_timeout: Optional[float] = None) -> None:
+        self._closing = True
+        if self._tasks:
+            timeout = self.drain_budget() if drain_timeout is None else drain_timeout
+            logger.info("Telegram client draining %s background sends (up to %.1fs)", len(self._tasks), timeout)
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            if pending:
+                # Партія могла бути надіслана частково: у лозі — усі адресати незавершених задач.
+                lost = [tg_id for task in pending for tg_id in self._tasks.get(task, ())]
+                logger.error(
+                    "Telegram client drain timed out after %.1fs, %s background sends cancelled, "
+                    "possibly not notified: tg_ids=%s",
+                    timeout,
+                    len(pending),
+                    lost,
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        if self._bot is not None:
+            await self._bot.session.close()
+            self._bot = None
+
+
+metrics.describe("admin_notifications_total", "Admin API notifications to users by result")
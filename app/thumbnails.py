@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from services import metrics
+from services.photos import open_photo
+
+logger = logging.getLogger(__name__)
+
+# Сторони квадрата, в який вписуємо прев'ю (px): 1x/2x для сітки 90px і велике прев'ю.
+THUMB_SIZES = (96, 192, 512)
+
+FORMATS = {"webp": ("WEBP", ".webp", "image/webp"), "jpeg": ("JPEG", ".jpg", "image/jpeg")}
+
+RENDER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+def pick_format(accept: Optional[str]) -> str:
+    """WebP, якщо браузер його приймає, інакше JPEG."""
+    return "webp" if accept and "image/webp" in accept else "jpeg"
+
+
+def _render(src: str, dest: str, size: int, fmt: str) -> int:
+    """Виконується в процесі пулу: одне декодування, зменшення, запис у dest."""
+    from PIL import Image
+
+    pil_format = FORMATS[fmt][0]
+    img = open_photo(src, size * 2)
+    try:
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        out = img.convert("RGB") if img.mode not in ("RGB", "RGBA") or pil_format == "JPEG" else img
+        if pil_format == "WEBP":
+            out.save(dest, "WEBP", quality=78, method=4)
+        else:
+            out.save(dest, "JPEG", quality=82, optimize=True, progressive=True)
+    finally:
+        img.close()
+    return os.path.getsize(dest)
+
+
+class Thumbnailer:
+    """Пул процесів для прев'ю: Pillow тримає GIL, тож у потоках не масштабується."""
+
+    def __init__(self, workers: int = 2):
+        self.workers = max(1, int(workers))
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, як у services.moderation: потоки й event loop адмінки не переживають fork.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def render(self, src: Path, dest: Path, size: int, fmt: str) -> str:
+        """Пише прев'ю в dest і повертає його розширення (для PhotoCache)."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        await loop.run_in_executor(self._executor(), _render, str(src), str(dest), size, fmt)
+        metrics.observe(
+            "photo_thumbnail_render_seconds", time.perf_counter() - started, buckets=RENDER_BUCKETS, format=fmt
+        )
+        return FORMATS[fmt][1]
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+
+metrics.describe("photo_thumbnail_render_seconds", "Time to build one admin photo thumbnail in the process pool")
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+import re
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.config import Settings
+
+logger = logging.getLogger(__name__)
+
+# Дозволені символи secret_token у setWebhook.
+_SECRET_RE = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def _shard_key(update: Update) -> int:
+    """Чат (або користувач) апдейта: усе від одного чату обробляється по черзі."""
+    try:
+        event = update.event
+    except Exception:
+        return int(update.update_id)
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return int(chat.id)
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user is not None:
+        return int(user.id)
+    return int(update.update_id)
+
+
+class UpdateWorkerPool:
+    """Обмежений пул воркерів для вебхука.
+
+    Апдейт потрапляє в чергу шарда hash(chat_id) % workers: один чат — завжди
+    той самий воркер (порядок зберігається), різні чати — паралельно.
+    Повна черга => submit() повертає False, і вебхук відповідає 503.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        *,
+        workers: int = 8,
+        queue_size: int = 100,
+        **workflow_data: Any,
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workflow_data = workflow_data
+        self._queues: list[asyncio.Queue[Update]] = [
+            asyncio.Queue(maxsize=max(1, int(queue_size))) for _ in range(max(1, int(workers)))
+        ]
+        self._tasks: list[asyncio.Task] = []
+        self.rejected = 0
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker(queue), name=f"webhook-worker-{i}")
+                for i, queue in enumerate(self._queues)
+            ]
+
+    def submit(self, update: Update) -> bool:
+        queue = self._queues[_shard_key(update) % len(self._queues)]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        return True
+
+    def qsize(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def _worker(self, queue: asyncio.Queue[Update]) -> None:
+        while True:
+            update = await queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update, **self.workflow_data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Webhook update %s failed", update.update_id)
+            finally:
+                queue.task_done()
+
+    async def close(self, drain_timeout: float = 10.0) -> None:
+        """Дочікуємо вже прийняті апдейти (не довше drain_timeout) і зупиняємо воркерів."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Webhook pool drain timed out, %s updates dropped", self.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+# Пул живе в процесі бота (start_bot), маршрут — у FastAPI того ж процесу (run.py).
+_pool: Optional[UpdateWorkerPool] = None
+
+
+def set_pool(pool: Optional[UpdateWorkerPool]) -> None:
+    global _pool
+    _pool = pool
+
+
+def get_pool() -> Optional[UpdateWorkerPool]:
+    return _pool
+
+
+def require_webhook_secret(settings: Settings) -> None:
+    """Webhook-режим не стартує без WEBHOOK_SECRET (Telegram шле його в кожному запиті)."""
+    secret = settings.webhook_secret
+    if not secret:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_SECRET")
+    if len(secret) > 256 or not _SECRET_RE.fullmatch(secret):
+        raise RuntimeError("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+
+
+def install_webhook_route(app: FastAPI, settings: Settings) -> None:
+    """POST settings.webhook_path: приймає апдейт від Telegram і ставить у пул."""
+    require_webhook_secret(settings)
+    secret = settings.webhook_secret.encode("utf-8")
+
+    async def telegram_webhook(request: Request) -> JSONResponse:
+        # Без секрету будь-хто з доступом до порту підробив би апдейт (і from_user адміна).
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode("utf-8")
+        if not hmac.compare_digest(token, secret):
+            return JSONResponse({"ok": False}, status_code=403)
+
+        pool = _pool
+        if pool is None:
+            # Бот ще стартує: Telegram повторить доставку пізніше.
+            return JSONResponse({"ok": False, "error": "not ready"}, status_code=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": pool.bot})
+        except Exception:
+            logger.warning("Invalid webhook payload")
+            return JSONResponse({"ok": False}, status_code=400)
+
+        if not pool.submit(update):
+            return JSONResponse(
+                {"ok": False, "error": "busy"},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+        return JSONResponse({"ok": True})
+
+    app.add_api_route(settings.webhook_path, telegram_webhook, methods=["POST"], include_in_schema=False)
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime, timedelta, timezone
-from typing import Optional
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from sqlalchemy import select
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -14,23 +17,178 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 
-from models import Base, User
+from models import Base
+from services import metrics
+from services.activity import ActivityTracker
 
 logger = logging.getLogger(__name__)
 
+ALEMBIC_DIR = Path(__file__).resolve().parent / "alembic"
+SCHEMA_MODES = ("check", "create", "off")
+
+
+@dataclass(frozen=True)
+class EngineProfile:
+    """Налаштування пулу/драйвера для create_engine (DB_POOL_*, SQLITE_* у .env)."""
+
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 256
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_mb: int = 256
+    sqlite_cache_mb: int = 64
+
+    @classmethod
+    def from_settings(cls, settings: Any) -> "EngineProfile":
+        return cls(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+            statement_cache_size=settings.db_statement_cache_size,
+            sqlite_busy_timeout_ms=settings.sqlite_busy_timeout_ms,
+            sqlite_mmap_mb=settings.sqlite_mmap_mb,
+            sqlite_cache_mb=settings.sqlite_cache_mb,
+        )
+
+
+def _engine_kwargs(database_url: str, profile: EngineProfile) -> dict[str, Any]:
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        # Один файл і один writer: пул тут нічого не дає, важать pragma (див. _sqlite_pragmas).
+        return {}
+    kwargs: dict[str, Any] = {
+        "pool_size": profile.pool_size,
+        "max_overflow": profile.max_overflow,
+        "pool_timeout": profile.pool_timeout,
+        "pool_recycle": profile.pool_recycle,
+        "pool_pre_ping": profile.pool_pre_ping,
+    }
+    if url.get_driver_name() == "asyncpg":
+        size = max(0, profile.statement_cache_size)
+        # prepared_statement_cache_size — кеш SQLAlchemy, statement_cache_size — самого asyncpg
+        # (0 для обох, якщо перед БД стоїть pgbouncer у transaction mode).
+        kwargs["connect_args"] = {"prepared_statement_cache_size": size, "statement_cache_size": size}
+    return kwargs
+
+
+def _sqlite_pragmas(engine: AsyncEngine, profile: EngineProfile) -> None:
+    in_memory = engine.url.database in (None, "", ":memory:")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):  # noqa: ANN001
+        cursor = dbapi_connection.cursor()
+        try:
+            if not in_memory:
+                # WAL: читачі не блокуються записом, NORMAL — fsync лише на checkpoint.
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute(f"PRAGMA mmap_size={int(profile.sqlite_mmap_mb) * 1024 * 1024}")
+            cursor.execute(f"PRAGMA busy_timeout={int(profile.sqlite_busy_timeout_ms)}")
+            cursor.execute(f"PRAGMA cache_size=-{int(profile.sqlite_cache_mb) * 1024}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
 
-def create_engine(database_url: Optional[str]) -> AsyncEngine:
-    return create_async_engine(database_url or "", echo=False)
+def create_engine(database_url: Optional[str], profile: Optional[EngineProfile] = None) -> AsyncEngine:
+    database_url = database_url or ""
+    if profile is None:
+        return create_async_engine(database_url, echo=False)
+    engine = create_async_engine(database_url, echo=False, **_engine_kwargs(database_url, profile))
+    if engine.dialect.name == "sqlite":
+        _sqlite_pragmas(engine, profile)
+    return engine
 
 
 def create_sessionmaker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
     return async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 
-async def init_db(engine: AsyncEngine) -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    logger.info("DB initialized (create_all done)")
+def alembic_heads() -> set[str]:
+    """Head-ревізії з alembic/versions (без підключення до БД)."""
+    from alembic.script import ScriptDirectory
+
+    return set(ScriptDirectory(str(ALEMBIC_DIR)).get_heads())
+
+
+async def db_revisions(engine: AsyncEngine) -> Optional[set[str]]:
+    """Ревізії з alembic_version або None, якщо таблиці немає (схему не вели міграціями)."""
+    async with engine.connect() as conn:
+        if not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("alembic_version")):
+            return None
+        res = await conn.execute(text("SELECT version_num FROM alembic_version"))
+        return {row[0] for row in res}
+
+
+async def init_db(engine: AsyncEngine, mode: str = "create") -> None:
+    """mode: create — create_all (dev/скрипти), check — лише звірка alembic_version з head, off — нічого."""
+    mode = (mode or "create").strip().lower()
+    if mode not in SCHEMA_MODES:
+        raise ValueError(f"unknown DB schema mode: {mode}")
+    if mode == "off":
+        return
+
+    started = time.perf_counter()
+    if mode == "create":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        logger.info("DB initialized (create_all done in %.1f ms)", (time.perf_counter() - started) * 1000)
+        return
+
+    heads = alembic_heads()
+    current = await db_revisions(engine)
+    if current != heads:
+        raise RuntimeError(
+            f"DB schema revision {sorted(current) if current else 'missing'} != alembic head {sorted(heads)}: "
+            "run `alembic upgrade head`; a DB created earlier by create_all has no alembic_version: "
+            "first `alembic stamp <revision its schema matches>` (no users.region column yet: 0001_initial), "
+            "then `alembic upgrade head` (or set DB_SCHEMA_MODE=create in dev)"
+        )
+    logger.info(
+        "DB schema at %s, DDL skipped (check took %.1f ms instead of create_all over %s tables)",
+        ",".join(sorted(heads)),
+        (time.perf_counter() - started) * 1000,
+        len(Base.metadata.tables),
+    )
+
+
+class LazySession:
+    """Проксі AsyncSession: справжня сесія (і з'єднання з пулу) з'являється лише
+    при першому зверненні до неї. info — власний словник, його читання сесію не створює.
+    """
+
+    def __init__(self, sessionmaker: async_sessionmaker[AsyncSession]):
+        self._sessionmaker = sessionmaker
+        self._session: Optional[AsyncSession] = None
+        self.info: dict = {}
+
+    @property
+    def used(self) -> bool:
+        return self._session is not None
+
+    def _real(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._sessionmaker()
+            metrics.inc("bot_db_sessions_opened_total")
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self._real(), name)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self) -> "LazySession":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
 
 
 class DbSessionMiddleware(BaseMiddleware):
@@ -39,55 +197,27 @@ class DbSessionMiddleware(BaseMiddleware):
         self.sessionmaker = sessionmaker
 
     async def __call__(self, handler, event: TelegramObject, data: dict):
-        async with self.sessionmaker() as session:
+        async with LazySession(self.sessionmaker) as session:
             data["session"] = session
             return await handler(event, data)
 
 
-class BanCheckMiddleware(BaseMiddleware):
-    """Skip processing updates from banned users."""
+class ActivityMiddleware(BaseMiddleware):
+    """Mark user activity in memory (services.activity), without touching the DB.
 
-    def __init__(self, sessionmaker: async_sessionmaker[AsyncSession]):
+    Banned users never get here: services.ban_cache.BannedUserDropMiddleware drops
+    their updates earlier, in the outer middleware.
+    """
+
+    def __init__(self, activity: ActivityTracker):
         super().__init__()
-        self.sessionmaker = sessionmaker
+        self.activity = activity
 
     async def __call__(self, handler, event: TelegramObject, data: dict):
         from_user = getattr(event, "from_user", None)
         if from_user is None:
             return await handler(event, data)
 
-        session: Optional[AsyncSession] = data.get("session")
-        created_here = False
-        if session is None:
-            session = self.sessionmaker()
-            created_here = True
-
-        try:
-            res = await session.execute(select(User).where(User.tg_id == from_user.id))
-            user = res.scalar_one_or_none()
-            if user is None:
-                return await handler(event, data)
-
-            if getattr(user, "is_banned", False):
-                logger.info("Ignore update from banned user tg_id=%s", from_user.id)
-                return None
-
-            # Update last activity no more than once per hour to avoid extra writes.
-            last_seen = getattr(user, "last_activity_at", None)
-            now = datetime.now(timezone.utc)
-            if last_seen is None or now - last_seen >= timedelta(hours=1):
-                user.last_activity_at = now
-                try:
-                    await session.commit()
-                except Exception:
-                    await session.rollback()
-                    logger.exception("Failed to update last_activity_at for tg_id=%s", from_user.id)
-
-            data.setdefault("user", user)
-            return await handler(event, data)
-        except Exception:
-            logger.exception("Ban check failed (db error)")
-            return await handler(event, data)
-        finally:
-            if created_here:
-                await session.close()
+        # last_activity_at пише ActivityTracker пачками, тут лише позначка в пам'яті.
+        self.activity.touch(from_user.id)
+        return await handler(event, data)
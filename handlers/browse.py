@@ -12,11 +12,8 @@ from keyboards.main_menu import BTN_BROWSE
 from keyboards.settings import open_settings_kb
 from models import User
 from services.antiflood import is_allowed, log_action
-from services.matching import (
-    get_current_user_or_none,
-    get_next_candidate,
-    put_reaction_and_maybe_match,
-)
+from services.candidate_queue import CandidateQueue
+from services.matching import get_current_user_or_none, put_reaction_and_maybe_match
 from utils.text import render_profile_caption
 
 logger = logging.getLogger(__name__)
@@ -24,8 +21,10 @@ router = Router()
 
 
 @router.message(F.text.in_({BTN_BROWSE, "Перегляд анкет"}))
-async def browse_start(message: Message, session: AsyncSession, cfg: Config) -> None:
-    cur = await get_current_user_or_none(session, message.from_user.id)
+async def browse_start(
+    message: Message, session: AsyncSession, cfg: Config, candidate_queue: CandidateQueue
+) -> None:
+    cur = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not cur:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -37,10 +36,12 @@ async def browse_start(message: Message, session: AsyncSession, cfg: Config) ->
         )
         return
 
-    await _send_next(message, session, cur, cfg)
+    await _send_next(message, session, cur, cfg, candidate_queue)
 
 
-async def _send_next(message: Message, session: AsyncSession, cur: User, cfg: Config) -> None:
+async def _send_next(
+    message: Message, session: AsyncSession, cur: User, cfg: Config, candidate_queue: CandidateQueue
+) -> None:
     # Антифлуд по переглядам
     if not await is_allowed(
         session=session,
@@ -52,7 +53,7 @@ async def _send_next(message: Message, session: AsyncSession, cur: User, cfg: Co
         await message.answer("Занадто швидко гортаєте. Зачекайте хвилину і спробуйте знову.")
         return
 
-    candidate = await get_next_candidate(session, cur)
+    candidate = await candidate_queue.next_candidate(session, cur)
     if not candidate:
         await message.answer(
             "Поки немає підхожих анкет.\n\n"
@@ -88,7 +89,9 @@ async def _send_next(message: Message, session: AsyncSession, cur: User, cfg: Co
 
 
 @router.callback_query(F.data.startswith("browse:"))
-async def browse_react(call: CallbackQuery, session: AsyncSession, cfg: Config) -> None:
+async def browse_react(
+    call: CallbackQuery, session: AsyncSession, cfg: Config, candidate_queue: CandidateQueue
+) -> None:
     cur = await get_current_user_or_none(session, call.from_user.id)
     if not cur:
         await call.answer("Спочатку анкета", show_alert=True)
@@ -139,18 +142,20 @@ async def browse_react(call: CallbackQuery, session: AsyncSession, cfg: Config)
             from_user=cur,
             to_user_id=candidate_id,
             is_like=(action == "like"),
-            bot=call.bot,
         )
     except Exception:
         logger.exception("Failed to process reaction")
         await call.message.answer("Сталася помилка. Спробуйте ще раз.")
         return
 
-    await _send_next(call.message, session, cur, cfg)
+    candidate_queue.discard(cur.id, candidate_id)
+    await _send_next(call.message, session, cur, cfg, candidate_queue)
 
 
 @router.callback_query(F.data.startswith("inlike:"))
-async def incoming_like_actions(call: CallbackQuery, session: AsyncSession, cfg: Config) -> None:
+async def incoming_like_actions(
+    call: CallbackQuery, session: AsyncSession, cfg: Config, candidate_queue: CandidateQueue
+) -> None:
     """Кнопки під сповіщенням 'вас лайкнули'."""
     cur = await get_current_user_or_none(session, call.from_user.id)
     if not cur:
@@ -198,9 +203,10 @@ async def incoming_like_actions(call: CallbackQuery, session: AsyncSession, cfg:
             from_user=cur,
             to_user_id=other_id,
             is_like=(action == "like"),
-            bot=call.bot,
         )
     except Exception:
         logger.exception("Failed to process incoming-like action")
         await call.message.answer("Помилка обробки. Спробуйте ще раз.")
         return
+
+    candidate_queue.discard(cur.id, other_id)
@@ -70,7 +70,7 @@ async def _create_complaint(
 @router.callback_query(F.data.startswith("complaint:start:"))
 async def complaint_start(call: CallbackQuery, session: AsyncSession) -> None:
     await _safe_answer(call)
-    cur = await get_current_user_or_none(session, call.from_user.id)
+    cur = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not cur:
         await call.message.answer("Сесію не знайдено. Надішліть /start")
         return
@@ -93,7 +93,7 @@ async def complaint_start(call: CallbackQuery, session: AsyncSession) -> None:
 @router.callback_query(F.data.startswith("complaint:reason:"))
 async def complaint_reason(call: CallbackQuery, session: AsyncSession, state: FSMContext) -> None:
     await _safe_answer(call)
-    cur = await get_current_user_or_none(session, call.from_user.id)
+    cur = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not cur:
         await call.message.answer("Сесію не знайдено. Надішліть /start")
         return
@@ -131,7 +131,7 @@ async def complaint_reason_text(message: Message, session: AsyncSession, state:
         await message.answer("Сесію втрачено. Спробуйте ще раз подати скаргу.")
         return
 
-    cur = await get_current_user_or_none(session, message.from_user.id)
+    cur = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not cur:
         await state.clear()
         await message.answer("Сесію не знайдено. Надішліть /start")
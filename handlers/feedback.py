@@ -46,7 +46,7 @@ async def _is_allowed(session: AsyncSession, user_id: int) -> bool:
 
 @router.message(Command("feedback"))
 async def feedback_start(message: Message, state: FSMContext, session: AsyncSession) -> None:
-    user = await get_current_user_or_none(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not user:
         await state.clear()
         await message.answer("Здається, ви ще не зареєстровані. Натисніть /start, щоб створити анкету 🙂")
@@ -68,7 +68,7 @@ async def feedback_start(message: Message, state: FSMContext, session: AsyncSess
 @router.callback_query(F.data.startswith("feedback:cat:"))
 async def feedback_set_category(call: CallbackQuery, session: AsyncSession, state: FSMContext) -> None:
     await call.answer()
-    user = await get_current_user_or_none(session, call.from_user.id)
+    user = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not user:
         await state.clear()
         await call.message.answer("Потрібно зареєструватися. Натисніть /start 🙂")
@@ -87,7 +87,7 @@ async def feedback_set_category(call: CallbackQuery, session: AsyncSession, stat
 
 @router.message(FeedbackStates.waiting_text)
 async def feedback_save(message: Message, session: AsyncSession, state: FSMContext) -> None:
-    user = await get_current_user_or_none(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not user:
         await state.clear()
         await message.answer("Потрібно зареєструватися. Натисніть /start 🙂")
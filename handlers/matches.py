@@ -66,7 +66,7 @@ async def _send_or_edit_match_card(call: CallbackQuery, photo_id: str, caption:
 
 @router.message(F.text.in_({BTN_MATCHES, "Взаємні лайки"}))
 async def show_matches(message: Message, session: AsyncSession) -> None:
-    cur = await get_current_user_or_none(session, message.from_user.id)
+    cur = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not cur:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -85,7 +85,7 @@ async def show_matches(message: Message, session: AsyncSession) -> None:
 @router.callback_query(F.data.startswith("matches:page:"))
 async def matches_pager(call: CallbackQuery, session: AsyncSession) -> None:
     await call.answer()
-    cur = await get_current_user_or_none(session, call.from_user.id)
+    cur = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not cur:
         await call.message.answer("Спочатку створіть анкету: /start")
         return
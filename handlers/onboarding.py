@@ -2,30 +2,39 @@ from __future__ import annotations
 
 import logging
 from typing import Optional
-from pathlib import Path
 
 from aiogram import F, Router
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, ReplyKeyboardRemove
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import Config
 from keyboards.main_menu import main_menu_kb
 from keyboards.inline_profiles import gender_kb, looking_for_kb, skip_about_kb, to_menu_inline_kb
 from keyboards.locations import (
+    REGION_CAPITALS,
+    LocationCallback,
     districts_kb,
     hromadas_kb,
+    parse_location_callback,
     regions_kb,
     search_scope_kb,
     settlements_kb,
 )
 from models import Photo, User
-from services.location_repo import LocationRepository
-from services.nsfw import download_photo_to_tmp, is_photo_nsfw
+from services.location_repo import (
+    LocationItem,
+    find_by_code,
+    get_location_tree,
+    level_items,
+    settlement_parents,
+)
+from services.location_search import search_index
+from services.matching import get_current_user_or_none
+from services.nsfw import download_photo, is_photo_nsfw
 from utils.locations import default_location, normalize_choice, normalize_text
 from utils.text import gender_to_code, looking_for_to_code, render_profile_caption
 
@@ -43,81 +52,37 @@ class Registration(StatesGroup):
     gender = State()
     looking_for = State()
     region = State()
+    region_manual = State()
     district = State()
     hromada = State()
+    hromada_manual = State()
     settlement = State()
+    settlement_manual = State()
     search_scope = State()
     about = State()
     photos = State()
 
 
-async def _get_user_by_tg(session: AsyncSession, tg_id: int) -> Optional[User]:
-    res = await session.execute(select(User).where(User.tg_id == tg_id))
-    return res.scalar_one_or_none()
-
-
 def _clip(text: str, max_len: int = 128) -> str:
     return normalize_text(text)[:max_len]
 
 
 async def _prompt_region(message: Message, state: FSMContext, session: AsyncSession) -> None:
-    repo = LocationRepository(session)
-    regions = await repo.list_regions()
-    await state.update_data(region_options=regions)
+    tree = await get_location_tree(session)
     await message.answer(
         "<b>Крок 5/11</b> — обери область кнопкою або введи вручну:",
-        reply_markup=regions_kb([r.name for r in regions]),
+        reply_markup=regions_kb(tree.regions()),
     )
     await state.set_state(Registration.region)
 
 
 async def _prompt_district(message: Message, state: FSMContext, session: AsyncSession, region_code: str) -> None:
-    repo = LocationRepository(session)
-    districts = await repo.list_districts(region_code)
-    capital_by_region = {
-        "UA05000000000010236": "Вінниця",
-        "UA07000000000024379": "Луцьк",
-        "UA12000000000090473": "Дніпро",
-        "UA14000000000091971": "Донецьк",
-        "UA18000000000041385": "Житомир",
-        "UA21000000000011690": "Ужгород",
-        "UA23000000000064947": "Запоріжжя",
-        "UA26000000000069363": "Івано-Франківськ",
-        "UA32000000000030281": "Київ",
-        "UA35000000000016081": "Кропивницький",
-        "UA44000000000018893": "Луганськ",
-        "UA46000000000026241": "Львів",
-        "UA48000000000039575": "Миколаїв",
-        "UA51000000000030770": "Одеса",
-        "UA53000000000028050": "Полтава",
-        "UA56000000000066151": "Рівне",
-        "UA59000000000057109": "Суми",
-        "UA61000000000060328": "Тернопіль",
-        "UA63000000000041885": "Харків",
-        "UA65000000000030969": "Херсон",
-        "UA68000000000099709": "Хмельницький",
-        "UA71000000000010357": "Черкаси",
-        "UA73000000000044923": "Чернівці",
-        "UA74000000000025378": "Чернігів",
-        "UA01000000000013043": "Сімферополь",
-        "UA85000000000065278": "Севастополь",
-        "UA80000000000093317": "Київ",
-    }
-    capital = capital_by_region.get(region_code)
-    await state.update_data(district_options=districts, region_capital=capital)
-
-    builder = InlineKeyboardBuilder()
-    if capital:
-        builder.button(text=f"м. {capital}", callback_data="loc:d:capital")
-    for idx, d in enumerate(districts):
-        builder.button(text=d.name, callback_data=f"loc:d:{idx}")
-    builder.button(text="Без району", callback_data="loc:d:none")
-    builder.button(text="Назад ↩️", callback_data="loc:d:back")
-    builder.adjust(2)
-
+    tree = await get_location_tree(session)
+    capital = REGION_CAPITALS.get(region_code)
+    await state.update_data(region_capital=capital)
     await message.answer(
         "<b>Крок 6/11</b> — обери район (кнопкою) або «Без району»/«Інше»:",
-        reply_markup=builder.as_markup(),
+        reply_markup=districts_kb(tree.districts(region_code), capital=capital),
     )
     await state.set_state(Registration.district)
 
@@ -125,22 +90,20 @@ async def _prompt_district(message: Message, state: FSMContext, session: AsyncSe
 async def _prompt_hromada(
     message: Message, state: FSMContext, session: AsyncSession, region_code: str, district_code: Optional[str]
 ) -> None:
-    repo = LocationRepository(session)
-    hromadas = await repo.list_hromadas(region_code, district_code or "")
-    await state.update_data(hromada_options=hromadas)
+    tree = await get_location_tree(session)
+    hromadas = level_items(tree, "h", region_code, district_code)
 
     if hromadas:
         await message.answer(
-            "<b>Крок 7/11</b> — обери громаду (кнопкою) або натисни «Назад»:",
-            reply_markup=hromadas_kb([h.name for h in hromadas]),
+            "<b>Крок 7/11</b> — обери громаду (кнопкою, або введи назву) чи натисни «Назад»:",
+            reply_markup=hromadas_kb(hromadas),
         )
-        await state.set_state(Registration.hromada)
     else:
         await message.answer(
             "Немає громад для вибраного району. Натисніть «Назад», щоб повернутись.",
-            reply_markup=hromadas_kb([]),
+            reply_markup=hromadas_kb(()),
         )
-        await state.set_state(Registration.hromada)
+    await state.set_state(Registration.hromada)
 
 
 async def _prompt_settlement(
@@ -150,26 +113,74 @@ async def _prompt_settlement(
     region_code: str,
     district_code: Optional[str],
     hromada_code: Optional[str],
-    categories: set[str] | None = None,
 ) -> None:
-    repo = LocationRepository(session)
-    settlements = await repo.list_settlements(region_code, district_code or None, hromada_code or None, categories=categories)
-    if not settlements and district_code:
-        settlements = await repo.list_settlements_by_district(region_code, district_code, categories=categories)
-    await state.update_data(settlement_options=settlements)
+    tree = await get_location_tree(session)
+    settlements = level_items(tree, "s", region_code, district_code, hromada_code)
 
     if settlements:
         await message.answer(
-            "<b>Крок 8/11</b> — обери населений пункт (кнопкою) або натисни «Назад»:",
-            reply_markup=settlements_kb([s.name for s in settlements]),
+            "<b>Крок 8/11</b> — обери населений пункт (кнопкою, або введи назву) чи натисни «Назад»:",
+            reply_markup=settlements_kb(settlements),
         )
-        await state.set_state(Registration.settlement)
     else:
         await message.answer(
             "Немає населених пунктів у вибраному фільтрі. Натисніть «Назад», щоб повернутись.",
-            reply_markup=settlements_kb([]),
+            reply_markup=settlements_kb(()),
+        )
+    await state.set_state(Registration.settlement)
+
+
+async def _set_settlement(
+    session: AsyncSession, state: FSMContext, region_code: str, item: LocationItem
+) -> None:
+    """Зберігає пункт; район і громаду (якщо їх скинув пошук по області) бере з нього самого."""
+    data = await state.get_data()
+    values = {"settlement": item.name, "settlement_code": item.code}
+    if not data.get("district_code"):
+        district, hromada = settlement_parents(await get_location_tree(session), region_code, item.code)
+        values.update(
+            district=district.name if district else None,
+            district_code=district.code if district else None,
+            hromada=hromada.name if hromada else None,
+            hromada_code=hromada.code if hromada else None,
         )
-        await state.set_state(Registration.settlement)
+    await state.update_data(**values)
+
+
+async def _current_items(session: AsyncSession, state: FSMContext, level: str) -> tuple[LocationItem, ...]:
+    data = await state.get_data()
+    tree = await get_location_tree(session)
+    return level_items(tree, level, data.get("region_code"), data.get("district_code"), data.get("hromada_code"))
+
+
+async def _turn_page(call: CallbackQuery, session: AsyncSession, state: FSMContext, cb: LocationCallback) -> None:
+    items = await _current_items(session, state, cb.level)
+    page = int(cb.value or 0)
+    if cb.level == "r":
+        markup = regions_kb(items, page)
+    elif cb.level == "d":
+        markup = districts_kb(items, page, capital=(await state.get_data()).get("region_capital"))
+    elif cb.level == "h":
+        markup = hromadas_kb(items, page)
+    else:
+        markup = settlements_kb(items, page)
+    try:
+        await call.message.edit_reply_markup(reply_markup=markup)
+    except TelegramBadRequest:
+        pass
+
+
+async def _search_location(
+    session: AsyncSession, scope: tuple, text: str | None
+) -> tuple[Optional[LocationItem], list[LocationItem]]:
+    """Ручне введення назви: (однозначний збіг або None, top-k варіантів)."""
+    tree = await get_location_tree(session)
+    index = search_index(tree, scope)
+    item = index.exact(text)
+    if item is not None:
+        return item, [item]
+    matches = index.search(text)
+    return (matches[0] if len(matches) == 1 else None), matches
 
 
 async def _prompt_search_scope(message: Message, state: FSMContext, current: str | None = None) -> None:
@@ -182,7 +193,7 @@ async def _prompt_search_scope(message: Message, state: FSMContext, current: str
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext, session: AsyncSession, cfg: Config) -> None:
-    user = await _get_user_by_tg(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if user:
         await state.clear()
         await message.answer("У вас вже є анкета.", reply_markup=main_menu_kb())
@@ -263,22 +274,22 @@ async def reg_looking_for(message: Message, state: FSMContext, session: AsyncSes
 
 
 @router.callback_query(Registration.region, F.data.startswith("loc:r:"))
-async def region_pick(call, state: FSMContext, session: AsyncSession) -> None:
+async def region_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    parts = call.data.split(":")
-    action = parts[2]
-    data = await state.get_data()
-    regions = data.get("region_options", [])
+    cb = parse_location_callback(call.data)
 
-    if action == "back":
+    if cb.action == "back":
         await call.message.answer("<b>Крок 4/11</b> — кого шукаєте?", reply_markup=looking_for_kb())
         await state.set_state(Registration.looking_for)
         return
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
 
-    try:
-        idx = int(action)
-        region_item = regions[idx]
-    except Exception:
+    region_item = find_by_code(await _current_items(session, state, "r"), cb.value)
+    if region_item is None:
         await call.message.answer("Помилка вибору області. Введіть вручну.")
         await state.set_state(Registration.region_manual)
         return
@@ -287,18 +298,37 @@ async def region_pick(call, state: FSMContext, session: AsyncSession) -> None:
     await _prompt_district(call.message, state, session, region_item.code)
 
 
+@router.message(Registration.region)
+@router.message(Registration.region_manual)
+async def region_text(message: Message, state: FSMContext, session: AsyncSession) -> None:
+    if _is_back(message):
+        await message.answer("<b>Крок 4/11</b> — кого шукаєте?", reply_markup=looking_for_kb())
+        await state.set_state(Registration.looking_for)
+        return
+
+    item, matches = await _search_location(session, ("regions",), message.text)
+    if item is not None:
+        await state.update_data(region=item.name, region_code=item.code)
+        await _prompt_district(message, state, session, item.code)
+        return
+    if not matches:
+        await message.answer("Не знайшли таку область. Спробуйте ще раз або оберіть кнопкою.")
+        await state.set_state(Registration.region_manual)
+        return
+
+    await message.answer("Можливо, ви мали на увазі:", reply_markup=regions_kb(matches))
+    await state.set_state(Registration.region)
+
+
 @router.callback_query(Registration.district, F.data.startswith("loc:d:"))
-async def district_pick(call, state: FSMContext, session: AsyncSession) -> None:
+async def district_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    parts = call.data.split(":")
-    action = parts[2]
-    idx_part = parts[3] if len(parts) > 3 else None
+    cb = parse_location_callback(call.data)
     data = await state.get_data()
-    districts = data.get("district_options", [])
     region_code = data.get("region_code")
     capital = data.get("region_capital")
 
-    if action == "capital" and capital:
+    if cb.action == "capital" and capital:
         await state.update_data(
             district=None,
             district_code=None,
@@ -309,40 +339,47 @@ async def district_pick(call, state: FSMContext, session: AsyncSession) -> None:
         )
         await _prompt_search_scope(call.message, state)
         return
-    if action == "back":
+    if cb.action == "back":
         await _prompt_region(call.message, state, session)
         return
-    if action == "none":
-        await state.update_data(district=None, district_code=None)
+    if cb.action == "none":
+        await state.update_data(district=None, district_code=None, hromada=None, hromada_code=None)
         await _prompt_settlement(call.message, state, session, region_code, None, None)
         return
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
 
-    try:
-        idx = int(idx_part or action)
-        district_item = districts[idx]
-    except Exception:
+    district_item = find_by_code(await _current_items(session, state, "d"), cb.value)
+    if district_item is None:
         await call.message.answer("Помилка вибору району. Спробуйте ще раз або натисніть «Назад».")
         return
 
-    await state.update_data(district=district_item.name, district_code=district_item.code)
+    await state.update_data(
+        district=district_item.name, district_code=district_item.code, hromada=None, hromada_code=None
+    )
     await _prompt_hromada(call.message, state, session, region_code, district_item.code)
 
 
 @router.callback_query(Registration.hromada, F.data.startswith("loc:h:"))
-async def hromada_pick(call, state: FSMContext, session: AsyncSession) -> None:
+async def hromada_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    _, _, raw = call.data.split(":", 2)
+    cb = parse_location_callback(call.data)
     data = await state.get_data()
-    hromadas = data.get("hromada_options", [])
 
-    if raw == "back":
+    if cb.action == "back":
         await _prompt_district(call.message, state, session, data.get("region_code"))
         return
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
 
-    try:
-        idx = int(raw)
-        hromada_item = hromadas[idx]
-    except Exception:
+    hromada_item = find_by_code(await _current_items(session, state, "h"), cb.value)
+    if hromada_item is None:
         await call.message.answer("Помилка вибору громади. Введіть вручну.")
         await state.set_state(Registration.hromada_manual)
         return
@@ -358,30 +395,93 @@ async def hromada_pick(call, state: FSMContext, session: AsyncSession) -> None:
     )
 
 
+@router.message(Registration.hromada)
+@router.message(Registration.hromada_manual)
+async def hromada_text(message: Message, state: FSMContext, session: AsyncSession) -> None:
+    data = await state.get_data()
+    if _is_back(message):
+        await _prompt_district(message, state, session, data.get("region_code"))
+        return
+    region_code = data.get("region_code")
+    district_code = data.get("district_code")
+    if not region_code or not district_code:
+        await message.answer("Спершу оберіть район або натисніть «Назад».")
+        return
+
+    item, matches = await _search_location(session, ("hromadas", region_code, district_code), message.text)
+    if item is not None:
+        await state.update_data(hromada=item.name, hromada_code=item.code)
+        await _prompt_settlement(message, state, session, region_code, district_code, item.code)
+        return
+    if not matches:
+        await message.answer("Не знайшли таку громаду в цьому районі. Спробуйте ще раз або оберіть кнопкою.")
+        await state.set_state(Registration.hromada_manual)
+        return
+
+    await message.answer("Можливо, ви мали на увазі:", reply_markup=hromadas_kb(matches))
+    await state.set_state(Registration.hromada)
+
+
 @router.callback_query(Registration.settlement, F.data.startswith("loc:s:"))
-async def settlement_pick(call, state: FSMContext, session: AsyncSession) -> None:
+async def settlement_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    _, _, raw = call.data.split(":", 2)
+    cb = parse_location_callback(call.data)
     data = await state.get_data()
-    settlements = data.get("settlement_options", [])
 
-    if raw == "back":
+    if cb.action == "back":
         await _prompt_hromada(
             call.message, state, session, data.get("region_code"), data.get("district_code")
         )
         return
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
 
-    try:
-        idx = int(raw)
-        settlement_item = settlements[idx]
-    except Exception:
+    settlement_item = find_by_code(await _current_items(session, state, "s"), cb.value)
+    if settlement_item is None:
         await call.message.answer("Помилка вибору. Введіть населений пункт вручну.")
         await state.set_state(Registration.settlement_manual)
         return
 
-    await state.update_data(settlement=settlement_item.name, settlement_code=settlement_item.code)
+    await _set_settlement(session, state, data.get("region_code"), settlement_item)
     await _prompt_search_scope(call.message, state)
 
+
+@router.message(Registration.settlement)
+@router.message(Registration.settlement_manual)
+async def settlement_text(message: Message, state: FSMContext, session: AsyncSession) -> None:
+    data = await state.get_data()
+    region_code = data.get("region_code")
+    if _is_back(message):
+        await _prompt_hromada(message, state, session, region_code, data.get("district_code"))
+        return
+    if not region_code:
+        await _prompt_region(message, state, session)
+        return
+
+    scope = ("settlements", region_code, data.get("district_code"), data.get("hromada_code"))
+    item, matches = await _search_location(session, scope, message.text)
+    if not matches and (data.get("district_code") or data.get("hromada_code")):
+        # Не знайшли в обраних районі/громаді — шукаємо по всій області.
+        item, matches = await _search_location(session, ("settlements", region_code, None, None), message.text)
+        if matches:
+            # Кнопки варіантів — з усієї області; район і громаду відновить _set_settlement.
+            await state.update_data(district=None, district_code=None, hromada=None, hromada_code=None)
+    if item is not None:
+        await _set_settlement(session, state, region_code, item)
+        await _prompt_search_scope(message, state)
+        return
+    if not matches:
+        await message.answer("Не знайшли такий населений пункт. Спробуйте ще раз або оберіть кнопкою.")
+        await state.set_state(Registration.settlement_manual)
+        return
+
+    await message.answer("Можливо, ви мали на увазі:", reply_markup=settlements_kb(matches))
+    await state.set_state(Registration.settlement)
+
+
 @router.callback_query(Registration.search_scope, F.data.startswith("loc:scope:"))
 async def search_scope_pick(call, state: FSMContext) -> None:
     await call.answer()
@@ -448,17 +548,15 @@ async def reg_photo(message: Message, state: FSMContext, session: AsyncSession)
 
     file_id = message.photo[-1].file_id
 
-    tmp_path = await download_photo_to_tmp(message.bot, file_id)
+    photo = await download_photo(message.bot, file_id)
     try:
-        if await is_photo_nsfw(tmp_path):
+        if await is_photo_nsfw(photo):
             await message.answer("🔞Цю фотографію неможливо завантажити.\n Спробуйте іншу фотографію.")
             return
     except Exception:
         logger.exception("NSFW check failed for onboarding photo")
         await message.answer("Сталася помилка під час перевірки фото. Спробуйте інше фото, будь ласка.")
         return
-    finally:
-        Path(tmp_path).unlink(missing_ok=True)
 
     file_ids.append(file_id)
 
@@ -4,20 +4,26 @@ import logging
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-from pathlib import Path
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
 from app.config import Config
 from keyboards.inline_profiles import confirm_delete_kb, gender_kb, looking_for_kb, profile_manage_kb
 from keyboards.main_menu import BTN_PROFILE, main_menu_kb
-from keyboards.locations import districts_kb, hromadas_kb, regions_kb, settlements_kb
+from keyboards.locations import (
+    REGION_CAPITALS,
+    LocationCallback,
+    districts_kb,
+    hromadas_kb,
+    parse_location_callback,
+    regions_kb,
+    settlements_kb,
+)
 from models import Photo, User
-from services.location_repo import LocationRepository
-from services.nsfw import download_photo_to_tmp, is_photo_nsfw
+from services.candidate_queue import CandidateQueue
+from services.location_repo import LocationItem, find_by_code, get_location_tree, level_items
+from services.nsfw import download_photo, is_photo_nsfw
 from services.matching import delete_user_account, get_current_user_or_none
 from utils.text import gender_to_code, looking_for_to_code, render_profile_caption
 
@@ -43,13 +49,6 @@ class EditProfile(StatesGroup):
     photo = State()
 
 
-async def _load_user(session: AsyncSession, tg_id: int) -> User | None:
-    res = await session.execute(
-        select(User).options(selectinload(User.photos)).where(User.tg_id == tg_id)
-    )
-    return res.scalar_one_or_none()
-
-
 async def _send_profile(message: Message, user: User) -> None:
     photo_id = None
     for p in user.photos:
@@ -68,7 +67,7 @@ async def _send_profile(message: Message, user: User) -> None:
 @router.message(F.text.in_({BTN_PROFILE, "Моя анкета"}))
 async def my_profile(message: Message, session: AsyncSession, state: FSMContext) -> None:
     await state.clear()
-    user = await _load_user(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id)
     if not user:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -89,7 +88,7 @@ async def edit_name_save(message: Message, session: AsyncSession, state: FSMCont
         await message.answer("Закоротко. Введіть ім'я (мінімум 2 символи).")
         return
 
-    user = await get_current_user_or_none(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not user:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -119,7 +118,7 @@ async def edit_age_save(message: Message, session: AsyncSession, state: FSMConte
         await message.answer("Вік має бути від 16 до 99.")
         return
 
-    user = await get_current_user_or_none(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not user:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -144,7 +143,7 @@ async def edit_gender_save(message: Message, session: AsyncSession, state: FSMCo
         await message.answer("Оберіть стать кнопкою нижче:", reply_markup=gender_kb())
         return
 
-    user = await get_current_user_or_none(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not user:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -169,7 +168,7 @@ async def edit_looking_for_save(message: Message, session: AsyncSession, state:
         await message.answer("Оберіть варіант кнопкою нижче:", reply_markup=looking_for_kb())
         return
 
-    user = await get_current_user_or_none(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not user:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -183,7 +182,7 @@ async def edit_looking_for_save(message: Message, session: AsyncSession, state:
 @router.callback_query(F.data == "profile:edit_city")
 async def edit_city(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    user = await get_current_user_or_none(session, call.from_user.id)
+    user = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not user:
         await state.clear()
         await call.message.answer("Анкету не знайдено, спробуйте /start.")
@@ -193,80 +192,34 @@ async def edit_city(call: CallbackQuery, state: FSMContext, session: AsyncSessio
 
 
 async def _prompt_region_edit(message: Message, state: FSMContext, session: AsyncSession) -> None:
-    repo = LocationRepository(session)
-    regions = await repo.list_regions()
-    await state.update_data(region_options=regions)
-    await message.answer("Оберіть область кнопкою:", reply_markup=regions_kb([r.name for r in regions]))
+    tree = await get_location_tree(session)
+    await message.answer("Оберіть область кнопкою:", reply_markup=regions_kb(tree.regions()))
     await state.set_state(EditProfile.region)
 
 
 async def _prompt_district_edit(
     message: Message, state: FSMContext, session: AsyncSession, region_code: str
 ) -> None:
-    repo = LocationRepository(session)
-    districts = await repo.list_districts(region_code)
-    capital_by_region = {
-        "UA05000000000010236": "Вінниця",
-        "UA07000000000024379": "Луцьк",
-        "UA12000000000090473": "Дніпро",
-        "UA14000000000091971": "Донецьк",
-        "UA18000000000041385": "Житомир",
-        "UA21000000000011690": "Ужгород",
-        "UA23000000000064947": "Запоріжжя",
-        "UA26000000000069363": "Івано-Франківськ",
-        "UA32000000000030281": "Київ",
-        "UA35000000000016081": "Кропивницький",
-        "UA44000000000018893": "Луганськ",
-        "UA46000000000026241": "Львів",
-        "UA48000000000039575": "Миколаїв",
-        "UA51000000000030770": "Одеса",
-        "UA53000000000028050": "Полтава",
-        "UA56000000000066151": "Рівне",
-        "UA59000000000057109": "Суми",
-        "UA61000000000060328": "Тернопіль",
-        "UA63000000000041885": "Харків",
-        "UA65000000000030969": "Херсон",
-        "UA68000000000099709": "Хмельницький",
-        "UA71000000000010357": "Черкаси",
-        "UA73000000000044923": "Чернівці",
-        "UA74000000000025378": "Чернігів",
-        "UA01000000000013043": "Сімферополь",
-        "UA85000000000065278": "Севастополь",
-        "UA80000000000093317": "Київ",
-    }
-    capital = capital_by_region.get(region_code)
-    await state.update_data(district_options=districts, region_capital=capital, region_code=region_code)
-
-    builder = InlineKeyboardBuilder()
-    if capital:
-        builder.button(text=f"м. {capital}", callback_data="loc:d:capital")
-    for idx, d in enumerate(districts):
-        builder.button(text=d.name, callback_data=f"loc:d:{idx}")
-    builder.button(text="Без району", callback_data="loc:d:none")
-    builder.button(text="Назад ↩️", callback_data="loc:d:back")
-    builder.adjust(2)
-
-    await message.answer("Оберіть район (кнопкою) або «Без району»:", reply_markup=builder.as_markup())
+    tree = await get_location_tree(session)
+    capital = REGION_CAPITALS.get(region_code)
+    await state.update_data(region_capital=capital, region_code=region_code)
+    await message.answer(
+        "Оберіть район (кнопкою) або «Без району»:",
+        reply_markup=districts_kb(tree.districts(region_code), capital=capital),
+    )
     await state.set_state(EditProfile.district)
 
 
 async def _prompt_hromada_edit(
     message: Message, state: FSMContext, session: AsyncSession, region_code: str, district_code: str | None
 ) -> None:
-    repo = LocationRepository(session)
-    hromadas = await repo.list_hromadas(region_code, district_code or "")
-    await state.update_data(hromada_options=hromadas)
-
-    builder = InlineKeyboardBuilder()
-    for idx, h in enumerate(hromadas):
-        builder.button(text=h.name, callback_data=f"loc:h:{idx}")
-    builder.button(text="Назад ↩️", callback_data="loc:h:back")
-    builder.adjust(2)
+    tree = await get_location_tree(session)
+    hromadas = level_items(tree, "h", region_code, district_code)
 
     if hromadas:
-        await message.answer("Оберіть громаду (кнопкою):", reply_markup=builder.as_markup())
+        await message.answer("Оберіть громаду (кнопкою):", reply_markup=hromadas_kb(hromadas))
     else:
-        await message.answer("Громад не знайдено. Натисніть «Назад».", reply_markup=builder.as_markup())
+        await message.answer("Громад не знайдено. Натисніть «Назад».", reply_markup=hromadas_kb(()))
     await state.set_state(EditProfile.hromada)
 
 
@@ -277,31 +230,44 @@ async def _prompt_settlement_edit(
     region_code: str,
     district_code: str | None,
     hromada_code: str | None,
-    categories: set[str] | None = None,
 ) -> None:
-    repo = LocationRepository(session)
-    settlements = await repo.list_settlements(region_code, district_code or None, hromada_code or None, categories=categories)
-    if not settlements and district_code:
-        settlements = await repo.list_settlements_by_district(region_code, district_code, categories=categories)
-    await state.update_data(settlement_options=settlements)
-
-    builder = InlineKeyboardBuilder()
-    for idx, s in enumerate(settlements):
-        builder.button(text=s.name, callback_data=f"loc:s:{idx}")
-    builder.button(text="Назад ↩️", callback_data="loc:s:back")
-    builder.adjust(2)
+    tree = await get_location_tree(session)
+    settlements = level_items(tree, "s", region_code, district_code, hromada_code)
 
     if settlements:
-        await message.answer("Оберіть населений пункт (кнопкою):", reply_markup=builder.as_markup())
+        await message.answer("Оберіть населений пункт (кнопкою):", reply_markup=settlements_kb(settlements))
     else:
-        await message.answer("Населених пунктів не знайдено. Натисніть «Назад».", reply_markup=builder.as_markup())
+        await message.answer("Населених пунктів не знайдено. Натисніть «Назад».", reply_markup=settlements_kb(()))
     await state.set_state(EditProfile.settlement)
 
 
+async def _current_items(session: AsyncSession, state: FSMContext, level: str) -> tuple[LocationItem, ...]:
+    data = await state.get_data()
+    tree = await get_location_tree(session)
+    return level_items(tree, level, data.get("region_code"), data.get("district_code"), data.get("hromada_code"))
+
+
+async def _turn_page(call: CallbackQuery, session: AsyncSession, state: FSMContext, cb: LocationCallback) -> None:
+    items = await _current_items(session, state, cb.level)
+    page = int(cb.value or 0)
+    if cb.level == "r":
+        markup = regions_kb(items, page)
+    elif cb.level == "d":
+        markup = districts_kb(items, page, capital=(await state.get_data()).get("region_capital"))
+    elif cb.level == "h":
+        markup = hromadas_kb(items, page)
+    else:
+        markup = settlements_kb(items, page)
+    try:
+        await call.message.edit_reply_markup(reply_markup=markup)
+    except TelegramBadRequest:
+        pass
+
+
 async def _save_location_and_finish(message: Message, state: FSMContext, session: AsyncSession) -> None:
     data = await state.get_data()
     tg_id = getattr(getattr(message, "chat", None), "id", None) or getattr(message.from_user, "id", None)
-    user = await get_current_user_or_none(session, tg_id)
+    user = await get_current_user_or_none(session, tg_id, photos=False)
     if not user:
         await message.answer("Анкету не знайдено, спробуйте /start.")
         await state.clear()
@@ -322,19 +288,20 @@ async def _save_location_and_finish(message: Message, state: FSMContext, session
 @router.callback_query(EditProfile.region, F.data.startswith("loc:r:"))
 async def region_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    action = call.data.split(":")[2]
-    data = await state.get_data()
-    regions = data.get("region_options", [])
+    cb = parse_location_callback(call.data)
 
-    if action == "back":
+    if cb.action == "back":
         await state.clear()
         await call.message.answer("Скасовано.", reply_markup=profile_manage_kb())
         return
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
 
-    try:
-        idx = int(action)
-        region_item = regions[idx]
-    except Exception:
+    region_item = find_by_code(await _current_items(session, state, "r"), cb.value)
+    if region_item is None:
         await call.message.answer("Не вдалося розпізнати область. Спробуйте ще раз.")
         return
 
@@ -345,15 +312,12 @@ async def region_pick(call: CallbackQuery, state: FSMContext, session: AsyncSess
 @router.callback_query(EditProfile.district, F.data.startswith("loc:d:"))
 async def district_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    parts = call.data.split(":")
-    action = parts[2]
-    idx_part = parts[3] if len(parts) > 3 else None
+    cb = parse_location_callback(call.data)
     data = await state.get_data()
-    districts = data.get("district_options", [])
     region_code = data.get("region_code")
     capital = data.get("region_capital")
 
-    if action == "capital" and capital:
+    if cb.action == "capital" and capital:
         await state.update_data(
             district=None,
             district_code=None,
@@ -365,43 +329,51 @@ async def district_pick(call: CallbackQuery, state: FSMContext, session: AsyncSe
         await _save_location_and_finish(call.message, state, session)
         return
 
-    if action == "back":
+    if cb.action == "back":
         await _prompt_region_edit(call.message, state, session)
         return
 
-    if action == "none":
-        await state.update_data(district=None, district_code=None)
+    if cb.action == "none":
+        await state.update_data(district=None, district_code=None, hromada=None, hromada_code=None)
         await _prompt_settlement_edit(call.message, state, session, region_code, None, None)
         return
 
-    try:
-        idx = int(idx_part or action)
-        district_item = districts[idx]
-    except Exception:
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
+
+    district_item = find_by_code(await _current_items(session, state, "d"), cb.value)
+    if district_item is None:
         await call.message.answer("Не вдалося розпізнати район. Спробуйте ще раз.")
         return
 
-    await state.update_data(district=district_item.name, district_code=district_item.code)
+    await state.update_data(
+        district=district_item.name, district_code=district_item.code, hromada=None, hromada_code=None
+    )
     await _prompt_hromada_edit(call.message, state, session, region_code, district_item.code)
 
 
 @router.callback_query(EditProfile.hromada, F.data.startswith("loc:h:"))
 async def hromada_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    _, _, raw = call.data.split(":", 2)
+    cb = parse_location_callback(call.data)
     data = await state.get_data()
-    hromadas = data.get("hromada_options", [])
     region_code = data.get("region_code")
     district_code = data.get("district_code")
 
-    if raw == "back":
+    if cb.action == "back":
         await _prompt_district_edit(call.message, state, session, region_code)
         return
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
 
-    try:
-        idx = int(raw)
-        hromada_item = hromadas[idx]
-    except Exception:
+    hromada_item = find_by_code(await _current_items(session, state, "h"), cb.value)
+    if hromada_item is None:
         await call.message.answer("Не вдалося розпізнати громаду. Спробуйте ще раз.")
         return
 
@@ -412,21 +384,22 @@ async def hromada_pick(call: CallbackQuery, state: FSMContext, session: AsyncSes
 @router.callback_query(EditProfile.settlement, F.data.startswith("loc:s:"))
 async def settlement_pick(call: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
     await call.answer()
-    _, _, raw = call.data.split(":", 2)
+    cb = parse_location_callback(call.data)
     data = await state.get_data()
-    settlements = data.get("settlement_options", [])
     region_code = data.get("region_code")
     district_code = data.get("district_code")
-    hromada_code = data.get("hromada_code")
 
-    if raw == "back":
+    if cb.action == "back":
         await _prompt_hromada_edit(call.message, state, session, region_code, district_code)
         return
+    if cb.action == "pg":
+        await _turn_page(call, session, state, cb)
+        return
+    if cb.action != "c":
+        return
 
-    try:
-        idx = int(raw)
-        settlement_item = settlements[idx]
-    except Exception:
+    settlement_item = find_by_code(await _current_items(session, state, "s"), cb.value)
+    if settlement_item is None:
         await call.message.answer("Не вдалося розпізнати населений пункт. Спробуйте ще раз.")
         return
 
@@ -453,7 +426,7 @@ async def edit_about_save(message: Message, session: AsyncSession, state: FSMCon
         await message.answer(f"Закоротко. Мінімум {cfg.about_min_len} символів або «-» щоб очистити.")
         return
 
-    user = await get_current_user_or_none(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id, photos=False)
     if not user:
         await message.answer("Спочатку створіть анкету: /start")
         return
@@ -473,24 +446,22 @@ async def edit_photo(call: CallbackQuery, state: FSMContext) -> None:
 
 @router.message(EditProfile.photo, F.photo)
 async def edit_photo_save(message: Message, session: AsyncSession, state: FSMContext) -> None:
-    user = await _load_user(session, message.from_user.id)
+    user = await get_current_user_or_none(session, message.from_user.id)
     if not user:
         await message.answer("Спочатку створіть анкету: /start")
         return
 
     new_file_id = message.photo[-1].file_id
 
-    tmp_path = await download_photo_to_tmp(message.bot, new_file_id)
+    photo = await download_photo(message.bot, new_file_id)
     try:
-        if await is_photo_nsfw(tmp_path):
+        if await is_photo_nsfw(photo):
             await message.answer("🔞Цю фотографію неможливо завантажити.\n Спробуйте іншу фотографію.")
             return
     except Exception:
         logger.exception("NSFW check failed for profile photo")
         await message.answer("??????? ??????? ??? ??? ????????? ????. ????????? ???? ????, ???? ?????.")
         return
-    finally:
-        Path(tmp_path).unlink(missing_ok=True)
 
     for p in user.photos:
         p.is_main = False
@@ -517,9 +488,14 @@ async def delete_prompt(call: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data == "profile_delete:yes")
-async def delete_yes(call: CallbackQuery, session: AsyncSession, state: FSMContext) -> None:
+async def delete_yes(
+    call: CallbackQuery, session: AsyncSession, state: FSMContext, candidate_queue: CandidateQueue
+) -> None:
     await call.answer()
-    await delete_user_account(session, call.from_user.id)
+    deleted_id = await delete_user_account(session, call.from_user.id)
+    if deleted_id is not None:
+        candidate_queue.reset(deleted_id)
+        candidate_queue.drop_target(deleted_id)
     await state.clear()
     await call.message.answer("Анкету видалено. Щоб створити нову — /start", reply_markup=main_menu_kb())
 
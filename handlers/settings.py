@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from keyboards.main_menu import BTN_SETTINGS
 from keyboards.settings import open_settings_kb, settings_kb
+from services.candidate_queue import CandidateQueue
 from services.matching import get_current_user_or_none
 from utils.text import format_location
 
@@ -35,7 +36,7 @@ def _current_scope(user) -> str:
 
 
 async def _send_settings(message_or_call, session: AsyncSession) -> None:
-    cur = await get_current_user_or_none(session, message_or_call.from_user.id)
+    cur = await get_current_user_or_none(session, message_or_call.from_user.id, photos=False)
     if not cur:
         target = message_or_call.message if hasattr(message_or_call, "message") else message_or_call
         await target.answer("Спочатку створіть анкету: /start")
@@ -78,7 +79,7 @@ async def settings_open(call: CallbackQuery, session: AsyncSession) -> None:
 @router.callback_query(F.data == "settings:toggle_scope")
 async def toggle_scope(call: CallbackQuery, session: AsyncSession) -> None:
     await call.answer()
-    cur = await get_current_user_or_none(session, call.from_user.id)
+    cur = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not cur:
         await call.message.answer("Спочатку створіть анкету: /start")
         return
@@ -100,15 +101,17 @@ async def toggle_scope(call: CallbackQuery, session: AsyncSession) -> None:
 
 
 @router.callback_query(F.data == "settings:toggle_active")
-async def toggle_active(call: CallbackQuery, session: AsyncSession) -> None:
+async def toggle_active(call: CallbackQuery, session: AsyncSession, candidate_queue: CandidateQueue) -> None:
     await call.answer()
-    cur = await get_current_user_or_none(session, call.from_user.id)
+    cur = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not cur:
         await call.message.answer("Спочатку створіть анкету: /start")
         return
 
     cur.active = not cur.active
     await session.commit()
+    if not cur.active:
+        candidate_queue.drop_target(cur.id)
 
     await call.message.edit_reply_markup(
         reply_markup=settings_kb(_current_scope(cur), cur.active, getattr(cur, "age_filter_enabled", True)),
@@ -118,7 +121,7 @@ async def toggle_active(call: CallbackQuery, session: AsyncSession) -> None:
 @router.callback_query(F.data == "settings:toggle_age_filter")
 async def toggle_age_filter(call: CallbackQuery, session: AsyncSession) -> None:
     await call.answer()
-    cur = await get_current_user_or_none(session, call.from_user.id)
+    cur = await get_current_user_or_none(session, call.from_user.id, photos=False)
     if not cur:
         await call.message.answer("Спочатку створіть анкету: /start")
         return
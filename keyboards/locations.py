@@ -1,46 +1,147 @@
-from typing import Optional
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Sequence
 
 from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from services.location_repo import LocationItem
 
-def regions_kb(regions: list[str]) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    for idx, name in enumerate(regions):
-        builder.button(text=name, callback_data=f"loc:r:{idx}")
-    builder.button(text="Назад ↩️", callback_data="loc:r:back")
-    builder.adjust(2)
-    return builder.as_markup()
+# 10 рядків по 2 кнопки + навігація: далеко від ліміту Telegram на розмітку.
+PAGE_SIZE = 20
 
+REGION_CAPITALS = {
+    "UA05000000000010236": "Вінниця",
+    "UA07000000000024379": "Луцьк",
+    "UA12000000000090473": "Дніпро",
+    "UA14000000000091971": "Донецьк",
+    "UA18000000000041385": "Житомир",
+    "UA21000000000011690": "Ужгород",
+    "UA23000000000064947": "Запоріжжя",
+    "UA26000000000069363": "Івано-Франківськ",
+    "UA32000000000030281": "Київ",
+    "UA35000000000016081": "Кропивницький",
+    "UA44000000000018893": "Луганськ",
+    "UA46000000000026241": "Львів",
+    "UA48000000000039575": "Миколаїв",
+    "UA51000000000030770": "Одеса",
+    "UA53000000000028050": "Полтава",
+    "UA56000000000066151": "Рівне",
+    "UA59000000000057109": "Суми",
+    "UA61000000000060328": "Тернопіль",
+    "UA63000000000041885": "Харків",
+    "UA65000000000030969": "Херсон",
+    "UA68000000000099709": "Хмельницький",
+    "UA71000000000010357": "Черкаси",
+    "UA73000000000044923": "Чернівці",
+    "UA74000000000025378": "Чернігів",
+    "UA01000000000013043": "Сімферополь",
+    "UA85000000000065278": "Севастополь",
+    "UA80000000000093317": "Київ",
+}
 
-def districts_kb(districts: list[str]) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    for idx, name in enumerate(districts):
-        builder.button(text=name, callback_data=f"loc:d:{idx}")
-    builder.button(text="Без району", callback_data="loc:d:none")
-    builder.button(text="Назад ↩️", callback_data="loc:d:back")
-    builder.adjust(2)
-    return builder.as_markup()
+_DIGITS36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+_KATOTTG_DIGITS = 17
 
 
-def hromadas_kb(hromadas: list[str]) -> InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    for idx, name in enumerate(hromadas):
-        builder.button(text=name, callback_data=f"loc:h:{idx}")
-    builder.button(text="Назад ↩️", callback_data="loc:h:back")
-    builder.adjust(2)
-    return builder.as_markup()
+def encode_code(code: str) -> str:
+    """UA + 17 цифр КАТОТТГ -> base36 (11 символів). Інші коди — як є з префіксом '_'."""
+    digits = code[2:]
+    if not (code.startswith("UA") and len(digits) == _KATOTTG_DIGITS and digits.isdigit()):
+        return f"_{code}"
+    value = int(digits)
+    out = []
+    while True:
+        value, rem = divmod(value, 36)
+        out.append(_DIGITS36[rem])
+        if not value:
+            break
+    return "".join(reversed(out))
+
+
+def decode_code(token: str) -> str:
+    if token.startswith("_"):
+        return token[1:]
+    return "UA" + str(int(token, 36)).zfill(_KATOTTG_DIGITS)
+
+
+@dataclass(frozen=True)
+class LocationCallback:
+    level: str  # r / d / h / s
+    action: str  # c (вибір коду) / pg / back / none / capital / noop
+    value: Optional[str] = None
 
 
-def settlements_kb(settlements: list[str]) -> InlineKeyboardMarkup:
+def parse_location_callback(data: str | None) -> LocationCallback:
+    """loc:<level>:c:<base36> | loc:<level>:pg:<n> | loc:<level>:<action>."""
+    parts = (data or "").split(":", 3)
+    level = parts[1] if len(parts) > 1 else ""
+    action = parts[2] if len(parts) > 2 else ""
+    value = parts[3] if len(parts) > 3 else None
+    if action == "c" and value:
+        try:
+            value = decode_code(value)
+        except ValueError:
+            action, value = "", None
+    return LocationCallback(level=level, action=action, value=value)
+
+
+def location_page_kb(
+    level: str,
+    items: Sequence[LocationItem],
+    page: int = 0,
+    *,
+    before: Sequence[tuple[str, str]] = (),
+    after: Sequence[tuple[str, str]] = (),
+    page_size: int = PAGE_SIZE,
+) -> InlineKeyboardMarkup:
+    """Одна сторінка списку локацій. before/after — (text, action) службові кнопки."""
+    pages = max(1, (len(items) + page_size - 1) // page_size)
+    page = min(max(0, int(page)), pages - 1)
+    chunk = items[page * page_size : (page + 1) * page_size]
+
     builder = InlineKeyboardBuilder()
-    for idx, name in enumerate(settlements):
-        builder.button(text=name, callback_data=f"loc:s:{idx}")
-    builder.button(text="Назад ↩️", callback_data="loc:s:back")
-    builder.adjust(2)
+    sizes: list[int] = []
+    for text, action in before:
+        builder.button(text=text, callback_data=f"loc:{level}:{action}")
+    sizes.extend([2] * ((len(before) + 1) // 2))
+    for item in chunk:
+        builder.button(text=item.name, callback_data=f"loc:{level}:c:{encode_code(item.code)}")
+    sizes.extend([2] * ((len(chunk) + 1) // 2))
+    if pages > 1:
+        builder.button(text="◀️", callback_data=f"loc:{level}:pg:{(page - 1) % pages}")
+        builder.button(text=f"{page + 1}/{pages}", callback_data=f"loc:{level}:noop")
+        builder.button(text="▶️", callback_data=f"loc:{level}:pg:{(page + 1) % pages}")
+        sizes.append(3)
+    for text, action in after:
+        builder.button(text=text, callback_data=f"loc:{level}:{action}")
+    sizes.extend([2] * ((len(after) + 1) // 2))
+    builder.adjust(*sizes)
     return builder.as_markup()
 
 
+def regions_kb(regions: Sequence[LocationItem], page: int = 0) -> InlineKeyboardMarkup:
+    return location_page_kb("r", regions, page, after=[("Назад ↩️", "back")])
+
+
+def districts_kb(
+    districts: Sequence[LocationItem], page: int = 0, capital: Optional[str] = None
+) -> InlineKeyboardMarkup:
+    before = [(f"м. {capital}", "capital")] if capital else []
+    return location_page_kb(
+        "d", districts, page, before=before, after=[("Без району", "none"), ("Назад ↩️", "back")]
+    )
+
+
+def hromadas_kb(hromadas: Sequence[LocationItem], page: int = 0) -> InlineKeyboardMarkup:
+    return location_page_kb("h", hromadas, page, after=[("Назад ↩️", "back")])
+
+
+def settlements_kb(settlements: Sequence[LocationItem], page: int = 0) -> InlineKeyboardMarkup:
+    return location_page_kb("s", settlements, page, after=[("Назад ↩️", "back")])
+
+
 def search_scope_kb(current: Optional[str] = None) -> InlineKeyboardMarkup:
     labels = {
         "settlement": "Тільки в цьому населеному пункті",
@@ -6,11 +6,15 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from app.config import load_config
-from db import DbSessionMiddleware, create_engine, create_sessionmaker, init_db
+from db import DbSessionMiddleware, EngineProfile, create_engine, create_sessionmaker, init_db
+from services import antiflood, moderation, notification_outbox, send_scheduler
+from services.candidate_queue import CandidateQueue
 from services.daily_reset import daily_reset_loop
+from services.fsm_storage import CoalescingStorage, FsmFlushMiddleware, build_storage, fsm_expiry_loop
+from services.location_repo import preload_location_tree
+from services.log_retention import action_log_retention_loop
 
 from handlers.onboarding import router as onboarding_router
 from handlers.profile import router as profile_router
@@ -30,16 +34,27 @@ async def main() -> None:
 
     cfg = load_config()
 
-    engine = create_engine(cfg.database_url)
+    engine = create_engine(cfg.database_url, EngineProfile.from_settings(cfg))
     sessionmaker = create_sessionmaker(engine)
-    await init_db(engine)
+    await init_db(engine, cfg.db_schema_mode)
+    await preload_location_tree(sessionmaker)
 
     bot = Bot(
         token=cfg.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
-    dp = Dispatcher(storage=MemoryStorage())
+    fsm_storage = CoalescingStorage(
+        build_storage(
+            cfg.fsm_storage,
+            sessionmaker=sessionmaker,
+            redis_url=cfg.redis_url,
+            ttl_seconds=cfg.fsm_ttl_hours * 3600,
+        )
+    )
+    dp = Dispatcher(storage=fsm_storage, disable_fsm=True)
+    dp.fsm = FsmFlushMiddleware(fsm_storage)
+    dp.update.outer_middleware(dp.fsm)
     dp.update.middleware(DbSessionMiddleware(sessionmaker))
 
     dp.include_router(common_router)
@@ -51,6 +66,16 @@ async def main() -> None:
     dp.include_router(settings_router)
     dp.include_router(admin_router)
 
+    candidate_queue = CandidateQueue(
+        sessionmaker,
+        batch_size=cfg.candidate_batch_size,
+        low_watermark=cfg.candidate_refill_at,
+    )
+    antiflood.configure(
+        antiflood.build_backend(cfg.rate_limit_backend, cfg.redis_url),
+        audit_sessionmaker=sessionmaker if cfg.action_log_audit else None,
+    )
+
     # Ежедневный сброс истории лайков/скипов в 08:00 (Europe/Kyiv).
     # Включается/настраивается через .env: DAILY_RESET_*
     if cfg.reset_enabled:
@@ -64,7 +89,42 @@ async def main() -> None:
             )
         )
 
-    await dp.start_polling(bot, cfg=cfg)
+    # Фонове прибирання action_logs (замість DELETE на кожен запис).
+    if cfg.action_log_purge_enabled:
+        asyncio.create_task(
+            action_log_retention_loop(
+                sessionmaker,
+                interval_seconds=cfg.action_log_purge_interval_min * 60,
+                retention_days=cfg.action_log_retention_days,
+                chunk_size=cfg.action_log_purge_chunk,
+            )
+        )
+
+    asyncio.create_task(fsm_expiry_loop(fsm_storage))
+
+    # Доставка сповіщень про лайки/мэтчі з notification_outbox (через спільний ліміт відправок).
+    send_scheduler.configure(rate=cfg.tg_send_rate, chat_interval=cfg.tg_send_chat_interval)
+    outbox = notification_outbox.OutboxDispatcher(
+        sessionmaker,
+        bot,
+        concurrency=cfg.outbox_concurrency,
+        batch_size=cfg.outbox_batch_size,
+        poll_seconds=cfg.outbox_poll_seconds,
+        max_attempts=cfg.outbox_max_attempts,
+    )
+    notification_outbox.set_dispatcher(outbox)
+    asyncio.create_task(outbox.run())
+
+    # NSFW-перевірка фото: мікробатчі в окремому пулі процесів.
+    moderation.configure(
+        workers=cfg.nsfw_workers,
+        intra_op_threads=cfg.nsfw_intra_op_threads,
+        max_batch=cfg.nsfw_batch_size,
+        max_wait_ms=cfg.nsfw_batch_wait_ms,
+        queue_size=cfg.nsfw_queue_size,
+    )
+
+    await dp.start_polling(bot, cfg=cfg, candidate_queue=candidate_queue)
 
 
 if __name__ == "__main__":
@@ -142,6 +142,31 @@ class Match(Base):
     )
 
 
+class NotificationOutbox(Base):
+    """Сповіщення про лайк/мэтч, яке ще треба доставити (services.notification_outbox)."""
+
+    __tablename__ = "notification_outbox"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)  # like | match
+    # Кому надсилаємо і чию анкету показуємо.
+    recipient_user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    subject_user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")  # pending | failed
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Оренда рядка воркером: після падіння процесу рядок знову стане доступним.
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_notification_outbox_status_next", "status", "next_attempt_at"),
+        Index("ix_notification_outbox_recipient", "recipient_user_id", "status", "id"),
+    )
+
+
 class ActionLog(Base):
     """Action log used for rate limiting (SQLite-friendly)."""
 
@@ -201,6 +226,32 @@ class UaLocation(Base):
     )
 
 
+class AppMeta(Base):
+    """Key/value службові позначки (наприклад, версія довідника ua_locations)."""
+
+    __tablename__ = "app_meta"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[str] = mapped_column(String(256), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class FsmState(Base):
+    """Стан FSM aiogram (services.fsm_storage.SqlStorage)."""
+
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255))
+    data: Mapped[Optional[str]] = mapped_column(Text)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), index=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
 class Complaint(Base):
     __tablename__ = "complaints"
 
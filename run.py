@@ -45,13 +45,23 @@ async def start_api(settings: Settings) -> None:
     )
     server = uvicorn.Server(config)
     logger.info("api started")
+    serve = asyncio.create_task(server.serve())
     try:
-        await server.serve()
+        await asyncio.shield(serve)
     except asyncio.CancelledError:
+        # Плавна зупинка: shutdown адмінки дочікує фонові сповіщення (TelegramClient.close).
         server.should_exit = True
+        await serve
         raise
 
 
+async def stop_services(tasks: list[asyncio.Task]) -> None:
+    """По черзі: адмінка (api) шле через send_scheduler бота, тож бот зупиняється після неї."""
+    for task in tasks:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
 async def main() -> None:
     ensure_runtime_paths()
     settings = get_settings()
@@ -65,17 +75,16 @@ async def main() -> None:
     ]
 
     try:
-        await asyncio.gather(*tasks)
+        # Не gather: його відміна скасувала б обидва сервіси одночасно, а не по черзі.
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
     except (KeyboardInterrupt, asyncio.CancelledError):
         logger.info("Shutdown requested, cancelling services...")
-        for task in tasks:
-            task.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
+        await stop_services(tasks)
     except Exception:
         logger.exception("Service crashed, stopping services...")
-        for task in tasks:
-            task.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
+        await stop_services(tasks)
         raise
     finally:
         logger.info("Shutdown complete")
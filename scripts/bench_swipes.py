@@ -0,0 +1,133 @@
+"""Навантажувальний тест свайпів: N воркерів лайкають/скіпають випадкові анкети.
+
+    python scripts/bench_swipes.py --profile default
+    python scripts/bench_swipes.py --profile tuned
+
+Без --db створює окрему SQLite-базу на кожен профіль у data/ (робочу БД не чіпає;
+окремий файл, бо journal_mode=WAL зберігається у файлі бази).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import func, insert, select
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from db import EngineProfile, create_engine, create_sessionmaker, init_db  # noqa: E402
+from models import User  # noqa: E402
+from services.matching import get_candidate_ids, get_current_user_or_none, put_reaction_and_maybe_match  # noqa: E402
+
+DATA_DIR = BASE_DIR / "data"
+TG_ID_BASE = 9_000_000_000
+
+
+async def _seed(sessionmaker, users: int) -> list[int]:
+    async with sessionmaker() as session:
+        existing = (
+            await session.execute(select(func.count()).select_from(User).where(User.tg_id >= TG_ID_BASE))
+        ).scalar_one()
+        if existing < users:
+            rows = [
+                {
+                    "tg_id": TG_ID_BASE + i,
+                    "name": f"Bench {i}",
+                    "age": 18 + i % 30,
+                    "gender": "M" if i % 2 else "F",
+                    "looking_for": "A",
+                    "city": "Київ",
+                    "region": "Київ",
+                    "settlement": "Київ",
+                    "search_scope": "country",
+                    "search_global": True,
+                    "active": True,
+                }
+                for i in range(existing, users)
+            ]
+            for start in range(0, len(rows), 1000):
+                await session.execute(insert(User), rows[start : start + 1000])
+            await session.commit()
+        res = await session.execute(select(User.tg_id).where(User.tg_id >= TG_ID_BASE).limit(users))
+        return list(res.scalars().all())
+
+
+async def _swipe(sessionmaker, tg_id: int, ids_by_tg: dict[int, int]) -> None:
+    async with sessionmaker() as session:
+        cur = await get_current_user_or_none(session, tg_id, photos=True)
+        if cur is None:
+            return
+        target = random.choice(list(ids_by_tg.values()))
+        await put_reaction_and_maybe_match(session, cur, target, random.random() < 0.7)
+        await get_candidate_ids(session, cur, limit=1)
+
+
+async def run(db_url: str, profile_name: str, users: int, workers: int, swipes: int) -> dict[str, float]:
+    profile = EngineProfile() if profile_name == "tuned" else None
+    engine = create_engine(db_url, profile)
+    sessionmaker = create_sessionmaker(engine)
+    try:
+        await init_db(engine)
+        tg_ids = await _seed(sessionmaker, users)
+        async with sessionmaker() as session:
+            res = await session.execute(select(User.tg_id, User.id).where(User.tg_id.in_(tg_ids)))
+            ids_by_tg = dict(res.all())
+
+        latencies: list[float] = []
+        errors = 0
+        remaining = swipes
+
+        async def worker() -> None:
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    await _swipe(sessionmaker, random.choice(tg_ids), ids_by_tg)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await engine.dispose()
+
+    latencies.sort()
+    return {
+        "swipes_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": float(errors),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Swipe throughput benchmark")
+    parser.add_argument("--db", default=None, help="DATABASE_URL (default: data/bench_swipes_<profile>.db)")
+    parser.add_argument("--profile", choices=("default", "tuned"), default="tuned")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--swipes", type=int, default=5000)
+    args = parser.parse_args()
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    db_url = args.db or f"sqlite+aiosqlite:///{DATA_DIR / f'bench_swipes_{args.profile}.db'}"
+    result = asyncio.run(run(db_url, args.profile, args.users, args.workers, args.swipes))
+    print(
+        f"profile={args.profile} workers={args.workers} swipes={args.swipes}: "
+        f"{result['swipes_per_sec']:.0f} swipes/s, p50 {result['p50_ms']:.1f} ms, "
+        f"p95 {result['p95_ms']:.1f} ms, errors {int(result['errors'])}"
+    )
+
+
+if __name__ == "__main__":
+    main()
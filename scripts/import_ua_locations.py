@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import argparse
 import asyncio
 import csv
+import time
+import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Iterator, Optional
 
-from sqlalchemy import delete, insert
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 import sys
@@ -13,28 +19,41 @@ sys.path.insert(0, str(BASE_DIR))
 
 from app.config import ensure_runtime_paths, get_settings  # noqa: E402
 from db import create_engine, create_sessionmaker  # noqa: E402
-from models import Base, UaLocation  # noqa: E402
+from models import AppMeta, Base, UaLocation  # noqa: E402
+from services.location_repo import LOCATIONS_VERSION_KEY, LocationTree  # noqa: E402
+from services.location_snapshot import SNAPSHOT_PATH, write_snapshot  # noqa: E402
 
 CSV_PATH = BASE_DIR / "UA.csv"
+DEFAULT_BATCH_SIZE = 1000
 
+COLUMNS = ("level1", "level2", "level3", "level4", "level_extra", "category", "name")
 
-async def load_csv() -> int:
-    if not CSV_PATH.exists():
-        raise FileNotFoundError(f"{CSV_PATH} not found")
 
-    ensure_runtime_paths()
-    settings = get_settings()
+@dataclass
+class ImportStats:
+    parsed: int = 0
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    batches: int = 0
+    version: Optional[str] = None
+    snapshot_bytes: int = 0
+    timings: dict[str, float] = field(default_factory=dict)
 
-    engine = create_engine(settings.database_url)
-    async_session = create_sessionmaker(engine)
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+def _short(val: str) -> str | None:
+    val = (val or "").strip()
+    if not val:
+        return None
+    return val if len(val) <= 32 else None
+
 
-    rows = []
-    with CSV_PATH.open(encoding="utf-8") as f:
+def iter_csv_rows(path: Path) -> Iterator[dict]:
+    """Потоково читає UA.csv (КАТОТТГ) і повертає рядки у форматі ua_locations."""
+    with path.open(encoding="utf-8") as f:
         reader = csv.reader(f)
-        headers = next(reader, [])
+        next(reader, None)
         for row in reader:
             # Skip comment/garbage rows (e.g., long textual notes instead of UA codes).
             if not row or not row[0].strip().isdigit():
@@ -42,38 +61,182 @@ async def load_csv() -> int:
             if row[1] and not row[1].startswith("UA"):
                 continue
 
-            def short(val: str) -> str | None:
-                val = (val or "").strip()
-                if not val:
-                    return None
-                return val if len(val) <= 32 else None
-
-            rows.append(
-                {
-                    "id": int(row[0]),
-                    "level1": short(row[1]),
-                    "level2": short(row[2]),
-                    "level3": short(row[3]),
-                    "level4": short(row[4]),
-                    "level_extra": short(row[5]),
-                    "category": short(row[6]),
-                    "name": (row[7] or "").strip(),
-                }
-            )
-
-    async with async_session() as session:
-        await session.execute(delete(UaLocation))
-        if rows:
-            await session.execute(insert(UaLocation), rows)
-        await session.commit()
-
-    await engine.dispose()
-    return len(rows)
+            yield {
+                "id": int(row[0]),
+                "level1": _short(row[1]),
+                "level2": _short(row[2]),
+                "level3": _short(row[3]),
+                "level4": _short(row[4]),
+                "level_extra": _short(row[5]),
+                "category": _short(row[6]),
+                "name": (row[7] or "").strip(),
+            }
+
+
+def _upsert_stmt(dialect: str):
+    """INSERT ... ON CONFLICT (id) DO UPDATE для SQLite/PostgreSQL."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(UaLocation)
+    return stmt.on_conflict_do_update(
+        index_elements=[UaLocation.id],
+        set_={col: getattr(stmt.excluded, col) for col in COLUMNS},
+    )
+
+
+async def _load_existing(session: AsyncSession) -> dict[int, tuple]:
+    res = await session.execute(select(UaLocation.id, *(getattr(UaLocation, col) for col in COLUMNS)))
+    return {row[0]: tuple(row[1:]) for row in res.all()}
+
+
+async def _write_batch(session: AsyncSession, upsert, batch: list[dict], stats: ImportStats) -> None:
+    if upsert is not None:
+        await session.execute(upsert, batch)
+    else:
+        await session.execute(delete(UaLocation).where(UaLocation.id.in_([r["id"] for r in batch])))
+        await session.execute(insert(UaLocation), batch)
+    await session.commit()
+    stats.batches += 1
+
+
+async def load_csv(
+    csv_path: Path = CSV_PATH,
+    *,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    full: bool = False,
+    dry_run: bool = False,
+    snapshot: bool = True,
+) -> ImportStats:
+    if not csv_path.exists():
+        raise FileNotFoundError(f"{csv_path} not found")
+
+    ensure_runtime_paths()
+    settings = get_settings()
+
+    engine = create_engine(settings.database_url)
+    async_session = create_sessionmaker(engine)
+    stats = ImportStats()
+    batch_size = max(1, int(batch_size))
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with async_session() as session:
+            started = time.perf_counter()
+            existing = {} if full else await _load_existing(session)
+            stats.timings["load_existing"] = time.perf_counter() - started
+
+            if full and not dry_run:
+                await session.execute(delete(UaLocation))
+
+            # Порівнюємо рядок за рядком і пишемо лише нові/змінені пачками:
+            # таблиця не порожніє, а CSV не тримається в пам'яті цілком.
+            started = time.perf_counter()
+            upsert = _upsert_stmt(engine.dialect.name)
+            seen: set[int] = set()
+            batch: list[dict] = []
+            for row in iter_csv_rows(csv_path):
+                stats.parsed += 1
+                seen.add(row["id"])
+                old = existing.get(row["id"])
+                values = tuple(row[col] for col in COLUMNS)
+                if old is None:
+                    stats.added += 1
+                elif old != values:
+                    stats.changed += 1
+                else:
+                    stats.unchanged += 1
+                    continue
+                if dry_run:
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    await _write_batch(session, upsert, batch, stats)
+                    batch = []
+            if batch:
+                await _write_batch(session, upsert, batch, stats)
+            stats.timings["parse_upsert"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            removed = [loc_id for loc_id in existing if loc_id not in seen]
+            stats.removed = len(removed)
+            if not dry_run:
+                for i in range(0, len(removed), batch_size):
+                    chunk = removed[i : i + batch_size]
+                    await session.execute(delete(UaLocation).where(UaLocation.id.in_(chunk)))
+                    await session.commit()
+            stats.timings["delete_removed"] = time.perf_counter() - started
+
+            if dry_run:
+                return stats
+
+            started = time.perf_counter()
+            dirty = bool(stats.added or stats.changed or stats.removed)
+            if dirty:
+                # Нова версія => бот і адмінка перезавантажать кеш локацій.
+                stats.version = uuid.uuid4().hex
+                await session.merge(AppMeta(key=LOCATIONS_VERSION_KEY, value=stats.version))
+                await session.commit()
+            else:
+                res = await session.execute(select(AppMeta.value).where(AppMeta.key == LOCATIONS_VERSION_KEY))
+                stats.version = res.scalar_one_or_none()
+            stats.timings["version"] = time.perf_counter() - started
+
+            if snapshot and (dirty or not SNAPSHOT_PATH.exists()):
+                # Знімок з тією ж версією: процеси стартують з нього без запиту до ua_locations.
+                started = time.perf_counter()
+                res = await session.execute(
+                    select(
+                        UaLocation.level1,
+                        UaLocation.level2,
+                        UaLocation.level3,
+                        UaLocation.level4,
+                        UaLocation.category,
+                        UaLocation.name,
+                    )
+                )
+                tree = LocationTree.from_rows(res.all(), version=stats.version)
+                stats.snapshot_bytes = write_snapshot(tree, SNAPSHOT_PATH)
+                stats.timings["snapshot"] = time.perf_counter() - started
+    finally:
+        await engine.dispose()
+
+    return stats
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Import KATOTTG (UA.csv) into ua_locations")
+    parser.add_argument("--csv", type=Path, default=CSV_PATH, help="path to UA.csv")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per upsert/commit")
+    parser.add_argument("--full", action="store_true", help="delete all rows and re-insert (old behaviour)")
+    parser.add_argument("--dry-run", action="store_true", help="only print the diff, write nothing")
+    parser.add_argument("--no-snapshot", action="store_true", help=f"do not write {SNAPSHOT_PATH.name}")
+    return parser.parse_args(argv)
 
 
 async def main() -> None:
-    total = await load_csv()
-    print(f"Imported {total} ua_locations rows from {CSV_PATH.name}")
+    args = parse_args()
+    stats = await load_csv(
+        args.csv,
+        batch_size=args.batch_size,
+        full=args.full,
+        dry_run=args.dry_run,
+        snapshot=not args.no_snapshot,
+    )
+    print(
+        f"{'Dry run: ' if args.dry_run else ''}{args.csv.name}: parsed={stats.parsed} "
+        f"added={stats.added} changed={stats.changed} removed={stats.removed} "
+        f"unchanged={stats.unchanged} batches={stats.batches}"
+    )
+    for phase, seconds in stats.timings.items():
+        print(f"  {phase:<15} {seconds:8.3f}s")
+    if stats.snapshot_bytes:
+        print(f"Wrote {SNAPSHOT_PATH.name} ({stats.snapshot_bytes} bytes), version={stats.version}")
 
 
 if __name__ == "__main__":
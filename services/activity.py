@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import User
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+_users = User.__table__
+
+# Один UPDATE на пачку (executemany): час лише зростає, старіший дотик не перезапише новіший.
+_TOUCH_STMT = (
+    update(_users)
+    .where(_users.c.tg_id == bindparam("b_tg_id"))
+    .where(or_(_users.c.last_activity_at.is_(None), _users.c.last_activity_at < bindparam("b_seen")))
+    .values(last_activity_at=bindparam("b_seen"))
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ActivityTracker:
+    """Write-behind для users.last_activity_at.
+
+    touch() лише запам'ятовує час у словнику (tg_id -> останній дотик), а фоновий
+    run() раз на interval_seconds або при batch_size різних користувачів пише все
+    одним UPDATE. close() дописує залишок під час зупинки.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        *,
+        interval_seconds: float = 30.0,
+        batch_size: int = 500,
+    ):
+        self.sessionmaker = sessionmaker
+        self.interval_seconds = max(1.0, float(interval_seconds))
+        self.batch_size = max(1, int(batch_size))
+        self._pending: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def touch(self, tg_id: int, seen_at: Optional[datetime] = None) -> None:
+        self._pending[tg_id] = seen_at or _utcnow()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            rows = [{"b_tg_id": tg_id, "b_seen": seen} for tg_id, seen in batch.items()]
+            try:
+                async with self.sessionmaker() as session:
+                    await session.execute(_TOUCH_STMT, rows)
+                    await session.commit()
+            except BaseException:
+                # Повертаємо пачку назад (і при скасуванні: її допише close()).
+                for tg_id, seen in batch.items():
+                    if self._pending.get(tg_id, seen) <= seen:
+                        self._pending[tg_id] = seen
+                metrics.inc("activity_flush_errors_total")
+                raise
+            metrics.inc("activity_flushed_total", len(rows))
+            return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Activity flush failed (%s users pending)", len(self._pending))
+                await asyncio.sleep(min(60.0, self.interval_seconds))
+
+    async def close(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final activity flush failed, %s users lost", len(self._pending))
+
+
+metrics.describe("activity_flushed_total", "last_activity_at rows written by ActivityTracker")
+metrics.describe("activity_flush_errors_total", "Failed ActivityTracker flushes")
@@ -1,34 +1,309 @@
 from __future__ import annotations
 
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
 from datetime import datetime, timedelta, timezone
-from typing import Iterable
+from typing import Any, Deque, Iterable, Optional, Protocol
 
-from sqlalchemy import delete, func, select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from models import ActionLog
 
+logger = logging.getLogger(__name__)
+
+# Найдовше вікно, яке використовують хендлери (ліміт відгуків на добу).
+DEFAULT_RETENTION_SECONDS = 24 * 3600
+
 
 def _utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
+class RateLimiterBackend(Protocol):
+    """Сховище подій для антифлуду. Сесію отримують усі, використовує лише DB-бекенд."""
+
+    async def count(
+        self, session: AsyncSession, user_id: int, actions: Iterable[str], window_seconds: int
+    ) -> int: ...
+
+    async def hit(self, session: AsyncSession, user_id: int, action: str) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class DbRateLimiter:
+    """Попередня поведінка: кожна дія — рядок у action_logs, ліміт — COUNT(*)."""
+
+    async def count(
+        self, session: AsyncSession, user_id: int, actions: Iterable[str], window_seconds: int
+    ) -> int:
+        since = _utcnow() - timedelta(seconds=window_seconds)
+        stmt = (
+            select(func.count(ActionLog.id))
+            .where(
+                ActionLog.user_id == user_id,
+                ActionLog.action.in_(list(actions)),
+                ActionLog.created_at >= since,
+            )
+        )
+        return int((await session.execute(stmt)).scalar_one())
+
+    async def hit(self, session: AsyncSession, user_id: int, action: str) -> None:
+        # Старі записи чистить services.log_retention у фоні.
+        session.add(ActionLog(user_id=user_id, action=action))
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryRateLimiter:
+    """Sliding window у пам'яті процесу, ключ — (user_id, action).
+
+    Група дій (наприклад, ("like", "inlike_like")) рахується як сума по ключах,
+    тому контракт той самий, що й у COUNT по action_logs.
+    """
+
+    def __init__(
+        self,
+        retention_seconds: int = DEFAULT_RETENTION_SECONDS,
+        max_events_per_key: int = 1000,
+        sweep_every: int = 10_000,
+    ):
+        self.retention_seconds = retention_seconds
+        self.max_events_per_key = max_events_per_key
+        self.sweep_every = sweep_every
+        self._events: dict[tuple[int, str], Deque[float]] = {}
+        self._hits = 0
+
+    @staticmethod
+    def _prune(events: Deque[float], oldest: float) -> None:
+        while events and events[0] < oldest:
+            events.popleft()
+
+    async def count(
+        self, session: AsyncSession, user_id: int, actions: Iterable[str], window_seconds: int
+    ) -> int:
+        oldest = time.monotonic() - window_seconds
+        total = 0
+        for action in set(actions):
+            events = self._events.get((user_id, action))
+            if not events:
+                continue
+            # Події відсортовані за часом: рахуємо з хвоста до межі вікна.
+            for ts in reversed(events):
+                if ts < oldest:
+                    break
+                total += 1
+        return total
+
+    async def hit(self, session: AsyncSession, user_id: int, action: str) -> None:
+        now = time.monotonic()
+        key = (user_id, action)
+        events = self._events.get(key)
+        if events is None:
+            events = deque(maxlen=self.max_events_per_key)
+            self._events[key] = events
+        self._prune(events, now - self.retention_seconds)
+        events.append(now)
+
+        self._hits += 1
+        if self._hits % self.sweep_every == 0:
+            self._sweep(now)
+
+    def _sweep(self, now: float) -> None:
+        oldest = now - self.retention_seconds
+        stale = [key for key, events in self._events.items() if not events or events[-1] < oldest]
+        for key in stale:
+            del self._events[key]
+
+    async def close(self) -> None:
+        self._events.clear()
+
+
+class RedisRateLimiter:
+    """Sliding window на sorted set-ах Redis (спільний для кількох процесів).
+
+    Приймає будь-який клієнт з API redis.asyncio (pipeline/zadd/zcount/...),
+    тож локально його можна підмінити fakeredis.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        prefix: str = "antiflood",
+        retention_seconds: int = DEFAULT_RETENTION_SECONDS,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.retention_seconds = retention_seconds
+        self._seq = itertools.count()
+
+    def _key(self, user_id: int, action: str) -> str:
+        return f"{self.prefix}:{user_id}:{action}"
+
+    async def count(
+        self, session: AsyncSession, user_id: int, actions: Iterable[str], window_seconds: int
+    ) -> int:
+        oldest = time.time() - window_seconds
+        pipe = self.client.pipeline(transaction=False)
+        for action in set(actions):
+            pipe.zcount(self._key(user_id, action), oldest, "+inf")
+        results = await pipe.execute()
+        return sum(int(r or 0) for r in results)
+
+    async def hit(self, session: AsyncSession, user_id: int, action: str) -> None:
+        now = time.time()
+        key = self._key(user_id, action)
+        member = f"{now:.6f}:{next(self._seq)}"
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(key, {member: now})
+        pipe.zremrangebyscore(key, "-inf", now - self.retention_seconds)
+        pipe.expire(key, self.retention_seconds)
+        await pipe.execute()
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+
+class ActionLogAudit:
+    """Необов'язковий аудит дій у action_logs: буфер + пакетний INSERT у фоні."""
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        *,
+        flush_interval: float = 5.0,
+        batch_size: int = 500,
+        max_buffer: int = 50_000,
+    ):
+        self.sessionmaker = sessionmaker
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max(batch_size, max_buffer)
+        self._buffer: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def record(self, user_id: int, action: str) -> None:
+        self._buffer.append({"user_id": user_id, "action": action, "created_at": _utcnow()})
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        if not self._buffer:
+            return 0
+        rows, self._buffer = self._buffer, []
+        try:
+            async with self.sessionmaker() as session:
+                await session.execute(insert(ActionLog), rows)
+                await session.commit()
+        except Exception:
+            logger.exception("Failed to flush %s action log rows, will retry", len(rows))
+            self._requeue(rows)
+            return 0
+        return len(rows)
+
+    def _requeue(self, rows: list[dict]) -> None:
+        # Невдалий пакет — назад на початок буфера; БД недоступна довго => відкидаємо найстаріші.
+        self._buffer[:0] = rows
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            self._log_lost(self._buffer[:overflow], "buffer full")
+            del self._buffer[:overflow]
+
+    @staticmethod
+    def _log_lost(rows: list[dict], reason: str) -> None:
+        logger.error(
+            "Action log audit lost %s rows (%s): %s",
+            len(rows),
+            reason,
+            [(row["user_id"], row["action"], row["created_at"].isoformat()) for row in rows],
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            self._log_lost(self._buffer, "shutdown")
+            self._buffer = []
+
+
+_backend: RateLimiterBackend = DbRateLimiter()
+_audit: Optional[ActionLogAudit] = None
+
+
+def build_backend(kind: str, redis_url: str = "") -> RateLimiterBackend:
+    kind = (kind or "db").strip().lower()
+    if kind == "memory":
+        return MemoryRateLimiter()
+    if kind == "redis":
+        if not redis_url:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires REDIS_URL")
+        try:
+            from redis.asyncio import Redis
+        except ImportError as exc:  # pragma: no cover
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from exc
+        return RedisRateLimiter(Redis.from_url(redis_url))
+    return DbRateLimiter()
+
+
+def configure(
+    backend: RateLimiterBackend,
+    audit_sessionmaker: Optional[async_sessionmaker[AsyncSession]] = None,
+    *,
+    audit_flush_interval: float = 5.0,
+    audit_batch_size: int = 500,
+) -> None:
+    """Встановлює бекенд антифлуду (і, за потреби, аудит у action_logs)."""
+    global _backend, _audit
+    _backend = backend
+    _audit = None
+    # DB-бекенд і так пише кожну дію в action_logs.
+    if audit_sessionmaker is not None and not isinstance(backend, DbRateLimiter):
+        _audit = ActionLogAudit(
+            audit_sessionmaker, flush_interval=audit_flush_interval, batch_size=audit_batch_size
+        )
+        _audit.start()
+    logger.info("Antiflood backend: %s (audit=%s)", type(backend).__name__, _audit is not None)
+
+
+async def shutdown() -> None:
+    global _audit
+    if _audit is not None:
+        await _audit.close()
+        _audit = None
+    await _backend.close()
+
+
 async def count_actions(
     session: AsyncSession,
     user_id: int,
     actions: Iterable[str],
     window_seconds: int,
 ) -> int:
-    since = _utcnow() - timedelta(seconds=window_seconds)
-    stmt = (
-        select(func.count(ActionLog.id))
-        .where(
-            ActionLog.user_id == user_id,
-            ActionLog.action.in_(list(actions)),
-            ActionLog.created_at >= since,
-        )
-    )
-    return int((await session.execute(stmt)).scalar_one())
+    return await _backend.count(session, user_id, actions, window_seconds)
 
 
 async def is_allowed(
@@ -45,7 +320,6 @@ async def is_allowed(
 
 
 async def log_action(session: AsyncSession, user_id: int, action: str) -> None:
-    session.add(ActionLog(user_id=user_id, action=action))
-    # Простая уборка: удаляем логи старше 3 суток, чтобы таблица не пухла.
-    cutoff = _utcnow() - timedelta(days=3)
-    await session.execute(delete(ActionLog).where(ActionLog.created_at < cutoff))
+    await _backend.hit(session, user_id, action)
+    if _audit is not None:
+        _audit.record(user_id, action)
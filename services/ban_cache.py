@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable, Optional, Protocol
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TgUser
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import AppMeta, User
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# app_meta: змінюється разом із users.is_banned, бот в іншому процесі за ним перечитує бан-лист.
+BANS_VERSION_KEY = "bans_version"
+
+BanListener = Callable[[int, bool], Awaitable[None]]
+
+
+class BanBus(Protocol):
+    """Канал змін бан-листа (tg_id, banned) від адмінки до бота."""
+
+    async def publish(self, tg_id: int, banned: bool) -> None: ...
+
+    def subscribe(self, listener: BanListener) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class LocalBanBus:
+    """Адмінка і бот в одному процесі (run.py): просто викликаємо підписників."""
+
+    def __init__(self) -> None:
+        self._listeners: list[BanListener] = []
+
+    async def publish(self, tg_id: int, banned: bool) -> None:
+        for listener in list(self._listeners):
+            try:
+                await listener(tg_id, banned)
+            except Exception:
+                logger.exception("Ban listener failed for tg_id=%s", tg_id)
+
+    def subscribe(self, listener: BanListener) -> None:
+        self._listeners.append(listener)
+
+    async def close(self) -> None:
+        self._listeners.clear()
+
+
+async def _read_version(session: AsyncSession) -> Optional[str]:
+    res = await session.execute(select(AppMeta.value).where(AppMeta.key == BANS_VERSION_KEY))
+    return res.scalar_one_or_none()
+
+
+class BanCache:
+    """Множина tg_id забанених користувачів у пам'яті процесу бота.
+
+    В одному процесі з адмінкою зміни приходять через BanBus одразу; окремий процес
+    бота підхоплює їх за bans_version у app_meta (refresh_loop).
+    """
+
+    def __init__(self) -> None:
+        self._banned: set[int] = set()
+        self.loaded = False
+        self.version: Optional[str] = None
+
+    async def load(self, sessionmaker: async_sessionmaker[AsyncSession]) -> None:
+        async with sessionmaker() as session:
+            # Версію читаємо першою: бан між двома запитами лише спричинить зайве перечитування.
+            version = await _read_version(session)
+            res = await session.execute(select(User.tg_id).where(User.is_banned == True))  # noqa: E712
+            self._banned = set(res.scalars().all())
+        self.version = version
+        self.loaded = True
+        logger.info("Ban cache loaded: %s banned users", len(self._banned))
+
+    async def refresh(self, sessionmaker: async_sessionmaker[AsyncSession]) -> bool:
+        """Перечитує бан-лист, якщо bans_version змінилась. Повертає, чи перечитав."""
+        async with sessionmaker() as session:
+            version = await _read_version(session)
+        if self.loaded and version == self.version:
+            return False
+        await self.load(sessionmaker)
+        return True
+
+    def is_banned(self, tg_id: int) -> bool:
+        return tg_id in self._banned
+
+    async def apply(self, tg_id: int, banned: bool) -> None:
+        if banned:
+            self._banned.add(tg_id)
+        else:
+            self._banned.discard(tg_id)
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+
+_cache = BanCache()
+_bus: BanBus = LocalBanBus()
+_bus.subscribe(_cache.apply)
+
+
+def configure(bus: BanBus) -> None:
+    """Підміна каналу (напр. Redis pub/sub, коли адмінка житиме в окремому процесі)."""
+    global _bus
+    _bus = bus
+    _bus.subscribe(_cache.apply)
+
+
+def get_cache() -> BanCache:
+    return _cache
+
+
+async def load(sessionmaker: async_sessionmaker[AsyncSession]) -> None:
+    await _cache.load(sessionmaker)
+
+
+async def bump_version(session: AsyncSession) -> None:
+    """Викликати в транзакції зміни users.is_banned, до commit."""
+    await session.merge(AppMeta(key=BANS_VERSION_KEY, value=uuid.uuid4().hex))
+
+
+async def refresh_loop(sessionmaker: async_sessionmaker[AsyncSession], *, interval_seconds: int = 10) -> None:
+    """Фоновий цикл бота: бани з адмінки, що працює в іншому процесі."""
+    if interval_seconds <= 0:
+        return
+    while True:
+        try:
+            await asyncio.sleep(interval_seconds)
+            if await _cache.refresh(sessionmaker):
+                logger.info("Ban cache reloaded: bans_version changed")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ban cache refresh error")
+
+
+async def publish(tg_id: Optional[int], banned: bool) -> None:
+    """Викликати після commit зміни users.is_banned."""
+    if tg_id is None:
+        return
+    await _bus.publish(int(tg_id), banned)
+
+
+async def shutdown() -> None:
+    await _bus.close()
+
+
+class BannedUserDropMiddleware(BaseMiddleware):
+    """Outer-middleware апдейта: відкидає апдейти забанених ще до сесії БД і FSM.
+
+    Єдина перевірка бану в боті: фолбеку на users.is_banned з БД немає.
+    """
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        user: Optional[TgUser] = data.get("event_from_user")
+        if user is not None and _cache.is_banned(user.id):
+            metrics.inc("bot_banned_updates_dropped_total")
+            return None
+        return await handler(event, data)
+
+
+metrics.describe("bot_banned_updates_dropped_total", "Updates from banned users dropped by the ban cache")
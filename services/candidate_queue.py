@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from models import User
+from services.matching import candidate_ids_stmt, unseen_conditions
+
+logger = logging.getLogger(__name__)
+
+
+def _filters_signature(user: User) -> tuple:
+    """Усе, що впливає на вибірку кандидатів. Зміна підпису => черга скидається."""
+    return (
+        user.looking_for,
+        int(user.age) if getattr(user, "age_filter_enabled", True) else None,
+        getattr(user, "search_scope", None),
+        getattr(user, "search_global", False),
+        user.region,
+        user.district,
+        user.hromada,
+        user.settlement,
+    )
+
+
+class _UserQueue:
+    __slots__ = ("signature", "ids", "served", "refill_task")
+
+    def __init__(self, signature: tuple, served_maxlen: int):
+        self.signature = signature
+        self.ids: Deque[int] = deque()
+        # Нещодавно оброблені id: фонова підкачка не поверне їх, навіть якщо
+        # запит стартував до коміту лайка/скіпу.
+        self.served: Deque[int] = deque(maxlen=served_maxlen)
+        self.refill_task: Optional[asyncio.Task] = None
+
+
+class CandidateQueue:
+    """Черга наступних кандидатів для кожного користувача.
+
+    Замість повного запиту з NOT EXISTS на кожен свайп беремо пачку id одним
+    запитом, видаємо їх по одному (голова черги показується, поки на неї не
+    відреагували) і підкачуємо у фоні, коли в черзі лишається мало id.
+    Кожен id перевіряється при видачі (анкета існує, активна, не забанена),
+    тож пауза, бан чи видалення анкети відсікаються навіть без явного сигналу.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        *,
+        batch_size: int = 20,
+        low_watermark: int = 5,
+        max_users: int = 10_000,
+    ):
+        self.sessionmaker = sessionmaker
+        self.batch_size = max(1, int(batch_size))
+        self.low_watermark = max(0, min(int(low_watermark), self.batch_size - 1))
+        self.max_users = max(1, int(max_users))
+        self._queues: OrderedDict[int, _UserQueue] = OrderedDict()
+
+    def _queue_for(self, current: User) -> _UserQueue:
+        signature = _filters_signature(current)
+        queue = self._queues.get(current.id)
+        if queue is not None and queue.signature != signature:
+            self._cancel_refill(queue)
+            queue = None
+        if queue is None:
+            queue = _UserQueue(signature, served_maxlen=self.batch_size * 2)
+            self._queues[current.id] = queue
+            while len(self._queues) > self.max_users:
+                _, evicted = self._queues.popitem(last=False)
+                self._cancel_refill(evicted)
+        else:
+            self._queues.move_to_end(current.id)
+        return queue
+
+    @staticmethod
+    def _cancel_refill(queue: _UserQueue) -> None:
+        if queue.refill_task and not queue.refill_task.done():
+            queue.refill_task.cancel()
+        queue.refill_task = None
+
+    @staticmethod
+    async def _load_candidate(session: AsyncSession, viewer_id: int, candidate_id: int) -> Optional[User]:
+        # Реакція могла з'явитись після побудови пачки (inlike:, інший процес): перевіряємо знову.
+        res = await session.execute(
+            select(User)
+            .options(selectinload(User.photos))
+            .where(
+                User.id == candidate_id,
+                User.active == True,  # noqa: E712
+                User.is_banned == False,  # noqa: E712
+                *unseen_conditions(viewer_id),
+            )
+        )
+        return res.scalar_one_or_none()
+
+    def _refill_stmt(self, current: User, queue: _UserQueue) -> Select:
+        exclude = set(queue.ids)
+        exclude.update(queue.served)
+        return candidate_ids_stmt(current, self.batch_size, exclude)
+
+    def _extend(self, queue: _UserQueue, ids: list[int]) -> int:
+        known = set(queue.ids)
+        known.update(queue.served)
+        added = 0
+        for candidate_id in ids:
+            if candidate_id not in known:
+                queue.ids.append(candidate_id)
+                known.add(candidate_id)
+                added += 1
+        return added
+
+    async def _refill_now(self, session: AsyncSession, current: User, queue: _UserQueue) -> None:
+        self._cancel_refill(queue)
+        # Синхронна підкачка йде після коміту реакції, тож served більше не потрібен.
+        queue.served.clear()
+        res = await session.execute(self._refill_stmt(current, queue))
+        self._extend(queue, list(res.scalars().all()))
+
+    def _maybe_refill_background(self, current: User, queue: _UserQueue) -> None:
+        if len(queue.ids) > self.low_watermark:
+            return
+        if queue.refill_task and not queue.refill_task.done():
+            return
+        # Запит будуємо зараз: у фоні не читаємо атрибути чужої сесії.
+        stmt = self._refill_stmt(current, queue)
+        queue.refill_task = asyncio.create_task(self._refill_background(current.id, queue, stmt))
+
+    async def _refill_background(self, user_id: int, queue: _UserQueue, stmt: Select) -> None:
+        try:
+            async with self.sessionmaker() as session:
+                res = await session.execute(stmt)
+                ids = list(res.scalars().all())
+            if self._queues.get(user_id) is queue:
+                added = self._extend(queue, ids)
+                logger.debug("Candidate queue refilled user_id=%s added=%s", user_id, added)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Candidate queue refill failed user_id=%s", user_id)
+        finally:
+            if queue.refill_task is asyncio.current_task():
+                queue.refill_task = None
+
+    async def next_candidate(self, session: AsyncSession, current: User) -> Optional[User]:
+        """Повертає анкету з голови черги (не знімаючи її до реакції)."""
+        queue = self._queue_for(current)
+        refilled = False
+        while True:
+            if not queue.ids:
+                if refilled:
+                    return None
+                await self._refill_now(session, current, queue)
+                refilled = True
+                continue
+
+            candidate = await self._load_candidate(session, current.id, queue.ids[0])
+            if candidate is None:
+                queue.ids.popleft()
+                continue
+
+            self._maybe_refill_background(current, queue)
+            return candidate
+
+    def discard(self, viewer_id: int, target_id: int) -> None:
+        """Реакція (лайк/скіп/мэтч): target більше не показуємо viewer-у."""
+        queue = self._queues.get(viewer_id)
+        if queue is None:
+            return
+        try:
+            queue.ids.remove(target_id)
+        except ValueError:
+            pass
+        queue.served.append(target_id)
+
+    def drop_target(self, target_id: int) -> None:
+        """Пауза/бан/видалення анкети: прибираємо її з усіх черг."""
+        for queue in self._queues.values():
+            try:
+                queue.ids.remove(target_id)
+            except ValueError:
+                continue
+
+    def reset(self, viewer_id: int) -> None:
+        queue = self._queues.pop(viewer_id, None)
+        if queue is not None:
+            self._cancel_refill(queue)
+
+    async def close(self) -> None:
+        tasks = [q.refill_task for q in self._queues.values() if q.refill_task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queues.clear()
@@ -10,6 +10,7 @@ from sqlalchemy import delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from models import Like
+from services import send_scheduler
 
 try:
     from zoneinfo import ZoneInfo
@@ -83,6 +84,7 @@ async def daily_reset_loop(
                 text = f"✅ Щоденне очищення виконано. Видалено лайків/пропусків: {res.deleted_likes}"
                 for admin_id in admins:
                     try:
+                        await send_scheduler.acquire(admin_id, send_scheduler.PRIORITY_ADMIN)
                         await bot.send_message(chat_id=admin_id, text=text)
                     except Exception:
                         logger.exception("Failed to notify admin %s", admin_id)
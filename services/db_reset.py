@@ -5,7 +5,7 @@ from dataclasses import dataclass
 from sqlalchemy import delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import ActionLog, Feedback, Like, Match, Photo, User
+from models import ActionLog, Feedback, Like, Match, NotificationOutbox, Photo, User
 
 
 @dataclass(frozen=True)
@@ -35,6 +35,7 @@ async def reset_database(session: AsyncSession) -> DbResetResult:
     await session.execute(delete(Feedback))
     await session.execute(delete(Like))
     await session.execute(delete(Match))
+    await session.execute(delete(NotificationOutbox))
     await session.execute(delete(Photo))
     await session.execute(delete(User))
     await session.commit()
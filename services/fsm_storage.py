@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.middleware import FSMContextMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseEventIsolation,
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from aiogram.fsm.strategy import FSMStrategy
+from aiogram.types import TelegramObject
+from sqlalchemy import and_, case, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import FsmState
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _insert(session: AsyncSession, model):
+    """INSERT з ON CONFLICT для діалекту сесії (PostgreSQL або SQLite)."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise RuntimeError(f"Unsupported dialect for FSM storage: {dialect}")
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class SqlStorage(BaseStorage):
+    """FSM у таблиці fsm_states (той самий SQLAlchemy engine, що й у бота).
+
+    Кожен запис живе ttl_seconds після останньої зміни: покинуті анкети
+    зникають самі (див. fsm_expiry_loop), а прострочений стан не читається.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        *,
+        ttl_seconds: Optional[int] = None,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.sessionmaker = sessionmaker
+        self.ttl_seconds = ttl_seconds or None
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+
+    def _expires_at(self) -> Optional[datetime]:
+        return _utcnow() + timedelta(seconds=self.ttl_seconds) if self.ttl_seconds else None
+
+    @staticmethod
+    def _expired(row: FsmState) -> bool:
+        expires_at = row.expires_at
+        if expires_at is None:
+            return False
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at <= _utcnow()
+
+    async def _load(self, key: StorageKey) -> Optional[FsmState]:
+        async with self.sessionmaker() as session:
+            row = await session.get(FsmState, self.key_builder.build(key))
+        if row is None or self._expired(row):
+            return None
+        return row
+
+    async def set_record(self, key: StorageKey, **values: Any) -> None:
+        """Один запис для state і/або data (values: state=..., data=...).
+
+        Один upsert без попереднього читання: перший запис ключа з двох апдейтів
+        або процесів не падає на IntegrityError.
+        """
+        db_key = self.key_builder.build(key)
+        given: dict[str, Optional[str]] = {}
+        if "state" in values:
+            given["state"] = _state_name(values["state"])
+        if "data" in values:
+            data = values["data"]
+            given["data"] = json.dumps(dict(data), ensure_ascii=False) if data else None
+
+        expires_at = self._expires_at()
+        table = FsmState.__table__
+        expired = and_(table.c.expires_at.is_not(None), table.c.expires_at <= _utcnow())
+        # Поле, яке не передали, зберігаємо, якщо запис ще живий.
+        update_values: dict[str, Any] = {
+            name: given[name] if name in given else case((expired, None), else_=table.c[name])
+            for name in ("state", "data")
+        }
+        update_values["expires_at"] = expires_at
+        update_values["updated_at"] = func.now()
+
+        async with self.sessionmaker() as session:
+            stmt = _insert(session, FsmState).values(
+                key=db_key, state=given.get("state"), data=given.get("data"), expires_at=expires_at
+            )
+            stmt = stmt.on_conflict_do_update(index_elements=["key"], set_=update_values)
+            await session.execute(stmt)
+            if not any(given.values()):
+                # Порожній запис (стан скинуто, даних немає) не зберігаємо.
+                await session.execute(
+                    delete(FsmState).where(
+                        FsmState.key == db_key, FsmState.state.is_(None), FsmState.data.is_(None)
+                    )
+                )
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.set_record(key, state=state)
+
+    async def get_record(self, key: StorageKey) -> tuple[Optional[str], Dict[str, Any]]:
+        """state і data одним запитом."""
+        row = await self._load(key)
+        if row is None:
+            return None, {}
+        return row.state, json.loads(row.data) if row.data else {}
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self.get_record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self.set_record(key, data=data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self.get_record(key)
+        return data
+
+    async def purge_expired(self) -> int:
+        async with self.sessionmaker() as session:
+            res = await session.execute(delete(FsmState).where(FsmState.expires_at < _utcnow()))
+            await session.commit()
+            return int(res.rowcount or 0)
+
+    async def close(self) -> None:
+        return None
+
+
+_UNSET: Any = object()
+
+
+class _Pending:
+    __slots__ = (
+        "state", "data", "state_dirty", "data_dirty", "state_loaded", "data_loaded", "stored_state", "stored_data"
+    )
+
+    def __init__(self) -> None:
+        self.state: Optional[str] = None
+        self.data: Dict[str, Any] = {}
+        self.state_dirty = False
+        self.data_dirty = False
+        self.state_loaded = False
+        self.data_loaded = False
+        # Що лежить у inner (якщо читали): запис того самого значення пропускаємо.
+        self.stored_state: Any = _UNSET
+        self.stored_data: Any = _UNSET
+
+
+_pending: ContextVar[Optional[dict[StorageKey, _Pending]]] = ContextVar("fsm_pending", default=None)
+
+
+class CoalescingStorage(BaseStorage):
+    """Обгортка, що збирає всі зміни стану/даних за один апдейт в один запис.
+
+    Усередині FsmFlushMiddleware читання й запис йдуть у буфер апдейта, а в кінці
+    обробки кожен змінений ключ пишеться в inner один раз (set_state і/або set_data).
+    SqlStorage читається один раз на ключ: state і data разом.
+    Поза middleware працює як звичайний write-through.
+    """
+
+    def __init__(self, inner: BaseStorage):
+        self.inner = inner
+
+    @staticmethod
+    def _entry(key: StorageKey) -> Optional[_Pending]:
+        pending = _pending.get()
+        if pending is None:
+            return None
+        entry = pending.get(key)
+        if entry is None:
+            entry = pending[key] = _Pending()
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = self._entry(key)
+        if entry is None:
+            await self.inner.set_state(key, state)
+            return
+        entry.state = _state_name(state)
+        entry.state_loaded = entry.state_dirty = True
+
+    async def _load_record(self, key: StorageKey, entry: _Pending) -> None:
+        state, data = await self.inner.get_record(key)
+        entry.stored_state, entry.stored_data = state, dict(data)
+        if not entry.state_loaded:
+            entry.state = state
+            entry.state_loaded = True
+        if not entry.data_loaded:
+            entry.data = data
+            entry.data_loaded = True
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = self._entry(key)
+        if entry is None:
+            return await self.inner.get_state(key)
+        if not entry.state_loaded:
+            if isinstance(self.inner, SqlStorage):
+                await self._load_record(key, entry)
+            else:
+                entry.state = entry.stored_state = await self.inner.get_state(key)
+                entry.state_loaded = True
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = self._entry(key)
+        if entry is None:
+            await self.inner.set_data(key, data)
+            return
+        entry.data = dict(data)
+        entry.data_loaded = entry.data_dirty = True
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = self._entry(key)
+        if entry is None:
+            return await self.inner.get_data(key)
+        if not entry.data_loaded:
+            if isinstance(self.inner, SqlStorage):
+                await self._load_record(key, entry)
+            else:
+                entry.data = dict(await self.inner.get_data(key))
+                entry.stored_data = dict(entry.data)
+                entry.data_loaded = True
+        return entry.data.copy()
+
+    async def flush(self, pending: dict[StorageKey, _Pending]) -> int:
+        writes = 0
+        for key, entry in pending.items():
+            # Напр. state.clear() при вже порожньому стані нічого не пише.
+            state_dirty = entry.state_dirty and entry.state != entry.stored_state
+            data_dirty = entry.data_dirty and entry.data != entry.stored_data
+            if not (state_dirty or data_dirty):
+                continue
+            if isinstance(self.inner, SqlStorage):
+                values: dict[str, Any] = {}
+                if state_dirty:
+                    values["state"] = entry.state
+                if data_dirty:
+                    values["data"] = entry.data
+                await self.inner.set_record(key, **values)
+                writes += 1
+                continue
+            if data_dirty:
+                await self.inner.set_data(key, entry.data)
+                writes += 1
+            if state_dirty:
+                await self.inner.set_state(key, entry.state)
+                writes += 1
+        return writes
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+class FsmFlushMiddleware(FSMContextMiddleware):
+    """FSM-middleware Dispatcher-а (замість вбудованого) з буфером CoalescingStorage.
+
+    Буфер відкривається до першого get_state, тож стан апдейта читається один раз.
+    Змінені ключі пишуться в кінці апдейта ще під локом events_isolation: наступний
+    апдейт того ж чату чекає і читає вже записаний стан.
+    """
+
+    def __init__(
+        self,
+        storage: CoalescingStorage,
+        events_isolation: Optional[BaseEventIsolation] = None,
+        strategy: FSMStrategy = FSMStrategy.USER_IN_CHAT,
+    ):
+        super().__init__(
+            storage=storage,
+            events_isolation=events_isolation or SimpleEventIsolation(),
+            strategy=strategy,
+        )
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        context = self.resolve_event_context(data["bot"], data)
+        data["fsm_storage"] = self.storage
+        if context is None:
+            return await handler(event, data)
+        async with self.events_isolation.lock(key=context.key):
+            pending: dict[StorageKey, _Pending] = {}
+            token = _pending.set(pending)
+            try:
+                data.update({"state": context, "raw_state": await context.get_state()})
+                return await handler(event, data)
+            finally:
+                _pending.reset(token)
+                try:
+                    await self.storage.flush(pending)
+                except Exception:
+                    logger.exception("Failed to flush FSM state")
+
+
+def build_storage(
+    kind: str,
+    *,
+    sessionmaker: Optional[async_sessionmaker[AsyncSession]] = None,
+    redis_url: str = "",
+    ttl_seconds: Optional[int] = None,
+) -> BaseStorage:
+    """FSM_STORAGE: memory | db | redis."""
+    kind = (kind or "memory").strip().lower()
+    if kind == "db":
+        if sessionmaker is None:
+            raise RuntimeError("FSM_STORAGE=db requires a sessionmaker")
+        return SqlStorage(sessionmaker, ttl_seconds=ttl_seconds)
+    if kind == "redis":
+        if not redis_url:
+            raise RuntimeError("FSM_STORAGE=redis requires REDIS_URL")
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as exc:  # pragma: no cover
+            raise RuntimeError("FSM_STORAGE=redis requires the 'redis' package") from exc
+        return RedisStorage.from_url(
+            redis_url,
+            key_builder=DefaultKeyBuilder(with_destiny=True),
+            state_ttl=ttl_seconds or None,
+            data_ttl=ttl_seconds or None,
+        )
+    return MemoryStorage()
+
+
+async def fsm_expiry_loop(storage: BaseStorage, *, interval_seconds: int = 3600) -> None:
+    """Фоновий цикл: видаляє прострочені записи SqlStorage (Redis робить це сам через TTL)."""
+    inner = storage.inner if isinstance(storage, CoalescingStorage) else storage
+    if not isinstance(inner, SqlStorage):
+        return
+    interval_seconds = max(60, int(interval_seconds))
+
+    while True:
+        try:
+            await asyncio.sleep(interval_seconds)
+            deleted = await inner.purge_expired()
+            if deleted:
+                logger.info("FSM expiry: deleted %s abandoned states", deleted)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("FSM expiry loop error")
+            await asyncio.sleep(60)
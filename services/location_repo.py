@@ -1,19 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import TYPE_CHECKING, Iterable, List, Optional, Union
 
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from models import UaLocation
+from models import AppMeta, UaLocation
+
+if TYPE_CHECKING:
+    from services.location_snapshot import SnapshotLocationTree
+
+logger = logging.getLogger(__name__)
 
 DISTRICT_CATEGORIES = {"P"}
 HROMADA_CATEGORIES = {"H"}
 SETTLEMENT_CATEGORIES = {"C", "M", "T", "X", "B", "K", "С"}
 
+# Ключ у app_meta, який оновлює scripts/import_ua_locations.py після імпорту.
+LOCATIONS_VERSION_KEY = "ua_locations_version"
+# Як часто (с) звіряти версію кешу з app_meta.
+VERSION_CHECK_INTERVAL = 60.0
 
-@dataclass
+
+@dataclass(frozen=True)
 class LocationItem:
     code: str
     name: str
@@ -31,44 +44,270 @@ def _normalize_items(rows: Iterable[tuple[str | None, str | None, str | None]])
             continue
         seen.add(key)
         items.append(LocationItem(code=code, name=name.strip(), category=category or ""))
-    items.sort(key=lambda item: item.name)
+    items.sort(key=lambda item: (item.name, item.code))
     return items
 
 
+def _name_key(name: str | None) -> str:
+    return (name or "").strip().lower()
+
+
+def _name_index(items: Iterable[LocationItem]) -> dict[str, str]:
+    index: dict[str, str] = {}
+    for item in items:
+        index.setdefault(_name_key(item.name), item.code)
+    return index
+
+
+class LocationTree:
+    """Незмінне дерево ua_locations у пам'яті.
+
+    Діти кожного вузла зберігаються вже відсортованими кортежами, тож будь-який
+    list_* — це вибірка зі словника (плюс фільтр категорій для населених пунктів).
+    """
+
+    def __init__(
+        self,
+        version: Optional[str],
+        regions: tuple[LocationItem, ...],
+        districts: dict[str, tuple[LocationItem, ...]],
+        hromadas: dict[tuple[str, str], tuple[LocationItem, ...]],
+        settlements: dict[tuple[str, Optional[str], Optional[str]], tuple[LocationItem, ...]],
+    ):
+        self.version = version
+        self._regions = regions
+        self._districts = districts
+        self._hromadas = hromadas
+        self._settlements = settlements
+        self._region_by_name = _name_index(regions)
+        self._district_by_name = {code: _name_index(items) for code, items in districts.items()}
+        self._hromada_by_name = {key: _name_index(items) for key, items in hromadas.items()}
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: Iterable[tuple[str | None, str | None, str | None, str | None, str | None, str | None]],
+        version: Optional[str] = None,
+    ) -> "LocationTree":
+        """rows: (level1, level2, level3, level4, category, name)."""
+        regions: list[tuple] = []
+        districts: dict[str, list[tuple]] = {}
+        hromadas: dict[tuple[str, str], list[tuple]] = {}
+        settlements: dict[tuple[str, Optional[str], Optional[str]], list[tuple]] = {}
+
+        for l1, l2, l3, l4, category, name in rows:
+            if not l1:
+                continue
+            if category == "O":
+                regions.append((l1, name, category))
+            elif category in DISTRICT_CATEGORIES:
+                districts.setdefault(l1, []).append((l2, name, category))
+            elif category in HROMADA_CATEGORIES:
+                if l2:
+                    hromadas.setdefault((l1, l2), []).append((l3, name, category))
+            elif l4:
+                row = (l4, name, category)
+                # Ті самі комбінації фільтрів, що й у запиті list_settlements.
+                settlements.setdefault((l1, None, None), []).append(row)
+                if l2:
+                    settlements.setdefault((l1, l2, None), []).append(row)
+                if l3:
+                    settlements.setdefault((l1, None, l3), []).append(row)
+                if l2 and l3:
+                    settlements.setdefault((l1, l2, l3), []).append(row)
+
+        return cls(
+            version=version,
+            regions=tuple(_normalize_items(regions)),
+            districts={k: tuple(_normalize_items(v)) for k, v in districts.items()},
+            hromadas={k: tuple(_normalize_items(v)) for k, v in hromadas.items()},
+            settlements={k: tuple(_normalize_items(v)) for k, v in settlements.items()},
+        )
+
+    def regions(self) -> tuple[LocationItem, ...]:
+        return self._regions
+
+    def districts(self, region_code: str) -> tuple[LocationItem, ...]:
+        return self._districts.get(region_code, ())
+
+    def hromadas(self, region_code: str, district_code: str) -> tuple[LocationItem, ...]:
+        return self._hromadas.get((region_code, district_code), ())
+
+    def settlements(
+        self,
+        region_code: str,
+        district_code: Optional[str],
+        hromada_code: Optional[str],
+        categories: set[str] | None = None,
+    ) -> tuple[LocationItem, ...]:
+        items = self._settlements.get((region_code, district_code or None, hromada_code or None), ())
+        cats = categories or SETTLEMENT_CATEGORIES
+        return tuple(item for item in items if item.category in cats)
+
+    def find_region_code(self, name: str | None) -> Optional[str]:
+        return self._region_by_name.get(_name_key(name))
+
+    def find_district_code(self, region_code: str | None, name: str | None) -> Optional[str]:
+        return self._district_by_name.get(region_code or "", {}).get(_name_key(name))
+
+    def find_hromada_code(
+        self, region_code: str | None, district_code: str | None, name: str | None
+    ) -> Optional[str]:
+        return self._hromada_by_name.get((region_code or "", district_code or ""), {}).get(_name_key(name))
+
+
+AnyLocationTree = Union[LocationTree, "SnapshotLocationTree"]
+
+_tree: Optional[AnyLocationTree] = None
+_tree_checked_at = 0.0
+_tree_lock = asyncio.Lock()
+
+
+async def _read_version(session: AsyncSession) -> Optional[str]:
+    try:
+        res = await session.execute(select(AppMeta.value).where(AppMeta.key == LOCATIONS_VERSION_KEY))
+        return res.scalar_one_or_none()
+    except Exception:
+        logger.exception("Failed to read %s", LOCATIONS_VERSION_KEY)
+        return _tree.version if _tree else None
+
+
+def _load_snapshot() -> Optional["SnapshotLocationTree"]:
+    # Імпорт тут: location_snapshot сам імпортує LocationItem/LocationTree звідси.
+    from services.location_snapshot import load_snapshot
+
+    return load_snapshot()
+
+
+async def _load_tree(session: AsyncSession, version: Optional[str]) -> AnyLocationTree:
+    snapshot = _load_snapshot()
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    if snapshot is not None:
+        logger.warning("Location snapshot is stale (%s != %s), loading from table", snapshot.version, version)
+
+    started = time.perf_counter()
+    res = await session.execute(
+        select(
+            UaLocation.level1,
+            UaLocation.level2,
+            UaLocation.level3,
+            UaLocation.level4,
+            UaLocation.category,
+            UaLocation.name,
+        )
+    )
+    tree = LocationTree.from_rows(res.all(), version=version)
+    logger.info(
+        "Location tree loaded: version=%s regions=%s in %.3fs",
+        version,
+        len(tree.regions()),
+        time.perf_counter() - started,
+    )
+    return tree
+
+
+async def get_location_tree(session: AsyncSession) -> AnyLocationTree:
+    """Спільне для бота та адмінки дерево локацій (перезавантажується за зміною версії)."""
+    global _tree, _tree_checked_at
+    if _tree is not None and time.monotonic() - _tree_checked_at < VERSION_CHECK_INTERVAL:
+        return _tree
+
+    async with _tree_lock:
+        if _tree is not None and time.monotonic() - _tree_checked_at < VERSION_CHECK_INTERVAL:
+            return _tree
+        version = await _read_version(session)
+        if _tree is None or _tree.version != version:
+            _tree = await _load_tree(session, version)
+        _tree_checked_at = time.monotonic()
+        return _tree
+
+
+async def preload_location_tree(sessionmaker: async_sessionmaker[AsyncSession]) -> None:
+    """Старт без БД зі знімка; інакше (або якщо знімок застарів) — з таблиці.
+
+    Версію знімка звіряємо з app_meta при першому ж зверненні до дерева.
+    """
+    global _tree, _tree_checked_at
+    if _tree is None:
+        snapshot = _load_snapshot()
+        if snapshot is not None:
+            _tree = snapshot
+            _tree_checked_at = 0.0
+            return
+    try:
+        async with sessionmaker() as session:
+            await get_location_tree(session)
+    except Exception:
+        logger.exception("Failed to preload location tree")
+
+
+def level_items(
+    tree: AnyLocationTree,
+    level: str,
+    region_code: Optional[str] = None,
+    district_code: Optional[str] = None,
+    hromada_code: Optional[str] = None,
+) -> tuple[LocationItem, ...]:
+    """Список для кроку вибору локації (r/d/h/s) прямо з кешованого дерева."""
+    if level == "r":
+        return tree.regions()
+    if not region_code:
+        return ()
+    if level == "d":
+        return tree.districts(region_code)
+    if level == "h":
+        return tree.hromadas(region_code, district_code) if district_code else ()
+    if level == "s":
+        items = tree.settlements(region_code, district_code, hromada_code)
+        if not items and district_code:
+            # Fallback if there are no hromadas for the district.
+            items = tree.settlements(region_code, district_code, None)
+        return items
+    raise ValueError(f"unknown location level: {level}")
+
+
+def find_by_code(items: Iterable[LocationItem], code: Optional[str]) -> Optional[LocationItem]:
+    for item in items:
+        if item.code == code:
+            return item
+    return None
+
+def settlement_parents(
+    tree: AnyLocationTree, region_code: str, settlement_code: Optional[str]
+) -> tuple[Optional[LocationItem], Optional[LocationItem]]:
+    """(район, громада) населеного пункту області — напр. після пошуку по всій області."""
+    for district in tree.districts(region_code):
+        if find_by_code(tree.settlements(region_code, district.code, None), settlement_code) is None:
+            continue
+        for hromada in tree.hromadas(region_code, district.code):
+            if find_by_code(tree.settlements(region_code, district.code, hromada.code), settlement_code):
+                return district, hromada
+        return district, None
+    return None, None
+
+
 class LocationRepository:
-    """Lightweight read-only repo over ua_locations table."""
+    """Lightweight read-only repo over the cached ua_locations tree."""
 
     def __init__(self, session: AsyncSession):
         self.session = session
 
     async def list_regions(self) -> List[LocationItem]:
-        stmt = select(UaLocation.level1, UaLocation.name, UaLocation.category).where(UaLocation.category == "O")
-        res = await self.session.execute(stmt)
-        return _normalize_items(res.all())
+        tree = await get_location_tree(self.session)
+        return list(tree.regions())
 
     async def list_districts(self, region_code: str) -> List[LocationItem]:
         if not region_code:
             return []
-        stmt = (
-            select(UaLocation.level2, UaLocation.name, UaLocation.category)
-            .where(UaLocation.level1 == region_code, UaLocation.category.in_(DISTRICT_CATEGORIES))
-        )
-        res = await self.session.execute(stmt)
-        return _normalize_items(res.all())
+        tree = await get_location_tree(self.session)
+        return list(tree.districts(region_code))
 
     async def list_hromadas(self, region_code: str, district_code: str | None) -> List[LocationItem]:
         if not region_code or not district_code:
             return []
-        stmt = (
-            select(UaLocation.level3, UaLocation.name, UaLocation.category)
-            .where(
-                UaLocation.level1 == region_code,
-                UaLocation.level2 == district_code,
-                UaLocation.category.in_(HROMADA_CATEGORIES),
-            )
-        )
-        res = await self.session.execute(stmt)
-        return _normalize_items(res.all())
+        tree = await get_location_tree(self.session)
+        return list(tree.hromadas(region_code, district_code))
 
     async def list_settlements(
         self,
@@ -79,17 +318,8 @@ class LocationRepository:
     ) -> List[LocationItem]:
         if not region_code:
             return []
-
-        cats = categories or SETTLEMENT_CATEGORIES
-        conditions = [UaLocation.level1 == region_code, UaLocation.category.in_(cats)]
-        if district_code:
-            conditions.append(UaLocation.level2 == district_code)
-        if hromada_code:
-            conditions.append(UaLocation.level3 == hromada_code)
-
-        stmt = select(UaLocation.level4, UaLocation.name, UaLocation.category).where(*conditions)
-        res = await self.session.execute(stmt)
-        return _normalize_items(res.all())
+        tree = await get_location_tree(self.session)
+        return list(tree.settlements(region_code, district_code, hromada_code, categories=categories))
 
     async def list_settlements_by_district(
         self, region_code: str, district_code: str | None, categories: set[str] | None = None
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from itertools import chain
+from typing import Iterable, List, Optional
+
+from services.location_repo import AnyLocationTree, LocationItem
+
+# Укр/рус кирилиця і латиниця зводяться до одного "скелета":
+# Одеса / Одесса / Odesa / Odessa -> "odesa", Харків / Харьков / Kharkiv -> "kharkiv"/"kharkov".
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "h", "д": "d", "е": "e", "є": "e", "ё": "e",
+    "э": "e", "ж": "zh", "з": "z", "и": "i", "і": "i", "ї": "i", "й": "i", "ы": "i", "к": "k",
+    "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ь": "", "ъ": "",
+    "ю": "iu", "я": "ia",
+}  # fmt: skip
+_LATIN = {"g": "h", "y": "i", "j": "i", "w": "v", "x": "ks", "q": "k"}
+_TRANSLATE = str.maketrans({**_CYRILLIC, **_LATIN, "'": "", "’": "", "ʼ": "", "`": ""})
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+_DOUBLES = re.compile(r"(.)\1+")
+
+# Службові слова, які люди дописують до назви ("м. Одеса", "Одеська обл.").
+_NOISE_TOKENS = {"m", "s", "st", "smt", "sel", "misto", "selo", "horod", "obl", "oblast", "raion", "rn", "hromada"}
+
+DEFAULT_LIMIT = 5
+# Скільки кандидатів з найбільшою кількістю спільних триграм перевіряти Левенштейном.
+_FUZZY_CANDIDATES = 24
+_MAX_CACHED_INDEXES = 256
+
+
+def fold(text: str | None) -> str:
+    """Нормалізований ключ для пошуку: нижній регістр, транслітерація, без подвоєнь."""
+    value = (text or "").lower().translate(_TRANSLATE)
+    tokens = [t for t in _SEPARATORS.split(value) if t]
+    return " ".join(_DOUBLES.sub(r"\1", t) for t in tokens)
+
+
+def _query_key(query: str | None) -> str:
+    tokens = fold(query).split()
+    return "".join([t for t in tokens if t not in _NOISE_TOKENS] or tokens)
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _bounded_distance(a: str, b: str, bound: int) -> int:
+    """Відстань Дамерау-Левенштейна (OSA: перестановка сусідніх літер = 1)
+    або bound + 1, якщо вона більша за bound. Рахуємо лише смугу |i - j| <= bound."""
+    n, m = len(a), len(b)
+    if abs(n - m) > bound:
+        return bound + 1
+    over = bound + 1
+    before: list[int] = []
+    previous = list(range(n + 1))
+    for j in range(1, m + 1):
+        cb = b[j - 1]
+        lo = max(1, j - bound)
+        hi = min(n, j + bound)
+        current = [over] * (n + 1)
+        current[0] = j
+        row_min = j if lo == 1 else over
+        for i in range(lo, hi + 1):
+            ca = a[i - 1]
+            cost = previous[i - 1] if ca == cb else previous[i - 1] + 1
+            if previous[i] + 1 < cost:
+                cost = previous[i] + 1
+            if current[i - 1] + 1 < cost:
+                cost = current[i - 1] + 1
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb and before[i - 2] + 1 < cost:
+                cost = before[i - 2] + 1
+            current[i] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > bound:
+            return over
+        before, previous = previous, current
+    return min(previous[n], over)
+
+
+def _max_distance(query: str) -> int:
+    if len(query) <= 4:
+        return 1
+    if len(query) <= 8:
+        return 2
+    return 3
+
+
+class LocationSearchIndex:
+    """Пошук за назвою серед одного списку LocationItem.
+
+    Префікс — бісекція у відсортованому списку ключів (ціла назва і кожне її слово),
+    помилки — кандидати за спільними триграмами + обмежений Левенштейн.
+    """
+
+    def __init__(self, items: Iterable[LocationItem]):
+        self.items: list[LocationItem] = list(items)
+        self.keys: list[str] = [fold(item.name).replace(" ", "") for item in self.items]
+        prefixes: list[tuple[str, int]] = []
+        self._trigram_index: dict[str, list[int]] = {}
+        for idx, item in enumerate(self.items):
+            key = self.keys[idx]
+            if not key:
+                continue
+            prefixes.append((key, idx))
+            words = fold(item.name).split()
+            if len(words) > 1:
+                prefixes.extend((word, idx) for word in words[1:])
+            for tri in _trigrams(key):
+                self._trigram_index.setdefault(tri, []).append(idx)
+        prefixes.sort()
+        self._prefix_keys = [p[0] for p in prefixes]
+        self._prefix_ids = [p[1] for p in prefixes]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _by_prefix(self, query: str, found: dict[int, tuple]) -> None:
+        pos = bisect_left(self._prefix_keys, query)
+        while pos < len(self._prefix_keys) and self._prefix_keys[pos].startswith(query):
+            idx = self._prefix_ids[pos]
+            key = self.keys[idx]
+            tier = 0 if key == query else (1 if key.startswith(query) else 2)
+            rank = (tier, 0, len(key), self.items[idx].name)
+            if idx not in found or rank < found[idx]:
+                found[idx] = rank
+            pos += 1
+
+    def _by_trigrams(self, query: str, found: dict[int, tuple]) -> None:
+        bound = _max_distance(query)
+        query_trigrams = _trigrams(query)
+        hits = Counter(chain.from_iterable(self._trigram_index.get(tri, ()) for tri in query_trigrams))
+        need = max(1, len(query_trigrams) // 3)
+        for idx, shared in hits.most_common(_FUZZY_CANDIDATES):
+            if shared < need:
+                break
+            key = self.keys[idx]
+            # Довгу назву порівнюємо з її початком: людина могла ще не дописати слово.
+            if len(key) > len(query) + bound:
+                key = key[: len(query)]
+            distance = _bounded_distance(query, key, bound)
+            if distance <= bound:
+                found[idx] = (3, distance, len(key), self.items[idx].name)
+
+    def search(self, query: str | None, limit: int = DEFAULT_LIMIT) -> List[LocationItem]:
+        """Top-k за назвою: точний збіг, префікс назви, префікс слова, далі нечіткі збіги."""
+        key = _query_key(query)
+        if not key:
+            return []
+        found: dict[int, tuple] = {}
+        self._by_prefix(key, found)
+        # Нечіткий пошук лише коли префікс нічого не дав (ймовірна помилка в назві).
+        if not found and len(key) >= 3:
+            self._by_trigrams(key, found)
+        best = sorted(found.items(), key=lambda pair: pair[1])[:limit]
+        return [self.items[idx] for idx, _ in best]
+
+    def exact(self, query: str | None) -> Optional[LocationItem]:
+        """Єдиний збіг після нормалізації (Одесса == Одеса == Odesa) або None."""
+        key = _query_key(query)
+        matches = [item for item, item_key in zip(self.items, self.keys) if item_key == key]
+        return matches[0] if len(matches) == 1 else None
+
+
+_indexes: OrderedDict[tuple, LocationSearchIndex] = OrderedDict()
+_indexes_version: Optional[str] = None
+
+
+def search_index(tree: AnyLocationTree, scope: tuple) -> LocationSearchIndex:
+    """Індекс для одного рівня дерева; кешується до зміни версії довідника.
+
+    scope: ("regions",), ("districts", r), ("hromadas", r, d) або ("settlements", r, d, h).
+    """
+    global _indexes_version
+    if _indexes_version != tree.version:
+        _indexes.clear()
+        _indexes_version = tree.version
+    cache_key = (id(tree), *scope)
+    index = _indexes.get(cache_key)
+    if index is not None:
+        _indexes.move_to_end(cache_key)
+        return index
+
+    level, *codes = scope
+    if level == "regions":
+        items = tree.regions()
+    elif level == "districts":
+        items = tree.districts(*codes)
+    elif level == "hromadas":
+        items = tree.hromadas(*codes)
+    elif level == "settlements":
+        items = tree.settlements(*codes)
+    else:
+        raise ValueError(f"unknown location level: {level}")
+
+    index = LocationSearchIndex(items)
+    _indexes[cache_key] = index
+    while len(_indexes) > _MAX_CACHED_INDEXES:
+        _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Optional
+
+from services.location_repo import SETTLEMENT_CATEGORIES, LocationItem, LocationTree, _name_index, _name_key
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SNAPSHOT_PATH = BASE_DIR / "data" / "ua_locations.snap"
+
+MAGIC = b"UALS"
+# 2: без глобального name_order (його ніхто не читав).
+FORMAT_VERSION = 2
+NONE = 0xFFFFFFFF
+
+# magic, format, reserved, version_len, n_strings, strings_bytes, n_nodes, n_groups, n_children
+_HEADER = struct.Struct("<4sHHIIIIII")
+
+# Типи груп (списків дітей) у знімку.
+KIND_REGIONS = 0
+KIND_DISTRICTS = 1
+KIND_HROMADAS = 2
+KIND_SETTLEMENTS = 3
+
+
+def _pad4(n: int) -> int:
+    return (n + 3) & ~3
+
+
+def _u32(values) -> bytes:
+    arr = array("I", values)
+    if arr.itemsize != 4:  # pragma: no cover
+        arr = array("L", values)
+    if sys.byteorder != "little":  # pragma: no cover
+        arr.byteswap()
+    return arr.tobytes()
+
+
+class _Interner:
+    def __init__(self) -> None:
+        self.index: dict[str, int] = {}
+        self.values: list[str] = []
+
+    def __call__(self, value: Optional[str]) -> int:
+        if value is None:
+            return NONE
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.index[value] = idx
+            self.values.append(value)
+        return idx
+
+
+def write_snapshot(tree: LocationTree, path: Path = SNAPSHOT_PATH) -> int:
+    """Записує дерево у компактний бінарний знімок (атомарно). Повертає розмір у байтах.
+
+    Рядки (коди, назви, категорії) інтерновані в одну таблицю, вузли — масиви
+    u32-індексів, діти кожної групи лежать суцільним відсортованим за назвою
+    відрізком масиву children.
+    """
+    intern = _Interner()
+    node_index: dict[LocationItem, int] = {}
+    node_code: list[int] = []
+    node_name: list[int] = []
+    node_cat: list[int] = []
+
+    def node(item: LocationItem) -> int:
+        idx = node_index.get(item)
+        if idx is None:
+            idx = len(node_code)
+            node_index[item] = idx
+            node_code.append(intern(item.code))
+            node_name.append(intern(item.name))
+            node_cat.append(intern(item.category))
+        return idx
+
+    groups: list[tuple[int, Optional[str], Optional[str], Optional[str], tuple[LocationItem, ...]]] = [
+        (KIND_REGIONS, None, None, None, tree._regions)
+    ]
+    groups.extend((KIND_DISTRICTS, r, None, None, items) for r, items in tree._districts.items())
+    groups.extend((KIND_HROMADAS, r, d, None, items) for (r, d), items in tree._hromadas.items())
+    groups.extend((KIND_SETTLEMENTS, r, d, h, items) for (r, d, h), items in tree._settlements.items())
+
+    group_kind: list[int] = []
+    group_a: list[int] = []
+    group_b: list[int] = []
+    group_c: list[int] = []
+    group_offsets: list[int] = [0]
+    children: list[int] = []
+    for kind, a, b, c, items in groups:
+        group_kind.append(kind)
+        group_a.append(intern(a))
+        group_b.append(intern(b))
+        group_c.append(intern(c))
+        children.extend(node(item) for item in items)
+        group_offsets.append(len(children))
+
+    blobs = [s.encode("utf-8") for s in intern.values]
+    str_offsets = [0]
+    for blob in blobs:
+        str_offsets.append(str_offsets[-1] + len(blob))
+    strings = b"".join(blobs)
+    version = (tree.version or "").encode("utf-8")
+
+    sections = [
+        version,
+        _u32(str_offsets),
+        strings,
+        _u32(node_code),
+        _u32(node_name),
+        _u32(node_cat),
+        _u32(group_kind),
+        _u32(group_a),
+        _u32(group_b),
+        _u32(group_c),
+        _u32(group_offsets),
+        _u32(children),
+    ]
+    header = _HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        0,
+        len(version),
+        len(blobs),
+        len(strings),
+        len(node_code),
+        len(group_kind),
+        len(children),
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    size = 0
+    with open(tmp_path, "wb") as f:
+        for chunk in [header, *sections]:
+            f.write(chunk)
+            pad = _pad4(len(chunk)) - len(chunk)
+            if pad:
+                f.write(b"\0" * pad)
+            size += len(chunk) + pad
+    os.replace(tmp_path, path)
+    return size
+
+
+class SnapshotLocationTree:
+    """Дерево локацій поверх mmap-знімка; API як у LocationTree.
+
+    LocationItem-и створюються ліниво при першому зверненні до групи.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        if len(buf) < _HEADER.size:
+            raise ValueError("snapshot is truncated")
+        (
+            magic,
+            fmt,
+            _reserved,
+            version_len,
+            n_strings,
+            strings_bytes,
+            n_nodes,
+            n_groups,
+            n_children,
+        ) = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot format {magic!r} v{fmt}")
+
+        pos = _pad4(_HEADER.size)
+
+        def take(nbytes: int) -> memoryview:
+            nonlocal pos
+            if pos + nbytes > len(buf):
+                raise ValueError("snapshot is truncated")
+            view = buf[pos : pos + nbytes]
+            pos += _pad4(nbytes)
+            return view
+
+        def take_u32(count: int) -> memoryview:
+            view = take(count * 4)
+            if sys.byteorder != "little":  # pragma: no cover
+                arr = array("I", view.tobytes())
+                arr.byteswap()
+                return memoryview(arr)
+            return view.cast("I")
+
+        self.version: Optional[str] = bytes(take(version_len)).decode("utf-8") or None
+        self._str_offsets = take_u32(n_strings + 1)
+        self._strings = take(strings_bytes)
+        self._node_code = take_u32(n_nodes)
+        self._node_name = take_u32(n_nodes)
+        self._node_cat = take_u32(n_nodes)
+        group_kind = take_u32(n_groups)
+        group_a = take_u32(n_groups)
+        group_b = take_u32(n_groups)
+        group_c = take_u32(n_groups)
+        self._group_offsets = take_u32(n_groups + 1)
+        self._children = take_u32(n_children)
+
+        self._str_cache: dict[int, str] = {}
+        self._items: dict[int, LocationItem] = {}
+        self._group_items: dict[int, tuple[LocationItem, ...]] = {}
+        self._group_names: dict[tuple, dict[str, str]] = {}
+        self._groups: dict[tuple, int] = {}
+        for g in range(n_groups):
+            key = (group_kind[g], self._opt_str(group_a[g]), self._opt_str(group_b[g]), self._opt_str(group_c[g]))
+            self._groups[key] = g
+
+    def _str(self, idx: int) -> str:
+        value = self._str_cache.get(idx)
+        if value is None:
+            value = bytes(self._strings[self._str_offsets[idx] : self._str_offsets[idx + 1]]).decode("utf-8")
+            self._str_cache[idx] = value
+        return value
+
+    def _opt_str(self, idx: int) -> Optional[str]:
+        return None if idx == NONE else self._str(idx)
+
+    def item(self, node: int) -> LocationItem:
+        item = self._items.get(node)
+        if item is None:
+            item = LocationItem(
+                code=self._str(self._node_code[node]),
+                name=self._str(self._node_name[node]),
+                category=self._str(self._node_cat[node]),
+            )
+            self._items[node] = item
+        return item
+
+    def __len__(self) -> int:
+        return len(self._node_code)
+
+    def _group(self, key: tuple) -> tuple[LocationItem, ...]:
+        g = self._groups.get(key)
+        if g is None:
+            return ()
+        items = self._group_items.get(g)
+        if items is None:
+            start, end = self._group_offsets[g], self._group_offsets[g + 1]
+            items = tuple(self.item(self._children[i]) for i in range(start, end))
+            self._group_items[g] = items
+        return items
+
+    def regions(self) -> tuple[LocationItem, ...]:
+        return self._group((KIND_REGIONS, None, None, None))
+
+    def districts(self, region_code: str) -> tuple[LocationItem, ...]:
+        return self._group((KIND_DISTRICTS, region_code, None, None))
+
+    def hromadas(self, region_code: str, district_code: str) -> tuple[LocationItem, ...]:
+        return self._group((KIND_HROMADAS, region_code, district_code, None))
+
+    def settlements(
+        self,
+        region_code: str,
+        district_code: Optional[str],
+        hromada_code: Optional[str],
+        categories: set[str] | None = None,
+    ) -> tuple[LocationItem, ...]:
+        items = self._group((KIND_SETTLEMENTS, region_code, district_code or None, hromada_code or None))
+        cats = categories or SETTLEMENT_CATEGORIES
+        return tuple(item for item in items if item.category in cats)
+
+    def _find(self, key: tuple, name: str | None) -> Optional[str]:
+        # Індекс назв групи будується при першому пошуку в ній (як _name_index у LocationTree).
+        index = self._group_names.get(key)
+        if index is None:
+            index = _name_index(self._group(key))
+            self._group_names[key] = index
+        return index.get(_name_key(name))
+
+    def find_region_code(self, name: str | None) -> Optional[str]:
+        return self._find((KIND_REGIONS, None, None, None), name)
+
+    def find_district_code(self, region_code: str | None, name: str | None) -> Optional[str]:
+        return self._find((KIND_DISTRICTS, region_code or "", None, None), name)
+
+    def find_hromada_code(
+        self, region_code: str | None, district_code: str | None, name: str | None
+    ) -> Optional[str]:
+        return self._find((KIND_HROMADAS, region_code or "", district_code or "", None), name)
+
+
+def load_snapshot(path: Path = SNAPSHOT_PATH) -> Optional[SnapshotLocationTree]:
+    """Відкриває знімок; None, якщо файлу немає або він пошкоджений/іншого формату."""
+    if not path.exists():
+        return None
+    started = time.perf_counter()
+    try:
+        tree = SnapshotLocationTree(path)
+    except Exception:
+        logger.exception("Failed to load location snapshot %s", path)
+        return None
+    logger.info(
+        "Location snapshot loaded: version=%s nodes=%s in %.1fms",
+        tree.version,
+        len(tree),
+        (time.perf_counter() - started) * 1000,
+    )
+    return tree
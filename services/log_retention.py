@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from models import ActionLog
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PurgeResult:
+    deleted: int
+    chunks: int
+    elapsed_seconds: float
+
+
+async def purge_action_logs(session: AsyncSession, *, retention_days: int, chunk_size: int) -> PurgeResult:
+    """Видаляє записи action_logs, старші за retention_days, порціями по chunk_size.
+
+    Кожна порція — окрема коротка транзакція, щоб не тримати блокування запису
+    (на SQLite воно одне на всю базу) довше, ніж потрібно.
+    """
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max(0, retention_days))
+    chunk_size = max(1, int(chunk_size))
+
+    deleted = 0
+    chunks = 0
+    while True:
+        ids = (
+            select(ActionLog.id)
+            .where(ActionLog.created_at < cutoff)
+            .order_by(ActionLog.id)
+            .limit(chunk_size)
+            .scalar_subquery()
+        )
+        res = await session.execute(delete(ActionLog).where(ActionLog.id.in_(ids)))
+        await session.commit()
+        removed = int(res.rowcount or 0)
+        deleted += removed
+        chunks += 1
+        if removed < chunk_size:
+            break
+        # Даємо місце запитам бота між порціями.
+        await asyncio.sleep(0)
+
+    return PurgeResult(deleted=deleted, chunks=chunks, elapsed_seconds=time.perf_counter() - started)
+
+
+async def action_log_retention_loop(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    *,
+    interval_seconds: int,
+    retention_days: int,
+    chunk_size: int,
+) -> None:
+    """Фоновий цикл: раз на interval_seconds чистимо застарілі action_logs."""
+    interval_seconds = max(60, int(interval_seconds))
+
+    while True:
+        try:
+            logger.info("Action log purge scheduled in %ss (retention %sd)", interval_seconds, retention_days)
+            await asyncio.sleep(interval_seconds)
+
+            async with sessionmaker() as session:
+                res = await purge_action_logs(session, retention_days=retention_days, chunk_size=chunk_size)
+
+            logger.info(
+                "Action log purge done: deleted=%s chunks=%s took=%.3fs",
+                res.deleted,
+                res.chunks,
+                res.elapsed_seconds,
+            )
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Action log purge loop error")
+            await asyncio.sleep(60)
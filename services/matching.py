@@ -1,41 +1,64 @@
 from __future__ import annotations
 
 import logging
-from typing import Optional
+from typing import Iterable, Optional
 
-from aiogram import Bot
-from sqlalchemy import and_, delete, exists, or_, select
+from sqlalchemy import Select, and_, delete, exists, func, inspect, literal, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload, lazyload
 
-from keyboards.inline_profiles import like_notification_kb, match_contact_kb
-from models import Like, Match, Photo, User
-from utils.text import contact_url, render_profile_caption
+from models import Like, Match, NotificationOutbox, Photo, User
+from services import notification_outbox
 
 logger = logging.getLogger(__name__)
 
 
-async def get_current_user_or_none(session: AsyncSession, tg_id: int) -> Optional[User]:
-    res = await session.execute(
-        select(User).options(selectinload(User.photos)).where(User.tg_id == tg_id)
-    )
-    return res.scalar_one_or_none()
+# session.info[_CURRENT_USERS]: tg_id -> User, уже завантажений у цій сесії (тобто в цьому апдейті).
+_CURRENT_USERS = "current_users"
 
 
-async def _get_user_by_id_with_photos(session: AsyncSession, user_id: int) -> Optional[User]:
-    res = await session.execute(
-        select(User).options(selectinload(User.photos)).where(User.id == user_id)
-    )
-    return res.scalar_one_or_none()
+def _cached_user(session: AsyncSession, tg_id: int) -> Optional[User]:
+    user = session.info.get(_CURRENT_USERS, {}).get(tg_id)
+    if user is None:
+        return None
+    state = inspect(user)
+    # Після rollback атрибути протухли, після delete об'єкт уже не той: читаємо заново.
+    if not state.persistent or state.expired_attributes:
+        forget_current_user(session, tg_id)
+        return None
+    return user
+
+
+def forget_current_user(session: AsyncSession, tg_id: int) -> None:
+    session.info.get(_CURRENT_USERS, {}).pop(tg_id, None)
 
 
-def _main_photo_file_id(user: User) -> Optional[str]:
-    for p in user.photos:
-        if p.is_main:
-            return p.file_id
-    if user.photos:
-        return user.photos[0].file_id
-    return None
+async def get_current_user_or_none(
+    session: AsyncSession, tg_id: int, *, photos: bool = True
+) -> Optional[User]:
+    """Користувач за tg_id; в межах однієї сесії запит до БД робиться один раз.
+
+    photos=False — без фото (їх довантажить наступний виклик з photos=True).
+    """
+    user = _cached_user(session, tg_id)
+    if user is None:
+        # messages/feedbacks хендлерам не потрібні (у моделі вони lazy="selectin" — ще 2 запити),
+        # фото — тим самим SELECT через JOIN.
+        stmt = (
+            select(User)
+            .options(lazyload(User.messages), lazyload(User.feedbacks))
+            .options(joinedload(User.photos) if photos else lazyload(User.photos))
+            .where(User.tg_id == tg_id)
+        )
+        res = await session.execute(stmt)
+        user = res.unique().scalar_one_or_none()
+        if user is None:
+            return None
+        session.info.setdefault(_CURRENT_USERS, {})[tg_id] = user
+    elif photos and "photos" in inspect(user).unloaded:
+        await session.refresh(user, attribute_names=["photos"])
+    return user
 
 
 def _location_filters(current: User) -> list:
@@ -87,25 +110,30 @@ def _location_filters(current: User) -> list:
     return filters
 
 
-async def get_next_candidate(session: AsyncSession, current: User) -> Optional[User]:
+def unseen_conditions(viewer_id: int) -> list:
+    """User ще не отримав реакції від viewer (лайк/скіп) і не в мэтчі з ним."""
     already_seen = exists(
-        select(Like.id).where(and_(Like.from_user_id == current.id, Like.to_user_id == User.id))
+        select(Like.id).where(and_(Like.from_user_id == viewer_id, Like.to_user_id == User.id))
     )
 
     already_matched = exists(
         select(Match.id).where(
             or_(
-                and_(Match.user1_id == current.id, Match.user2_id == User.id),
-                and_(Match.user2_id == current.id, Match.user1_id == User.id),
+                and_(Match.user1_id == viewer_id, Match.user2_id == User.id),
+                and_(Match.user2_id == viewer_id, Match.user1_id == User.id),
             )
         )
     )
+    return [~already_seen, ~already_matched]
 
+
+def _candidate_conditions(current: User) -> list:
+    """Умови відбору анкет для стрічки поточного користувача."""
     conditions = [
         User.active == True,  # noqa: E712
+        User.is_banned == False,  # noqa: E712
         User.id != current.id,
-        ~already_seen,
-        ~already_matched,
+        *unseen_conditions(current.id),
     ]
 
     if current.looking_for in ("M", "F"):
@@ -119,55 +147,38 @@ async def get_next_candidate(session: AsyncSession, current: User) -> Optional[U
         max_age = min(99, int(current.age) + 2)
         conditions.append(User.age.between(min_age, max_age))
 
-    stmt = (
-        select(User)
-        .options(selectinload(User.photos))
+    return conditions
+
+
+def candidate_ids_stmt(current: User, limit: int, exclude_ids: Iterable[int] = ()) -> Select:
+    """Один запит на пачку id наступних кандидатів (у порядку показу)."""
+    conditions = _candidate_conditions(current)
+    exclude = list(exclude_ids)
+    if exclude:
+        conditions.append(User.id.not_in(exclude))
+    return (
+        select(User.id)
         .where(and_(*conditions))
-        .order_by(User.created_at.desc())
+        .order_by(User.created_at.desc(), User.id.desc())
+        .limit(limit)
     )
-    res = await session.execute(stmt)
-    return res.scalars().first()
-
-
-async def _send_like_notification(bot: Bot, from_user: User, to_user: User) -> None:
-    """Уведомление: 'вас лайкнули' (без контактов)."""
-    try:
-        photo_id = _main_photo_file_id(from_user)
-        text = (
-            "❤️ <b>Вам поставили лайк</b>\n\n"
-            f"{render_profile_caption(from_user)}\n\n"
-            "Хочете відповісти взаємно?"
-        )
-        kb = like_notification_kb(from_user.id)
-
-        if photo_id:
-            await bot.send_photo(chat_id=to_user.tg_id, photo=photo_id, caption=text, reply_markup=kb)
-        else:
-            await bot.send_message(chat_id=to_user.tg_id, text=text, reply_markup=kb)
-    except Exception:
-        logger.exception("Failed to send like notification")
-
-
-async def _send_match_cards(bot: Bot, u1: User, u2: User) -> None:
-    """При мэтче: карточка профілю + кнопка 'Написати'."""
-    try:
-        kb_2 = match_contact_kb(contact_url(u2), target_user_id=u2.id)
-        photo_2 = _main_photo_file_id(u2)
-        text_2 = f"🎉 <b>Взаємна симпатія!</b>\n\n{render_profile_caption(u2)}"
-        if photo_2:
-            await bot.send_photo(chat_id=u1.tg_id, photo=photo_2, caption=text_2, reply_markup=kb_2)
-        else:
-            await bot.send_message(chat_id=u1.tg_id, text=text_2, reply_markup=kb_2)
-
-        kb_1 = match_contact_kb(contact_url(u1), target_user_id=u1.id)
-        photo_1 = _main_photo_file_id(u1)
-        text_1 = f"🎉 <b>Взаємна симпатія!</b>\n\n{render_profile_caption(u1)}"
-        if photo_1:
-            await bot.send_photo(chat_id=u2.tg_id, photo=photo_1, caption=text_1, reply_markup=kb_1)
-        else:
-            await bot.send_message(chat_id=u2.tg_id, text=text_1, reply_markup=kb_1)
-    except Exception:
-        logger.exception("Failed to send match notifications")
+
+
+async def get_candidate_ids(
+    session: AsyncSession, current: User, limit: int, exclude_ids: Iterable[int] = ()
+) -> list[int]:
+    res = await session.execute(candidate_ids_stmt(current, limit, exclude_ids))
+    return list(res.scalars().all())
+
+
+def _insert(session: AsyncSession, model):
+    """INSERT з ON CONFLICT для діалекту сесії (бот працює на PostgreSQL або SQLite)."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise RuntimeError(f"Unsupported dialect for reactions: {dialect}")
 
 
 async def put_reaction_and_maybe_match(
@@ -175,64 +186,73 @@ async def put_reaction_and_maybe_match(
     from_user: User,
     to_user_id: int,
     is_like: bool,
-    bot: Bot,
-) -> tuple[bool, Optional[User]]:
-    """Зберігаємо реакцію. При взаємності створюємо Match і повідомляємо обох."""
+) -> bool:
+    """Зберігаємо реакцію; при взаємності створюємо Match. Повертає, чи стався мэтч.
+
+    Одна транзакція: INSERT ... SELECT лайка (ціль існує, повторна реакція —
+    ON CONFLICT DO NOTHING), INSERT мэтча лише за зустрічного лайка і рядки
+    notification_outbox. Самі сповіщення шле фоновий OutboxDispatcher.
+    На PostgreSQL лайки однієї пари серіалізуються pg_advisory_xact_lock.
+    """
     if to_user_id == from_user.id:
-        return False, None
-
-    to_user = await _get_user_by_id_with_photos(session, to_user_id)
-    if not to_user:
-        return False, None
-
-    res2 = await session.execute(
-        select(Like).where(Like.from_user_id == from_user.id, Like.to_user_id == to_user.id)
+        return False
+
+    u1_id, u2_id = (from_user.id, to_user_id) if from_user.id < to_user_id else (to_user_id, from_user.id)
+    if is_like and session.get_bind().dialect.name == "postgresql":
+        # READ COMMITTED: зустрічні лайки в паралельних транзакціях не бачать один одного,
+        # і EXISTS нижче в обох дав би false. Лок на пару до commit робить їх послідовними.
+        await session.execute(select(func.pg_advisory_xact_lock(u1_id, u2_id)))
+
+    like_stmt = (
+        _insert(session, Like)
+        .from_select(
+            ["from_user_id", "to_user_id", "is_like"],
+            select(literal(from_user.id), User.id, literal(is_like)).where(User.id == to_user_id),
+        )
+        .on_conflict_do_nothing(index_elements=["from_user_id", "to_user_id"])
+        .returning(Like.id)
     )
-    if res2.scalar_one_or_none():
-        return False, None
-
-    session.add(Like(from_user_id=from_user.id, to_user_id=to_user.id, is_like=is_like))
-    await session.flush()
-
-    if not is_like:
+    inserted = (await session.execute(like_stmt)).scalar_one_or_none()
+    if inserted is None or not is_like:
+        # Немає такої анкети або реакція вже була; skip нікого не сповіщає.
         await session.commit()
-        return False, None
+        return False
 
-    await session.commit()
-    await _send_like_notification(bot, from_user=from_user, to_user=to_user)
-
-    res3 = await session.execute(
-        select(Like).where(
-            Like.from_user_id == to_user.id,
-            Like.to_user_id == from_user.id,
-            Like.is_like == True,  # noqa: E712
-        )
+    reciprocal = exists().where(
+        Like.from_user_id == to_user_id,
+        Like.to_user_id == from_user.id,
+        Like.is_like == True,  # noqa: E712
+    )
+    match_stmt = (
+        _insert(session, Match)
+        .from_select(["user1_id", "user2_id"], select(literal(u1_id), literal(u2_id)).where(reciprocal))
+        .on_conflict_do_nothing(index_elements=["user1_id", "user2_id"])
+        .returning(Match.id)
+    )
+    matched = (await session.execute(match_stmt)).scalar_one_or_none() is not None
+    await notification_outbox.enqueue(
+        session, notification_outbox.reaction_rows(from_user.id, to_user_id, matched)
     )
-    if not res3.scalar_one_or_none():
-        return False, None
-
-    u1_id, u2_id = (from_user.id, to_user.id) if from_user.id < to_user.id else (to_user.id, from_user.id)
-    res4 = await session.execute(select(Match).where(Match.user1_id == u1_id, Match.user2_id == u2_id))
-    if res4.scalar_one_or_none():
-        return False, to_user
-
-    session.add(Match(user1_id=u1_id, user2_id=u2_id))
     await session.commit()
+    notification_outbox.wakeup()
+    return matched
 
-    u1 = await _get_user_by_id_with_photos(session, from_user.id) or from_user
-    u2 = await _get_user_by_id_with_photos(session, to_user.id) or to_user
-    await _send_match_cards(bot, u1=u1, u2=u2)
-
-    return True, to_user
 
-
-async def delete_user_account(session: AsyncSession, tg_id: int) -> None:
-    user = await get_current_user_or_none(session, tg_id)
+async def delete_user_account(session: AsyncSession, tg_id: int) -> Optional[int]:
+    """Видаляє анкету і повертає її id (або None, якщо анкети не було)."""
+    user = await get_current_user_or_none(session, tg_id, photos=False)
     if not user:
-        return
+        return None
 
     await session.execute(delete(Like).where(or_(Like.from_user_id == user.id, Like.to_user_id == user.id)))
     await session.execute(delete(Match).where(or_(Match.user1_id == user.id, Match.user2_id == user.id)))
+    await session.execute(
+        delete(NotificationOutbox).where(
+            or_(NotificationOutbox.recipient_user_id == user.id, NotificationOutbox.subject_user_id == user.id)
+        )
+    )
     await session.execute(delete(Photo).where(Photo.user_id == user.id))
     await session.execute(delete(User).where(User.id == user.id))
     await session.commit()
+    forget_current_user(session, tg_id)
+    return user.id
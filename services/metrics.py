@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Межі гістограми "скільки SQL-запитів на один апдейт".
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 20)
+
+_lock = threading.Lock()
+_counters: dict[tuple[str, tuple], float] = {}
+_histograms: dict[tuple[str, tuple], "_Histogram"] = {}
+_gauges: dict[tuple[str, tuple], float] = {}
+_help: dict[str, str] = {}
+
+# Лічильник запитів поточного апдейта (None поза UpdateMetricsMiddleware).
+_update_queries: ContextVar[Optional[list[int]]] = ContextVar("update_queries", default=None)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _key(name: str, labels: dict) -> tuple[str, tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def describe(name: str, help_text: str) -> None:
+    _help[name] = help_text
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name: str, value: float, *, buckets: Iterable[float] = QUERY_BUCKETS, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram(buckets)
+        hist.observe(value)
+
+
+def counter_value(name: str, **labels) -> float:
+    return _counters.get(_key(name, labels), 0)
+
+
+def histogram_value(name: str, **labels) -> tuple[int, float]:
+    """(count, sum) гістограми."""
+    hist = _histograms.get(_key(name, labels))
+    return (hist.count, hist.sum) if hist else (0, 0.0)
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+
+
+def _labels(pairs: tuple, extra: tuple = ()) -> str:
+    items = list(pairs) + list(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in items)
+    return "{" + body + "}"
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Усі метрики у текстовому форматі Prometheus (для /metrics)."""
+    lines: list[str] = []
+    seen: set[str] = set()
+
+    def header(name: str, kind: str) -> None:
+        if name in seen:
+            return
+        seen.add(name)
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+        for (name, labels), value in sorted(_gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {_fmt(value)}")
+        for (name, labels), hist in sorted(_histograms.items(), key=lambda pair: pair[0]):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, (('le', _fmt(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, (('le', '+Inf'),))} {hist.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_fmt(hist.sum)}")
+            lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+    return "\n".join(lines) + "\n"
+
+
+def instrument_engine(engine: AsyncEngine, *, name: str = "bot") -> None:
+    """Рахує кожен SQL-запит двигуна: загалом і в межах поточного апдейта."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        inc("db_queries_total", engine=name)
+        current = _update_queries.get()
+        if current is not None:
+            current[0] += 1
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware апдейта: кількість апдейтів і SQL-запитів на кожен з них.
+
+    Має стояти перед FSM-middleware Dispatcher-а, інакше читання стану з fsm_states
+    (FSM_STORAGE=db) не потрапить у лічильник (див. app.bot._new_dispatcher).
+    """
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        if _update_queries.get() is not None:
+            return await handler(event, data)
+        queries = [0]
+        token = _update_queries.set(queries)
+        try:
+            return await handler(event, data)
+        finally:
+            _update_queries.reset(token)
+            inc("bot_updates_total")
+            if not queries[0]:
+                inc("bot_updates_without_db_total")
+            observe("bot_db_queries_per_update", queries[0])
+
+
+describe("db_queries_total", "SQL statements executed")
+describe("bot_updates_total", "Telegram updates processed")
+describe("bot_updates_without_db_total", "Updates handled without a single SQL statement (FSM reads count)")
+describe("bot_db_sessions_opened_total", "Per-update DB sessions actually opened (LazySession)")
+describe("bot_db_queries_per_update", "SQL statements per update, FSM state read and flush included")
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+
+from services import metrics
+from services.photos import decode_photo
+
+logger = logging.getLogger(__name__)
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Вхід моделі NudeDetector — 320px; декодуємо з запасом x2, а не в повному розмірі.
+MODERATION_SIDE = 640
+
+# --- Дочірній процес пулу --------------------------------------------------------
+
+_child_detector = None
+
+
+def _init_child(intra_op_threads: int) -> None:
+    """Ініціалізатор процесу: модель вантажиться один раз, до першого батча."""
+    global _child_detector
+    import onnxruntime
+    import nudenet
+    from nudenet import NudeDetector
+
+    detector = NudeDetector()
+    if intra_op_threads > 0:
+        # NudeDetector не приймає SessionOptions: підміняємо сесію з явною кількістю потоків.
+        opts = onnxruntime.SessionOptions()
+        opts.intra_op_num_threads = intra_op_threads
+        opts.inter_op_num_threads = 1
+        model_path = os.path.join(os.path.dirname(nudenet.__file__), "320n.onnx")
+        detector.onnx_session = onnxruntime.InferenceSession(
+            model_path, sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+    _child_detector = detector
+
+
+def _prepare(image: Any) -> Any:
+    if isinstance(image, bytes):
+        # Байти з пам'яті: одне декодування Pillow (зменшене до MODERATION_SIDE) прямо в масив.
+        return decode_photo(image, MODERATION_SIDE).bgr()
+    return image
+
+
+def _detect_batch(images: list[Any]) -> list[Any]:
+    """Детекції для кожного зображення або ValueError, якщо його не вдалось декодувати."""
+    prepared: list[Any] = []
+    for image in images:
+        try:
+            prepared.append(_prepare(image))
+        except Exception as e:
+            prepared.append(ValueError(f"cannot decode image: {e}"))
+    ok = [image for image in prepared if not isinstance(image, Exception)]
+    detections = iter(_child_detector.detect_batch(ok, batch_size=len(ok)) if ok else [])
+    return [image if isinstance(image, Exception) else next(detections) for image in prepared]
+
+
+# --- Процес бота ----------------------------------------------------------------------
+
+
+class ModerationWorker:
+    """Черга на перевірку фото з мікробатчами.
+
+    detect() кладе зображення (байти, шлях або масив) в обмежену чергу і чекає свого
+    результату. Збирач бере до max_batch зображень, чекаючи добору не довше
+    max_wait_ms, і віддає пачку в пул процесів (workers процесів, у кожному
+    intra_op_threads потоків ONNX) — замість паралельних to_thread, що бились за ядра.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int = 1,
+        intra_op_threads: int = 0,
+        max_batch: int = 8,
+        max_wait_ms: float = 5.0,
+        queue_size: int = 64,
+    ):
+        self.workers = max(1, int(workers))
+        self.intra_op_threads = max(0, int(intra_op_threads))
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.queue_size = max(1, int(queue_size))
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def _ensure_started(self) -> None:
+        if self._collector is not None and not self._collector.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        if self._pool is None:
+            # spawn: onnxruntime і потоки батьківського процесу не переживають fork.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_child,
+                initargs=(self.intra_op_threads,),
+            )
+        self._collector = asyncio.create_task(self._collect(), name="moderation-collector")
+
+    async def detect(self, image: Any) -> list[dict]:
+        """Детекції NudeDetector для одного зображення."""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        # Повна черга => чекаємо місця (backpressure на хендлери завантаження фото).
+        await self._queue.put((image, fut, loop.time()))
+        metrics.set_gauge("nsfw_queue_depth", self._queue.qsize())
+        return await fut
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                    except asyncio.TimeoutError:
+                        break
+                metrics.set_gauge("nsfw_queue_depth", self._queue.qsize())
+                # Не більше workers батчів у пулі: решта чекає в черзі і добирає більший батч.
+                await self._slots.acquire()
+                task = asyncio.create_task(self._run_batch(batch))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Moderation collector failed")
+                await asyncio.sleep(1.0)
+
+    async def _run_batch(self, batch: list[tuple[Any, asyncio.Future, float]]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            live = [item for item in batch if not item[1].done()]
+            if not live:
+                return
+            metrics.observe("nsfw_batch_size", len(live), buckets=BATCH_BUCKETS)
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._pool, _detect_batch, [image for image, _, _ in live])
+            except Exception as e:
+                for _, fut, _ in live:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            metrics.observe("nsfw_inference_seconds", time.perf_counter() - started, buckets=LATENCY_BUCKETS)
+            now = loop.time()
+            for (_, fut, enqueued_at), detections in zip(live, results):
+                metrics.observe("nsfw_latency_seconds", now - enqueued_at, buckets=LATENCY_BUCKETS)
+                if fut.done():
+                    continue
+                if isinstance(detections, Exception):
+                    fut.set_exception(detections)
+                else:
+                    fut.set_result(detections)
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+            self._collector = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, fut, _ = self._queue.get_nowait()
+                if not fut.done():
+                    fut.cancel()
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+
+_worker = ModerationWorker()
+
+
+def configure(
+    *, workers: int, intra_op_threads: int, max_batch: int, max_wait_ms: float, queue_size: int
+) -> None:
+    """Викликати до першої перевірки (start_bot / main.py)."""
+    global _worker
+    _worker = ModerationWorker(
+        workers=workers,
+        intra_op_threads=intra_op_threads,
+        max_batch=max_batch,
+        max_wait_ms=max_wait_ms,
+        queue_size=queue_size,
+    )
+
+
+async def detect(image: Any) -> list[dict]:
+    return await _worker.detect(image)
+
+
+async def shutdown() -> None:
+    await _worker.close()
+
+
+metrics.describe("nsfw_queue_depth", "Photos waiting for NSFW moderation")
+metrics.describe("nsfw_batch_size", "Photos per NSFW inference batch")
+metrics.describe("nsfw_inference_seconds", "NSFW inference time per batch (process pool)")
+metrics.describe("nsfw_latency_seconds", "Time from enqueue to NSFW result per photo")
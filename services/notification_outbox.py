@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import delete, exists, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import joinedload, lazyload
+
+from keyboards.inline_profiles import like_notification_kb, match_contact_kb
+from models import NotificationOutbox, User
+from services import metrics, send_scheduler
+from utils.text import contact_url, render_profile_caption
+
+logger = logging.getLogger(__name__)
+
+KIND_LIKE = "like"
+KIND_MATCH = "match"
+
+# Затримка від запису в outbox до доставки, секунди.
+DELAY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 3600)
+
+_outbox = NotificationOutbox.__table__
+_earlier = _outbox.alias("earlier")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def reaction_rows(from_user_id: int, to_user_id: int, matched: bool) -> list[dict]:
+    """Сповіщення на лайк: 'вас лайкнули' цілі, а при мэтчі — картки обом."""
+    rows = [{"kind": KIND_LIKE, "recipient_user_id": to_user_id, "subject_user_id": from_user_id}]
+    if matched:
+        rows.append({"kind": KIND_MATCH, "recipient_user_id": from_user_id, "subject_user_id": to_user_id})
+        rows.append({"kind": KIND_MATCH, "recipient_user_id": to_user_id, "subject_user_id": from_user_id})
+    return rows
+
+
+async def enqueue(session: AsyncSession, rows: list[dict]) -> None:
+    """Один INSERT у транзакції виклику; commit робить той, хто викликав."""
+    if not rows:
+        return
+    await session.execute(
+        insert(_outbox).values([{"status": "pending", "attempts": 0, **row} for row in rows])
+    )
+
+
+def _claim_stmt(now: datetime, lease_until: datetime, limit: int):
+    """UPDATE ... RETURNING: бере в оренду перші готові рядки, по одному на отримувача.
+
+    Рядок доступний, лише коли перед ним немає незакритих рядків того ж отримувача,
+    тож сповіщення одному чату йдуть строго по черзі (і з урахуванням ретраїв).
+    """
+    earlier_pending = exists().where(
+        _earlier.c.recipient_user_id == _outbox.c.recipient_user_id,
+        _earlier.c.status == "pending",
+        _earlier.c.id < _outbox.c.id,
+    )
+    ready = (
+        select(_outbox.c.id)
+        .where(
+            _outbox.c.status == "pending",
+            _outbox.c.next_attempt_at <= now,
+            or_(_outbox.c.locked_until.is_(None), _outbox.c.locked_until < now),
+            ~earlier_pending,
+        )
+        .order_by(_outbox.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(_outbox)
+        .where(_outbox.c.id.in_(ready))
+        .values(locked_until=lease_until)
+        .returning(
+            _outbox.c.id,
+            _outbox.c.kind,
+            _outbox.c.recipient_user_id,
+            _outbox.c.subject_user_id,
+            _outbox.c.attempts,
+            _outbox.c.created_at,
+        )
+    )
+
+
+def _main_photo_file_id(user: User) -> Optional[str]:
+    for p in user.photos:
+        if p.is_main:
+            return p.file_id
+    if user.photos:
+        return user.photos[0].file_id
+    return None
+
+
+async def _send_like(bot: Bot, chat_id: int, from_user: User) -> None:
+    """Уведомление: 'вас лайкнули' (без контактов)."""
+    text = (
+        "❤️ <b>Вам поставили лайк</b>\n\n"
+        f"{render_profile_caption(from_user)}\n\n"
+        "Хочете відповісти взаємно?"
+    )
+    kb = like_notification_kb(from_user.id)
+    photo_id = _main_photo_file_id(from_user)
+    if photo_id:
+        await bot.send_photo(chat_id=chat_id, photo=photo_id, caption=text, reply_markup=kb)
+    else:
+        await bot.send_message(chat_id=chat_id, text=text, reply_markup=kb)
+
+
+async def _send_match_card(bot: Bot, chat_id: int, other: User) -> None:
+    """При мэтче: карточка профілю + кнопка 'Написати'."""
+    text = f"🎉 <b>Взаємна симпатія!</b>\n\n{render_profile_caption(other)}"
+    kb = match_contact_kb(contact_url(other), target_user_id=other.id)
+    photo_id = _main_photo_file_id(other)
+    if photo_id:
+        await bot.send_photo(chat_id=chat_id, photo=photo_id, caption=text, reply_markup=kb)
+    else:
+        await bot.send_message(chat_id=chat_id, text=text, reply_markup=kb)
+
+
+_SENDERS = {KIND_LIKE: _send_like, KIND_MATCH: _send_match_card}
+_PRIORITIES = {KIND_LIKE: send_scheduler.PRIORITY_LIKE, KIND_MATCH: send_scheduler.PRIORITY_MATCH}
+
+
+@dataclass
+class _Outcome:
+    row_id: int
+    done: bool = False
+    retry_at: Optional[datetime] = None
+    count_attempt: bool = True
+    error: Optional[str] = None
+
+
+class OutboxDispatcher:
+    """Фонова доставка notification_outbox.
+
+    run() забирає пачку рядків (_claim_stmt), шле їх паралельно (не більше
+    concurrency одночасно), успішні видаляє, решту відкладає з експоненційною
+    затримкою. TelegramRetryAfter (429) відкладає рядок і ставить на паузу всю
+    доставку; заблокований бот / некоректний запит — одразу status=failed.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        bot: Bot,
+        *,
+        concurrency: int = 8,
+        batch_size: int = 50,
+        poll_seconds: float = 2.0,
+        max_attempts: int = 8,
+        lease_seconds: float = 120.0,
+    ):
+        self.sessionmaker = sessionmaker
+        self.bot = bot
+        self.concurrency = max(1, int(concurrency))
+        self.batch_size = max(1, int(batch_size))
+        self.poll_seconds = max(0.1, float(poll_seconds))
+        self.max_attempts = max(1, int(max_attempts))
+        self.lease_seconds = max(1.0, float(lease_seconds))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+
+    def wakeup(self) -> None:
+        self._wakeup.set()
+
+    def _backoff(self, attempts: int) -> timedelta:
+        base = min(3600.0, 5.0 * 2 ** max(0, attempts - 1))
+        return timedelta(seconds=base * random.uniform(0.8, 1.2))
+
+    async def process_batch(self) -> int:
+        now = _utcnow()
+        async with self.sessionmaker() as session:
+            res = await session.execute(
+                _claim_stmt(now, now + timedelta(seconds=self.lease_seconds), self.batch_size)
+            )
+            rows = res.all()
+            await session.commit()
+            if not rows:
+                return 0
+            user_ids = {r.recipient_user_id for r in rows} | {r.subject_user_id for r in rows}
+            users_res = await session.execute(
+                select(User)
+                .options(lazyload(User.messages), lazyload(User.feedbacks), joinedload(User.photos))
+                .where(User.id.in_(user_ids))
+            )
+            users = {u.id: u for u in users_res.unique().scalars().all()}
+
+        outcomes = await asyncio.gather(*(self._deliver(row, users) for row in rows))
+        await self._apply(outcomes, {r.id: r.attempts for r in rows})
+        return len(rows)
+
+    async def _deliver(self, row, users: dict[int, User]) -> _Outcome:
+        recipient = users.get(row.recipient_user_id)
+        subject = users.get(row.subject_user_id)
+        sender = _SENDERS.get(row.kind)
+        if recipient is None or subject is None or sender is None:
+            # Анкету вже видалили (або невідомий тип): надсилати нічого.
+            metrics.inc("outbox_dropped_total", kind=row.kind)
+            return _Outcome(row.id, done=True)
+
+        async with self._semaphore:
+            try:
+                await send_scheduler.acquire(recipient.tg_id, _PRIORITIES[row.kind])
+                await sender(self.bot, recipient.tg_id, subject)
+            except TelegramRetryAfter as e:
+                send_scheduler.pause(e.retry_after)
+                self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + e.retry_after)
+                metrics.inc("outbox_retry_after_total")
+                return _Outcome(
+                    row.id,
+                    retry_at=_utcnow() + timedelta(seconds=e.retry_after),
+                    count_attempt=False,
+                    error=str(e),
+                )
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                logger.warning("Outbox %s to user %s rejected: %s", row.kind, recipient.id, e)
+                return _Outcome(row.id, error=str(e))
+            except Exception as e:
+                logger.warning("Outbox %s to user %s failed: %r", row.kind, recipient.id, e)
+                attempts = row.attempts + 1
+                if attempts >= self.max_attempts:
+                    return _Outcome(row.id, error=repr(e))
+                return _Outcome(row.id, retry_at=_utcnow() + self._backoff(attempts), error=repr(e))
+
+        metrics.inc("outbox_sent_total", kind=row.kind)
+        created_at = row.created_at
+        if created_at is not None:
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            metrics.observe(
+                "outbox_delivery_delay_seconds",
+                max(0.0, (_utcnow() - created_at).total_seconds()),
+                buckets=DELAY_BUCKETS,
+            )
+        return _Outcome(row.id, done=True)
+
+    async def _apply(self, outcomes: list[_Outcome], attempts: dict[int, int]) -> None:
+        done_ids = [o.row_id for o in outcomes if o.done]
+        async with self.sessionmaker() as session:
+            if done_ids:
+                await session.execute(delete(_outbox).where(_outbox.c.id.in_(done_ids)))
+            for o in outcomes:
+                if o.done:
+                    continue
+                new_attempts = attempts[o.row_id] + (1 if o.count_attempt else 0)
+                values = {"attempts": new_attempts, "locked_until": None, "last_error": (o.error or "")[:1000]}
+                if o.retry_at is None:
+                    values["status"] = "failed"
+                    metrics.inc("outbox_failed_total")
+                else:
+                    values["next_attempt_at"] = o.retry_at
+                    metrics.inc("outbox_retries_total")
+                await session.execute(update(_outbox).where(_outbox.c.id == o.row_id).values(**values))
+            await session.commit()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                pause = self._paused_until - loop.time()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                self._wakeup.clear()
+                if await self.process_batch():
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                await asyncio.sleep(min(60.0, self.poll_seconds * 5))
+
+
+# Диспетчер живе в процесі бота; matching.wakeup() будить його одразу після commit реакції.
+_dispatcher: Optional[OutboxDispatcher] = None
+
+
+def set_dispatcher(dispatcher: Optional[OutboxDispatcher]) -> None:
+    global _dispatcher
+    _dispatcher = dispatcher
+
+
+def wakeup() -> None:
+    if _dispatcher is not None:
+        _dispatcher.wakeup()
+
+
+metrics.describe("outbox_sent_total", "Like/match notifications delivered from the outbox")
+metrics.describe("outbox_retries_total", "Outbox deliveries rescheduled after an error or 429")
+metrics.describe("outbox_retry_after_total", "Telegram 429 responses seen by the outbox dispatcher")
+metrics.describe("outbox_failed_total", "Outbox notifications given up on (blocked bot, bad request, attempts exhausted)")
+metrics.describe("outbox_dropped_total", "Outbox notifications dropped because a profile was deleted")
+metrics.describe("outbox_delivery_delay_seconds", "Time from the reaction commit to notification delivery")
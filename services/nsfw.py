@@ -1,13 +1,13 @@
 from __future__ import annotations
 
-import asyncio
+import io
 import logging
-import tempfile
-from pathlib import Path
 from typing import Optional
 
 from aiogram import Bot
-from nudenet import NudeDetector
+
+from services import moderation
+from services.photos import PhotoSource
 
 logger = logging.getLogger(__name__)
 
@@ -34,41 +34,13 @@ CLASS_THRESHOLDS = {
 
 UNSAFE_CLASSES = set(CLASS_THRESHOLDS.keys())
 
-# Lazy-loaded singleton detector with a lock to avoid concurrent initialization.
-_detector: Optional[NudeDetector] = None
-_detector_lock = asyncio.Lock()
-
-
-async def _load_detector() -> NudeDetector:
-    global _detector
-    if _detector:
-        return _detector
-
-    async with _detector_lock:
-        if _detector:
-            return _detector
-
-        def _load() -> NudeDetector:
-            # Downloads weights on first call if not cached locally.
-            return NudeDetector()
-
-        _detector = await asyncio.to_thread(_load)
-        logger.info("NSFW detector loaded (NudeDetector)")
-        return _detector
-
-
-async def _classify(image_path: str) -> dict:
-    detector = await _load_detector()
-
-    def _run() -> dict:
-        # Returns list of detections; wrap as dict for uniform handling.
-        return {"detections": detector.detect(image_path)}
-
-    return await asyncio.to_thread(_run)
+async def _classify(image: PhotoSource) -> dict:
+    # Інференс — у services.moderation (мікробатчі в окремому пулі процесів).
+    return {"detections": await moderation.detect(image)}
 
 
 async def is_photo_nsfw(
-    image_path: str,
+    image: PhotoSource,
     threshold: float | None = None,
     class_thresholds: Optional[dict[str, float]] = None,
 ) -> bool:
@@ -80,7 +52,7 @@ async def is_photo_nsfw(
     thresholds = {**CLASS_THRESHOLDS, **(class_thresholds or {})}
     allowed_classes = set(thresholds.keys()) or UNSAFE_CLASSES
 
-    result = await _classify(image_path)
+    result = await _classify(image)
     detections = result.get("detections") or []
     for item in detections:
         cls = item.get("class")
@@ -94,15 +66,9 @@ async def is_photo_nsfw(
 
 
 
-async def download_photo_to_tmp(bot: Bot, file_id: str) -> str:
-    """Download Telegram file to a temporary JPEG path and return it."""
+async def download_photo(bot: Bot, file_id: str) -> bytes:
+    """Download Telegram file into memory; the bytes go straight to is_photo_nsfw."""
     tg_file = await bot.get_file(file_id)
-    fd, path = tempfile.mkstemp(suffix=".jpg")
-    tmp_path = Path(path)
-    try:
-        with open(fd, "wb") as f:
-            await bot.download_file(tg_file.file_path, f)
-    except Exception:
-        tmp_path.unlink(missing_ok=True)
-        raise
-    return str(tmp_path)
+    buffer = io.BytesIO()
+    await bot.download_file(tg_file.file_path, buffer)
+    return buffer.getvalue()
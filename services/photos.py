@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass
+from typing import Any, Union
+
+# Фото з Telegram: байти з пам'яті або шлях до файлу (кеш адмінки).
+PhotoSource = Union[bytes, str]
+
+
+def open_photo(source: PhotoSource, max_side: int) -> Any:
+    """Одне декодування фото через Pillow: не менше max_side по кожній стороні, з EXIF-поворотом.
+
+    Спільне для модерації (services.moderation) і прев'ю адмінки (app.thumbnails).
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError as e:  # pragma: no cover
+        raise RuntimeError("Pillow is required for photo decoding (pip install pillow)") from e
+
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    # JPEG декодується одразу у зменшеному масштабі (DCT scaling) — в рази швидше.
+    img.draft("RGB", (max_side, max_side))
+    transposed = ImageOps.exif_transpose(img)
+    if transposed is not img:
+        img.close()
+    return transposed
+
+
+@dataclass(frozen=True)
+class DecodedPhoto:
+    image: Any  # PIL.Image.Image
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.image.size
+
+    def bgr(self) -> Any:
+        """numpy-масив HxWx3 у порядку BGR — те саме, що cv2.imread дав би NudeDetector."""
+        import numpy as np
+
+        rgb = self.image if self.image.mode == "RGB" else self.image.convert("RGB")
+        return np.ascontiguousarray(np.asarray(rgb)[:, :, ::-1])
+
+
+def decode_photo(source: PhotoSource, max_side: int) -> DecodedPhoto:
+    img = open_photo(source, max_side)
+    img.load()
+    return DecodedPhoto(image=img)
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Класи пріоритету: менше число — раніше в черзі.
+PRIORITY_MATCH = 0
+PRIORITY_LIKE = 1
+PRIORITY_ADMIN = 2
+PRIORITY_NAMES = {PRIORITY_MATCH: "match", PRIORITY_LIKE: "like", PRIORITY_ADMIN: "admin"}
+
+# Очікування дозволу на відправку, секунди.
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+# Скільки чатів пам'ятати, перш ніж прибрати ті, що вже вільні.
+_CHAT_PRUNE_AT = 10_000
+
+
+class SendScheduler:
+    """Єдиний регулятор швидкості для повідомлень, які бот шле сам.
+
+    Глобальне відро токенів (rate повідомлень/с, до burst підряд) плюс не частіше
+    одного повідомлення на чат за chat_interval секунд. Черга очікувачів
+    впорядкована за пріоритетом (match > like > admin), у межах класу — FIFO;
+    зайнятий чат не блокує інших. pause() зупиняє всі відправки після 429.
+    """
+
+    def __init__(self, *, rate: float = 30.0, burst: Optional[float] = None, chat_interval: float = 1.0):
+        self._tokens: Optional[float] = None
+        self.reconfigure(rate=rate, burst=burst, chat_interval=chat_interval)
+        self._updated: Optional[float] = None
+        self._chat_next: dict[int, float] = {}
+        self._waiters: list[tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def reconfigure(self, *, rate: float, burst: Optional[float] = None, chat_interval: float = 1.0) -> None:
+        self.rate = max(0.1, float(rate))
+        self.burst = max(1.0, float(burst if burst is not None else rate))
+        self.chat_interval = max(0.0, float(chat_interval))
+        self._tokens = self.burst if self._tokens is None else min(self._tokens, self.burst)
+
+    def _ensure_pump(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._pump(), name="send-scheduler")
+
+    async def acquire(self, chat_id: int, priority: int = PRIORITY_ADMIN) -> None:
+        """Чекає своєї черги; після повернення можна одразу слати в chat_id."""
+        loop = asyncio.get_running_loop()
+        self._ensure_pump()
+        fut = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), int(chat_id), fut))
+        self._wakeup.set()
+        started = loop.time()
+        try:
+            await fut
+        finally:
+            if not fut.done():
+                fut.cancel()
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        metrics.inc("telegram_send_granted_total", priority=name)
+        metrics.observe("telegram_send_wait_seconds", loop.time() - started, buckets=WAIT_BUCKETS, priority=name)
+
+    def pause(self, seconds: float) -> None:
+        """Telegram відповів 429 retry_after: ніхто не шле, доки не мине пауза."""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + max(0.0, float(seconds)))
+        metrics.inc("telegram_send_paused_total")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return sum(1 for *_, fut in self._waiters if not fut.done())
+
+    def _refill(self, now: float) -> None:
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _grant(self, now: float) -> Optional[float]:
+        """Видає дозволи, скільки можна; повертає, через скільки секунд спробувати знову."""
+        self._refill(now)
+        if now < self._paused_until:
+            # Після паузи стартуємо з порожнього відра, без залпу.
+            self._tokens = 0.0
+            self._updated = self._paused_until
+            return self._paused_until - now
+
+        deferred: list[tuple[int, int, int, asyncio.Future]] = []
+        next_check: Optional[float] = None
+        while self._waiters:
+            item = heapq.heappop(self._waiters)
+            priority, _, chat_id, fut = item
+            if fut.done():
+                continue
+            chat_free_at = self._chat_next.get(chat_id, 0.0)
+            if chat_free_at > now:
+                deferred.append(item)
+                wait = chat_free_at - now
+                next_check = wait if next_check is None else min(next_check, wait)
+                continue
+            if self._tokens < 1.0:
+                deferred.append(item)
+                wait = (1.0 - self._tokens) / self.rate
+                next_check = wait if next_check is None else min(next_check, wait)
+                break
+            self._tokens -= 1.0
+            self._chat_next[chat_id] = now + self.chat_interval
+            fut.set_result(None)
+
+        for item in deferred:
+            heapq.heappush(self._waiters, item)
+        if len(self._chat_next) > _CHAT_PRUNE_AT:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        return next_check
+
+    def _report_depth(self) -> None:
+        depth = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for priority, _, _, fut in self._waiters:
+            if not fut.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+        for name, value in depth.items():
+            metrics.set_gauge("telegram_send_queue_depth", value, priority=name)
+
+    async def _pump(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self._wakeup.clear()
+                delay = self._grant(loop.time())
+                self._report_depth()
+                if delay is None:
+                    await self._wakeup.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Send scheduler pump failed")
+                await asyncio.sleep(1.0)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for *_, fut in self._waiters:
+            if not fut.done():
+                fut.cancel()
+        self._waiters.clear()
+
+
+# Один регулятор на процес: бот і адмінка (run.py) ділять один ліміт Telegram.
+_scheduler = SendScheduler()
+
+
+def configure(*, rate: float, chat_interval: float) -> None:
+    """Ліміти з конфігу; черга і токени зберігаються (викликають і бот, і адмінка)."""
+    _scheduler.reconfigure(rate=rate, chat_interval=chat_interval)
+
+
+def get_scheduler() -> SendScheduler:
+    return _scheduler
+
+
+async def acquire(chat_id: int, priority: int = PRIORITY_ADMIN) -> None:
+    await _scheduler.acquire(chat_id, priority)
+
+
+def pause(seconds: float) -> None:
+    _scheduler.pause(seconds)
+
+
+async def shutdown() -> None:
+    await _scheduler.close()
+
+
+metrics.describe("telegram_send_granted_total", "Bot-originated messages released by the send scheduler")
+metrics.describe("telegram_send_wait_seconds", "Time a message waited for the send scheduler")
+metrics.describe("telegram_send_queue_depth", "Messages waiting in the send scheduler")
+metrics.describe("telegram_send_paused_total", "Send scheduler pauses after Telegram 429")
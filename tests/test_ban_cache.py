@@ -0,0 +1,42 @@
+"""Бан-лист бота, коли адмінка працює в іншому процесі (без спільного BanBus)."""
+
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import update
+
+from db import create_engine, create_sessionmaker
+from models import Base, User
+from services.ban_cache import BanCache, bump_version
+
+
+def test_refresh_picks_up_ban_from_another_process(tmp_path):
+    async def scenario() -> None:
+        engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessionmaker = create_sessionmaker(engine)
+        try:
+            async with sessionmaker() as session:
+                session.add(User(tg_id=555, name="Test", age=20, gender="M", looking_for="F", city="Kyiv"))
+                await session.commit()
+
+            cache = BanCache()
+            await cache.load(sessionmaker)
+            assert not cache.is_banned(555)
+            assert not await cache.refresh(sessionmaker)
+
+            # Те, що робить адмінка: бан і нова bans_version в одній транзакції.
+            async with sessionmaker() as session:
+                await session.execute(update(User).where(User.tg_id == 555).values(is_banned=True))
+                await bump_version(session)
+                await session.commit()
+
+            assert await cache.refresh(sessionmaker)
+            assert cache.is_banned(555)
+            assert not await cache.refresh(sessionmaker)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,198 @@
+"""Скільки SQL-запитів коштує один апдейт, прогнаний через Dispatcher бота."""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+
+from aiogram import Bot, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, Chat, Message, Update, User as TgUser
+from sqlalchemy import event
+
+from app.bot import _build_dispatcher, _new_dispatcher
+from db import create_engine, create_sessionmaker
+from keyboards.main_menu import BTN_PROFILE
+from models import Base, User
+from services import ban_cache, metrics
+from services.activity import ActivityTracker
+from services.fsm_storage import CoalescingStorage, SqlStorage
+
+TG_ID = 777
+
+
+class _NoNetworkSession(BaseSession):
+    """Відповідає True на будь-який метод Bot API, нічого не відправляючи."""
+
+    async def make_request(self, bot, method, timeout=None):  # noqa: ANN001
+        return True
+
+    async def stream_content(self, *args, **kwargs):  # noqa: ANN002, ANN003
+        yield b""
+
+    async def close(self) -> None:
+        return None
+
+
+def _message(message_id: int, text: str = "hi") -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=TG_ID, type="private"),
+        from_user=TgUser(id=TG_ID, is_bot=False, first_name="Test"),
+        text=text,
+    )
+
+
+def _update(update_id: int, text: str = "hi") -> Update:
+    return Update(update_id=update_id, message=_message(update_id, text))
+
+
+def _callback(update_id: int, data: str) -> Update:
+    return Update(
+        update_id=update_id,
+        callback_query=CallbackQuery(
+            id=str(update_id),
+            from_user=TgUser(id=TG_ID, is_bot=False, first_name="Test"),
+            chat_instance="test",
+            message=_message(update_id),
+            data=data,
+        ),
+    )
+
+
+async def _harness(tmp_path, router: Optional[Router] = None):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessionmaker = create_sessionmaker(engine)
+    statements: list[str] = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        statements.append(statement)
+
+    storage = CoalescingStorage(SqlStorage(sessionmaker))
+    if router is None:
+        metrics.instrument_engine(engine)
+        dp = _build_dispatcher(sessionmaker, storage, ActivityTracker(sessionmaker))
+    else:
+        dp = _new_dispatcher(sessionmaker, storage, ActivityTracker(sessionmaker))
+        dp.include_router(router)
+    return engine, dp, statements
+
+
+def test_banned_user_update_runs_no_sql(tmp_path):
+    router = Router()
+    handled: list[int] = []
+
+    @router.message()
+    async def _any(message: Message) -> None:
+        handled.append(message.message_id)
+
+    async def scenario() -> None:
+        engine, dp, statements = await _harness(tmp_path, router)
+        bot = Bot("42:TEST")
+        await ban_cache.get_cache().apply(TG_ID, True)
+        try:
+            await dp.feed_update(bot, _update(1))
+            assert statements == []
+            assert handled == []
+
+            await ban_cache.get_cache().apply(TG_ID, False)
+            await dp.feed_update(bot, _update(2))
+            assert handled == [2]
+            assert any("fsm_states" in s for s in statements)
+        finally:
+            await ban_cache.get_cache().apply(TG_ID, False)
+            await bot.session.close()
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_fsm_update_reads_and_writes_once(tmp_path):
+    router = Router()
+
+    @router.message()
+    async def _step(message: Message, state: FSMContext) -> None:
+        data = await state.get_data()
+        await state.update_data(steps=data.get("steps", 0) + 1)
+        await state.set_state("form:next")
+        await state.get_state()
+        await state.get_data()
+
+    async def scenario() -> None:
+        engine, dp, statements = await _harness(tmp_path, router)
+        bot = Bot("42:TEST")
+        try:
+            await dp.feed_update(bot, _update(1))
+            reads = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+            writes = [s for s in statements if s.lstrip().upper().startswith("INSERT")]
+            assert len(reads) == 1 and "fsm_states" in reads[0]
+            assert len(writes) == 1 and "fsm_states" in writes[0]
+            assert len(statements) == 2
+
+            # Два апдейти одного чату підряд: другий бачить запис першого.
+            await asyncio.gather(dp.feed_update(bot, _update(2)), dp.feed_update(bot, _update(3)))
+            key = dp.fsm.get_context(bot, chat_id=TG_ID, user_id=TG_ID).key
+            assert (await dp.storage.get_data(key))["steps"] == 3
+        finally:
+            await bot.session.close()
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_update_metrics_count_the_fsm_read(tmp_path):
+    # Роутери бота: noop і complaint:cancel не відкривають сесію, але FSM_STORAGE=db
+    # однаково читає стан, і bot_db_queries_per_update має це показати.
+    async def scenario() -> None:
+        engine, dp, statements = await _harness(tmp_path)
+        bot = Bot("42:TEST", session=_NoNetworkSession())
+        try:
+            for update_id, data in enumerate(("noop:page", "complaint:cancel"), start=1):
+                metrics.reset()
+                statements.clear()
+                await dp.feed_update(bot, _callback(update_id, data))
+                assert len(statements) == 1 and "fsm_states" in statements[0]
+                assert metrics.histogram_value("bot_db_queries_per_update") == (1, 1.0)
+                assert metrics.counter_value("bot_updates_without_db_total") == 0
+                assert metrics.counter_value("bot_db_sessions_opened_total") == 0
+
+            # Перегляд анкети: читання FSM + SELECT користувача; /metrics віддає те саме.
+            async with create_sessionmaker(engine)() as session:
+                session.add(User(tg_id=TG_ID, name="Test", age=20, gender="M", looking_for="F", city="Kyiv"))
+                await session.commit()
+            metrics.reset()
+            statements.clear()
+            await dp.feed_update(bot, _update(10, BTN_PROFILE))
+            assert len(statements) == 2
+            assert "bot_db_queries_per_update_sum 2" in metrics.render().splitlines()
+        finally:
+            metrics.reset()
+            await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_clearing_empty_fsm_state_writes_nothing(tmp_path):
+    router = Router()
+
+    @router.message()
+    async def _menu(message: Message, state: FSMContext) -> None:
+        await state.clear()
+
+    async def scenario() -> None:
+        engine, dp, statements = await _harness(tmp_path, router)
+        bot = Bot("42:TEST")
+        try:
+            await dp.feed_update(bot, _update(1))
+            assert len(statements) == 1 and statements[0].lstrip().upper().startswith("SELECT")
+        finally:
+            await bot.session.close()
+            await engine.dispose()
+
+    asyncio.run(scenario())